@@ -0,0 +1,85 @@
+"""Estado actual denormalizado en cita_medica
+
+Agrega cita_medica.estado_actual y cita_medica.estado_actualizado_en, mantenidos
+por un trigger sobre la tabla estado (historial append-only). Después de aplicar
+la migración hay que poblar las citas existentes con:
+
+    python -m scripts.backfill_estado_actual
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("cita_medica", sa.Column("estado_actual", sa.Text(), nullable=True))
+    op.add_column(
+        "cita_medica",
+        sa.Column("estado_actualizado_en", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    # Cada INSERT en estado actualiza la cita, salvo que ya exista un estado más
+    # nuevo (inserciones concurrentes). Un DELETE recalcula desde el historial.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.sincronizar_estado_actual_cita()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE public.cita_medica
+                   SET estado_actual = NEW.estado,
+                       estado_actualizado_en = now()
+                 WHERE id = NEW.cita_medica_id
+                   AND NOT EXISTS (
+                       SELECT 1 FROM public.estado e
+                        WHERE e.cita_medica_id = NEW.cita_medica_id
+                          AND e.id > NEW.id
+                   );
+                RETURN NEW;
+            END IF;
+
+            UPDATE public.cita_medica c
+               SET estado_actual = (
+                       SELECT e.estado FROM public.estado e
+                        WHERE e.cita_medica_id = OLD.cita_medica_id
+                        ORDER BY e.id DESC
+                        LIMIT 1
+                   ),
+                   estado_actualizado_en = now()
+             WHERE c.id = OLD.cita_medica_id;
+            RETURN OLD;
+        END;
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER trg_estado_sincronizar_cita
+        AFTER INSERT OR DELETE ON public.estado
+        FOR EACH ROW EXECUTE FUNCTION public.sincronizar_estado_actual_cita()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_estado_sincronizar_cita ON public.estado")
+    op.execute("DROP FUNCTION IF EXISTS public.sincronizar_estado_actual_cita()")
+    op.drop_column("cita_medica", "estado_actualizado_en")
+    op.drop_column("cita_medica", "estado_actual")
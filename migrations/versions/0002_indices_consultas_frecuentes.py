@@ -0,0 +1,76 @@
+"""Índices compuestos para las consultas frecuentes de los routers
+
+Cubre los filtros más usados por la API:
+
+    cita_medica(doctor_id, fecha_atencion)       agenda del doctor por rango de fechas
+    estado(cita_medica_id, id DESC)              último estado de cada cita
+    horarios_personal(usuario_sistema_id,
+                      inicio_bloque,
+                      finalizacion_bloque)       bloques del doctor en un rango
+    asistencia(usuario_sistema_id, inicio_turno) turnos del usuario por fecha
+    pagos(fecha_pago)                            reportes de ingresos por período
+    pagos(cita_medica_id)                        pago de una cita
+
+paciente(rut) ya está cubierto por el índice de la restricción UNIQUE
+(paciente_rut_key), por lo que no se crea uno nuevo.
+
+Los índices se crean con CONCURRENTLY para no bloquear escrituras en
+producción; por eso cada uno corre fuera de la transacción de Alembic.
+
+Verificación: python -m scripts.verificar_indices
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDICES = [
+    ("ix_cita_medica_doctor_fecha", "cita_medica", ["doctor_id", "fecha_atencion"]),
+    ("ix_estado_cita_id_desc", "estado", ["cita_medica_id", sa.text("id DESC")]),
+    (
+        "ix_horarios_personal_usuario_bloque",
+        "horarios_personal",
+        ["usuario_sistema_id", "inicio_bloque", "finalizacion_bloque"],
+    ),
+    ("ix_asistencia_usuario_inicio", "asistencia", ["usuario_sistema_id", "inicio_turno"]),
+    ("ix_pagos_fecha_pago", "pagos", ["fecha_pago"]),
+    ("ix_pagos_cita_medica_id", "pagos", ["cita_medica_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for nombre, tabla, columnas in INDICES:
+            op.create_index(
+                nombre,
+                tabla,
+                columnas,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for nombre, tabla, _ in reversed(INDICES):
+            op.drop_index(
+                nombre,
+                table_name=tabla,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -0,0 +1,82 @@
+"""Función contar_citas_con_estado para el total paginado de listar_citas
+
+Recibe los mismos filtros que listar_citas_con_estado y retorna solo el total,
+para que el endpoint no tenga que descargar todas las citas filtradas para
+calcular len(). Con p_estimado = true retorna la estimación del planificador
+(EXPLAIN), que no recorre las filas.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # fecha_filtro es un día en hora de Chile; se traduce a un rango sobre
+    # fecha_atencion para aprovechar ix_cita_medica_doctor_fecha.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.contar_citas_con_estado(
+            fecha_filtro date DEFAULT NULL,
+            p_doctor_id bigint DEFAULT NULL,
+            p_paciente_id bigint DEFAULT NULL,
+            estado_filtro text DEFAULT NULL,
+            p_estimado boolean DEFAULT false
+        )
+        RETURNS bigint
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            condicion text := 'TRUE';
+            plan json;
+            total bigint;
+        BEGIN
+            IF fecha_filtro IS NOT NULL THEN
+                condicion := condicion || format(
+                    ' AND c.fecha_atencion >= (%L::timestamp AT TIME ZONE ''America/Santiago'')'
+                    ' AND c.fecha_atencion < (%L::timestamp AT TIME ZONE ''America/Santiago'')',
+                    fecha_filtro, fecha_filtro + 1
+                );
+            END IF;
+            IF p_doctor_id IS NOT NULL THEN
+                condicion := condicion || format(' AND c.doctor_id = %L', p_doctor_id);
+            END IF;
+            IF p_paciente_id IS NOT NULL THEN
+                condicion := condicion || format(' AND c.paciente_id = %L', p_paciente_id);
+            END IF;
+            IF estado_filtro IS NOT NULL THEN
+                condicion := condicion || format(' AND c.estado_actual = %L', estado_filtro);
+            END IF;
+
+            IF p_estimado THEN
+                EXECUTE 'EXPLAIN (FORMAT JSON) SELECT 1 FROM public.cita_medica c WHERE ' || condicion
+                   INTO plan;
+                RETURN (plan -> 0 -> 'Plan' ->> 'Plan Rows')::bigint;
+            END IF;
+
+            EXECUTE 'SELECT count(*) FROM public.cita_medica c WHERE ' || condicion
+               INTO total;
+            RETURN total;
+        END;
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "DROP FUNCTION IF EXISTS public.contar_citas_con_estado(date, bigint, bigint, text, boolean)"
+    )
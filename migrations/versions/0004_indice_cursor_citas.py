@@ -0,0 +1,44 @@
+"""Índice para la paginación por cursor de listar_citas
+
+listar_citas pagina por (fecha_atencion, id) cuando no hay filtro de doctor;
+ix_cita_medica_doctor_fecha no sirve para ese orden, así que se agrega un
+índice que permite saltar directo a la posición del cursor.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_cita_medica_fecha_id",
+            "cita_medica",
+            ["fecha_atencion", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_cita_medica_fecha_id",
+            table_name="cita_medica",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
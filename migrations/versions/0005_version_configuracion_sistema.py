@@ -0,0 +1,66 @@
+"""Contador de versión de configuracion_sistema
+
+Cada escritura en configuracion_sistema incrementa
+configuracion_sistema_version.version (trigger por sentencia). Los workers
+guardan la versión del snapshot que tienen en memoria y solo recargan la
+configuración completa cuando la versión de la base de datos cambió.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE TABLE public.configuracion_sistema_version (
+            id smallint PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            version bigint NOT NULL DEFAULT 1,
+            actualizado_en timestamp with time zone NOT NULL DEFAULT now()
+        )
+        """
+    )
+    op.execute("INSERT INTO public.configuracion_sistema_version (id) VALUES (1)")
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.incrementar_version_configuracion()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            UPDATE public.configuracion_sistema_version
+               SET version = version + 1,
+                   actualizado_en = now()
+             WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER trg_configuracion_sistema_version
+        AFTER INSERT OR UPDATE OR DELETE ON public.configuracion_sistema
+        FOR EACH STATEMENT EXECUTE FUNCTION public.incrementar_version_configuracion()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_configuracion_sistema_version ON public.configuracion_sistema")
+    op.execute("DROP FUNCTION IF EXISTS public.incrementar_version_configuracion()")
+    op.execute("DROP TABLE IF EXISTS public.configuracion_sistema_version")
@@ -0,0 +1,98 @@
+"""Una sola cita activa por bloque de horario
+
+crear_cita pasa a guardar cita_medica.horario_id (el bloque que contiene la
+fecha de atención). Un índice único parcial sobre horario_id, solo para citas
+no canceladas, hace que la base de datos rechace dos reservas simultáneas del
+mismo bloque aunque ambas pasen la validación previa en la API. Al cancelar, el
+trigger de estado deja la cita en 'Cancelada' y el bloque vuelve a quedar libre.
+
+También:
+- la FK cita_medica.horario_id pasa a ON DELETE SET NULL, para que eliminar
+  bloques de horario siga funcionando aunque tengan citas asociadas;
+- se asigna horario_id a las citas activas existentes que no lo tienen (solo
+  la primera cita de cada bloque; las reservas dobles antiguas quedan sin bloque).
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint("cita_medica_horario_id_fkey", "cita_medica", type_="foreignkey")
+    op.create_foreign_key(
+        "cita_medica_horario_id_fkey",
+        "cita_medica",
+        "horarios_personal",
+        ["horario_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+
+    op.execute(
+        """
+        WITH asignadas AS (
+            SELECT DISTINCT ON (h.id) c.id AS cita_id, h.id AS horario_id
+              FROM public.cita_medica c
+              JOIN public.horarios_personal h
+                ON h.usuario_sistema_id = c.doctor_id
+               AND c.fecha_atencion >= h.inicio_bloque
+               AND c.fecha_atencion < h.finalizacion_bloque
+             WHERE c.horario_id IS NULL
+               AND c.estado_actual IS DISTINCT FROM 'Cancelada'
+               AND NOT EXISTS (
+                   SELECT 1 FROM public.cita_medica o
+                    WHERE o.horario_id = h.id
+                      AND o.estado_actual IS DISTINCT FROM 'Cancelada'
+               )
+             ORDER BY h.id, c.id
+        )
+        UPDATE public.cita_medica c
+           SET horario_id = a.horario_id
+          FROM asignadas a
+         WHERE c.id = a.cita_id
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ux_cita_medica_horario_activa",
+            "cita_medica",
+            ["horario_id"],
+            unique=True,
+            postgresql_where="horario_id IS NOT NULL AND estado_actual IS DISTINCT FROM 'Cancelada'",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ux_cita_medica_horario_activa",
+            table_name="cita_medica",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    op.drop_constraint("cita_medica_horario_id_fkey", "cita_medica", type_="foreignkey")
+    op.create_foreign_key(
+        "cita_medica_horario_id_fkey",
+        "cita_medica",
+        "horarios_personal",
+        ["horario_id"],
+        ["id"],
+    )
@@ -0,0 +1,138 @@
+"""Función crear_cita_completa: cita + estado inicial + información en una transacción
+
+Reemplaza la secuencia de crear_cita (lecturas de validación, tres INSERT y
+DELETE manuales si alguno falla) por una sola llamada RPC. Todo corre en la
+transacción de la llamada: si algo falla no quedan citas huérfanas.
+
+Los errores de validación no se lanzan como excepción: la función retorna
+{"error": "<codigo>"} y la API lo traduce a 404/400/409. Así el circuit breaker
+de RPCs solo cuenta fallas reales de la función.
+
+El bloque de horario se bloquea (FOR UPDATE) antes de revisar si ya tiene cita,
+de modo que dos reservas simultáneas del mismo bloque se atienden en orden; el
+índice único de la migración 0006 queda como respaldo.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.crear_cita_completa(
+            p_fecha_atencion timestamptz,
+            p_paciente_id bigint,
+            p_doctor_id bigint,
+            p_especialidad_id bigint,
+            p_estado_inicial text,
+            p_motivo_consulta text DEFAULT NULL,
+            p_antecedentes text DEFAULT NULL,
+            p_dolores_sintomas text DEFAULT NULL,
+            p_atenciones_quirurgicas text DEFAULT NULL,
+            p_evaluacion_doctor text DEFAULT NULL,
+            p_tratamiento text DEFAULT NULL,
+            p_diagnostico_id bigint DEFAULT NULL
+        )
+        RETURNS jsonb
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_rol_id bigint;
+            v_horario public.horarios_personal%ROWTYPE;
+            v_cita public.cita_medica%ROWTYPE;
+            v_estado public.estado%ROWTYPE;
+            v_informacion public.informacion_cita%ROWTYPE;
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM public.paciente WHERE id = p_paciente_id) THEN
+                RETURN jsonb_build_object('error', 'paciente_inexistente');
+            END IF;
+
+            SELECT rol_id INTO v_rol_id FROM public.usuario_sistema WHERE id = p_doctor_id;
+            IF NOT FOUND THEN
+                RETURN jsonb_build_object('error', 'doctor_inexistente');
+            END IF;
+            IF v_rol_id IS DISTINCT FROM 2 THEN
+                RETURN jsonb_build_object('error', 'no_es_doctor');
+            END IF;
+
+            SELECT * INTO v_horario
+              FROM public.horarios_personal
+             WHERE usuario_sistema_id = p_doctor_id
+               AND inicio_bloque <= p_fecha_atencion
+               AND finalizacion_bloque > p_fecha_atencion
+             ORDER BY inicio_bloque
+             LIMIT 1
+             FOR UPDATE;
+            IF NOT FOUND THEN
+                RETURN jsonb_build_object('error', 'sin_horario');
+            END IF;
+
+            IF EXISTS (
+                SELECT 1 FROM public.cita_medica c
+                 WHERE c.doctor_id = p_doctor_id
+                   AND c.estado_actual IS DISTINCT FROM 'Cancelada'
+                   AND (
+                       c.horario_id = v_horario.id
+                       OR (c.fecha_atencion >= v_horario.inicio_bloque
+                           AND c.fecha_atencion < v_horario.finalizacion_bloque)
+                   )
+            ) THEN
+                RETURN jsonb_build_object('error', 'reserva_duplicada');
+            END IF;
+
+            BEGIN
+                INSERT INTO public.cita_medica (fecha_atencion, paciente_id, doctor_id, especialidad_id, horario_id)
+                VALUES (p_fecha_atencion, p_paciente_id, p_doctor_id, p_especialidad_id, v_horario.id)
+                RETURNING * INTO v_cita;
+            EXCEPTION WHEN unique_violation THEN
+                RETURN jsonb_build_object('error', 'reserva_duplicada');
+            END;
+
+            INSERT INTO public.estado (estado, cita_medica_id)
+            VALUES (p_estado_inicial, v_cita.id)
+            RETURNING * INTO v_estado;
+
+            INSERT INTO public.informacion_cita (
+                cita_medica_id, motivo_consulta, antecedentes, dolores_sintomas,
+                atenciones_quirurgicas, evaluacion_doctor, tratamiento, diagnostico_id
+            )
+            VALUES (
+                v_cita.id, p_motivo_consulta, p_antecedentes, p_dolores_sintomas,
+                p_atenciones_quirurgicas, p_evaluacion_doctor, p_tratamiento, p_diagnostico_id
+            )
+            RETURNING * INTO v_informacion;
+
+            RETURN jsonb_build_object(
+                'cita', to_jsonb(v_cita),
+                'estado', to_jsonb(v_estado),
+                'informacion', to_jsonb(v_informacion)
+            );
+        END;
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        """
+        DROP FUNCTION IF EXISTS public.crear_cita_completa(
+            timestamptz, bigint, bigint, bigint, text, text, text, text, text, text, text, bigint
+        )
+        """
+    )
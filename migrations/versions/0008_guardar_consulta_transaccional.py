@@ -0,0 +1,182 @@
+"""Guardar consulta en una transacción, con varios diagnósticos
+
+- Tabla informacion_cita_diagnostico: todos los diagnósticos de una consulta.
+  informacion_cita.diagnostico_id se mantiene con el primero (diagnóstico
+  principal) para las pantallas que ya lo leen.
+- Función guardar_consulta: upsert de informacion_cita, diagnósticos y recetas
+  en una sola llamada RPC (una transacción). Las recetas se comparan con las
+  guardadas y solo se borran/insertan las filas que cambiaron; guardar el mismo
+  borrador dos veces no escribe recetas.
+
+Los errores de validación se retornan como {"error": "<codigo>"} (igual que
+crear_cita_completa) para que el circuit breaker de RPCs solo cuente fallas reales.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "informacion_cita_diagnostico",
+        sa.Column(
+            "informacion_cita_id",
+            sa.BigInteger(),
+            sa.ForeignKey("informacion_cita.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column(
+            "diagnostico_id",
+            sa.BigInteger(),
+            sa.ForeignKey("diagnosticos.id"),
+            primary_key=True,
+        ),
+        schema="public",
+    )
+
+    # Los diagnósticos ya guardados pasan a la tabla nueva
+    op.execute(
+        """
+        INSERT INTO public.informacion_cita_diagnostico (informacion_cita_id, diagnostico_id)
+        SELECT id, diagnostico_id
+          FROM public.informacion_cita
+         WHERE diagnostico_id IS NOT NULL
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.guardar_consulta(
+            p_cita_id bigint,
+            p_informacion jsonb,
+            p_diagnostico_ids bigint[] DEFAULT NULL,
+            p_recetas jsonb DEFAULT '[]'::jsonb
+        )
+        RETURNS jsonb
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_info_id bigint;
+            v_eliminadas integer := 0;
+            v_insertadas integer := 0;
+            v_total integer;
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM public.cita_medica WHERE id = p_cita_id) THEN
+                RETURN jsonb_build_object('error', 'cita_inexistente');
+            END IF;
+
+            IF EXISTS (
+                SELECT 1 FROM unnest(coalesce(p_diagnostico_ids, '{}')) AS d(id)
+                 WHERE NOT EXISTS (SELECT 1 FROM public.diagnosticos x WHERE x.id = d.id)
+            ) THEN
+                RETURN jsonb_build_object('error', 'diagnostico_inexistente');
+            END IF;
+
+            INSERT INTO public.informacion_cita (
+                cita_medica_id, motivo_consulta, antecedentes, dolores_sintomas,
+                atenciones_quirurgicas, evaluacion_doctor, tratamiento, diagnostico_id
+            )
+            VALUES (
+                p_cita_id,
+                p_informacion->>'motivo_consulta',
+                p_informacion->>'antecedentes',
+                p_informacion->>'dolores_sintomas',
+                p_informacion->>'atenciones_quirurgicas',
+                p_informacion->>'evaluacion_doctor',
+                p_informacion->>'tratamiento',
+                p_diagnostico_ids[1]
+            )
+            ON CONFLICT (cita_medica_id) DO UPDATE SET
+                motivo_consulta = EXCLUDED.motivo_consulta,
+                antecedentes = EXCLUDED.antecedentes,
+                dolores_sintomas = EXCLUDED.dolores_sintomas,
+                atenciones_quirurgicas = EXCLUDED.atenciones_quirurgicas,
+                evaluacion_doctor = EXCLUDED.evaluacion_doctor,
+                tratamiento = EXCLUDED.tratamiento,
+                diagnostico_id = EXCLUDED.diagnostico_id
+            RETURNING id INTO v_info_id;
+
+            -- Diagnósticos: quitar los que ya no vienen y agregar los nuevos
+            DELETE FROM public.informacion_cita_diagnostico
+             WHERE informacion_cita_id = v_info_id
+               AND diagnostico_id <> ALL (coalesce(p_diagnostico_ids, '{}'));
+
+            INSERT INTO public.informacion_cita_diagnostico (informacion_cita_id, diagnostico_id)
+            SELECT DISTINCT v_info_id, d.id
+              FROM unnest(coalesce(p_diagnostico_ids, '{}')) AS d(id)
+            ON CONFLICT DO NOTHING;
+
+            -- Recetas: diff por contenido. Las filas idénticas se numeran para
+            -- respetar repeticiones (dos recetas iguales siguen siendo dos).
+            WITH pedidas AS (
+                SELECT r.nombre, r.presentacion, r.dosis, r.duracion, r.cantidad,
+                       row_number() OVER (PARTITION BY r.nombre, r.presentacion, r.dosis, r.duracion, r.cantidad) AS n
+                  FROM jsonb_to_recordset(coalesce(p_recetas, '[]'::jsonb))
+                       AS r(nombre text, presentacion text, dosis text, duracion text, cantidad text)
+            ),
+            actuales AS (
+                SELECT id, nombre, presentacion, dosis, duracion, cantidad,
+                       row_number() OVER (PARTITION BY nombre, presentacion, dosis, duracion, cantidad ORDER BY id) AS n
+                  FROM public.receta
+                 WHERE informacion_cita_id = v_info_id
+            ),
+            eliminadas AS (
+                DELETE FROM public.receta r
+                 USING actuales a
+                 WHERE r.id = a.id
+                   AND NOT EXISTS (
+                       SELECT 1 FROM pedidas p
+                        WHERE (p.nombre, p.presentacion, p.dosis, p.duracion, p.cantidad, p.n)
+                              IS NOT DISTINCT FROM (a.nombre, a.presentacion, a.dosis, a.duracion, a.cantidad, a.n)
+                   )
+                RETURNING r.id
+            ),
+            insertadas AS (
+                INSERT INTO public.receta (nombre, presentacion, dosis, duracion, cantidad, informacion_cita_id)
+                SELECT p.nombre, p.presentacion, p.dosis, p.duracion, p.cantidad, v_info_id
+                  FROM pedidas p
+                 WHERE NOT EXISTS (
+                       SELECT 1 FROM actuales a
+                        WHERE (a.nombre, a.presentacion, a.dosis, a.duracion, a.cantidad, a.n)
+                              IS NOT DISTINCT FROM (p.nombre, p.presentacion, p.dosis, p.duracion, p.cantidad, p.n)
+                   )
+                RETURNING id
+            )
+            SELECT (SELECT count(*) FROM eliminadas), (SELECT count(*) FROM insertadas)
+              INTO v_eliminadas, v_insertadas;
+
+            v_total := jsonb_array_length(coalesce(p_recetas, '[]'::jsonb));
+
+            RETURN jsonb_build_object(
+                'informacion_cita_id', v_info_id,
+                'diagnostico_ids', to_jsonb(coalesce(p_diagnostico_ids, '{}')),
+                'recetas', jsonb_build_object(
+                    'insertadas', v_insertadas,
+                    'eliminadas', v_eliminadas,
+                    'sin_cambios', v_total - v_insertadas
+                )
+            );
+        END;
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP FUNCTION IF EXISTS public.guardar_consulta(bigint, jsonb, bigint[], jsonb)")
+    op.drop_table("informacion_cita_diagnostico", schema="public")
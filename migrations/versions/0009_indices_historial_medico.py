@@ -0,0 +1,54 @@
+"""Índices para el historial médico paginado
+
+El historial de un paciente pagina sus citas completadas por
+(fecha_atencion, id) descendente y embebe las recetas de cada consulta:
+
+    cita_medica(paciente_id, fecha_atencion, id)   página del historial por cursor
+    receta(informacion_cita_id)                    recetas de las consultas de la página
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-16 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, Sequence[str], None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDICES = [
+    ("ix_cita_medica_paciente_fecha_id", "cita_medica", ["paciente_id", "fecha_atencion", "id"]),
+    ("ix_receta_informacion_cita_id", "receta", ["informacion_cita_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for nombre, tabla, columnas in INDICES:
+            op.create_index(
+                nombre,
+                tabla,
+                columnas,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for nombre, tabla, _ in reversed(INDICES):
+            op.drop_index(
+                nombre,
+                table_name=tabla,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
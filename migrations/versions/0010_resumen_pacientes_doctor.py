@@ -0,0 +1,208 @@
+"""Resumen de pacientes atendidos por doctor
+
+Tabla doctor_paciente_resumen: por cada par (doctor, paciente), cantidad de
+consultas completadas y fecha de la última. Se mantiene en forma incremental
+con un trigger sobre cita_medica:
+- una cita que pasa a 'Completada' suma 1 y actualiza la última atención;
+- cualquier otro cambio que afecte a citas completadas (deja de estar
+  completada, cambia de doctor/paciente/fecha o se elimina) recalcula solo
+  los pares afectados.
+
+Función pacientes_atendidos: lista paginada de un doctor con búsqueda por
+nombre o RUT, edad calculada en la base de datos y total de filas.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-16 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010"
+down_revision: Union[str, Sequence[str], None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE TABLE public.doctor_paciente_resumen (
+            doctor_id bigint NOT NULL REFERENCES public.usuario_sistema(id) ON DELETE CASCADE,
+            paciente_id bigint NOT NULL REFERENCES public.paciente(id) ON DELETE CASCADE,
+            consultas_completadas integer NOT NULL,
+            ultima_atencion timestamptz NOT NULL,
+            PRIMARY KEY (doctor_id, paciente_id)
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX ix_doctor_paciente_resumen_ultima
+            ON public.doctor_paciente_resumen (doctor_id, ultima_atencion DESC, paciente_id)
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.recalcular_doctor_paciente(p_doctor_id bigint, p_paciente_id bigint)
+        RETURNS void
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_cantidad integer;
+            v_ultima timestamptz;
+        BEGIN
+            IF p_doctor_id IS NULL OR p_paciente_id IS NULL THEN
+                RETURN;
+            END IF;
+
+            SELECT count(*), max(fecha_atencion) INTO v_cantidad, v_ultima
+              FROM public.cita_medica
+             WHERE doctor_id = p_doctor_id
+               AND paciente_id = p_paciente_id
+               AND estado_actual = 'Completada';
+
+            IF v_cantidad = 0 THEN
+                DELETE FROM public.doctor_paciente_resumen
+                 WHERE doctor_id = p_doctor_id AND paciente_id = p_paciente_id;
+            ELSE
+                INSERT INTO public.doctor_paciente_resumen (doctor_id, paciente_id, consultas_completadas, ultima_atencion)
+                VALUES (p_doctor_id, p_paciente_id, v_cantidad, v_ultima)
+                ON CONFLICT (doctor_id, paciente_id) DO UPDATE SET
+                    consultas_completadas = EXCLUDED.consultas_completadas,
+                    ultima_atencion = EXCLUDED.ultima_atencion;
+            END IF;
+        END;
+        $$
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.sincronizar_doctor_paciente_resumen()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                IF OLD.estado_actual = 'Completada' THEN
+                    PERFORM public.recalcular_doctor_paciente(OLD.doctor_id, OLD.paciente_id);
+                END IF;
+                RETURN OLD;
+            END IF;
+
+            IF TG_OP = 'INSERT' THEN
+                IF NEW.estado_actual = 'Completada' THEN
+                    PERFORM public.recalcular_doctor_paciente(NEW.doctor_id, NEW.paciente_id);
+                END IF;
+                RETURN NEW;
+            END IF;
+
+            -- Caso frecuente: la cita recién pasa a Completada con el mismo doctor y paciente
+            IF NEW.estado_actual = 'Completada'
+               AND OLD.estado_actual IS DISTINCT FROM 'Completada'
+               AND NEW.doctor_id IS NOT NULL
+               AND NEW.paciente_id IS NOT NULL
+               AND (NEW.doctor_id, NEW.paciente_id) IS NOT DISTINCT FROM (OLD.doctor_id, OLD.paciente_id) THEN
+                INSERT INTO public.doctor_paciente_resumen (doctor_id, paciente_id, consultas_completadas, ultima_atencion)
+                VALUES (NEW.doctor_id, NEW.paciente_id, 1, NEW.fecha_atencion)
+                ON CONFLICT (doctor_id, paciente_id) DO UPDATE SET
+                    consultas_completadas = doctor_paciente_resumen.consultas_completadas + 1,
+                    ultima_atencion = greatest(doctor_paciente_resumen.ultima_atencion, EXCLUDED.ultima_atencion);
+                RETURN NEW;
+            END IF;
+
+            IF OLD.estado_actual = 'Completada' THEN
+                PERFORM public.recalcular_doctor_paciente(OLD.doctor_id, OLD.paciente_id);
+            END IF;
+            IF NEW.estado_actual = 'Completada'
+               AND (NEW.doctor_id, NEW.paciente_id) IS DISTINCT FROM (OLD.doctor_id, OLD.paciente_id) THEN
+                PERFORM public.recalcular_doctor_paciente(NEW.doctor_id, NEW.paciente_id);
+            END IF;
+            RETURN NEW;
+        END;
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER trg_cita_doctor_paciente_resumen
+        AFTER INSERT OR DELETE OR UPDATE OF estado_actual, doctor_id, paciente_id, fecha_atencion
+        ON public.cita_medica
+        FOR EACH ROW EXECUTE FUNCTION public.sincronizar_doctor_paciente_resumen()
+        """
+    )
+
+    # Carga inicial desde las citas completadas existentes
+    op.execute(
+        """
+        INSERT INTO public.doctor_paciente_resumen (doctor_id, paciente_id, consultas_completadas, ultima_atencion)
+        SELECT doctor_id, paciente_id, count(*), max(fecha_atencion)
+          FROM public.cita_medica
+         WHERE estado_actual = 'Completada'
+           AND doctor_id IS NOT NULL
+           AND paciente_id IS NOT NULL
+         GROUP BY doctor_id, paciente_id
+        """
+    )
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.pacientes_atendidos(
+            p_doctor_id bigint,
+            p_busqueda text DEFAULT NULL,
+            p_limite integer DEFAULT NULL,
+            p_offset integer DEFAULT 0
+        )
+        RETURNS TABLE (
+            id bigint,
+            nombre text,
+            apellido_paterno text,
+            apellido_materno text,
+            rut text,
+            edad integer,
+            ultima_atencion timestamptz,
+            consultas_completadas integer,
+            total bigint
+        )
+        LANGUAGE sql
+        STABLE
+        AS $$
+            SELECT p.id,
+                   p.nombre,
+                   p.apellido_paterno,
+                   p.apellido_materno,
+                   p.rut,
+                   date_part('year', age(current_date, p.fecha_nacimiento))::integer,
+                   r.ultima_atencion,
+                   r.consultas_completadas,
+                   count(*) OVER ()
+              FROM public.doctor_paciente_resumen r
+              JOIN public.paciente p ON p.id = r.paciente_id
+             WHERE r.doctor_id = p_doctor_id
+               AND (
+                   coalesce(p_busqueda, '') = ''
+                   OR concat_ws(' ', p.nombre, p.apellido_paterno, p.apellido_materno) ILIKE '%' || p_busqueda || '%'
+                   OR p.rut ILIKE '%' || p_busqueda || '%'
+               )
+             ORDER BY r.ultima_atencion DESC, r.paciente_id
+             LIMIT p_limite
+            OFFSET coalesce(p_offset, 0)
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP FUNCTION IF EXISTS public.pacientes_atendidos(bigint, text, integer, integer)")
+    op.execute("DROP TRIGGER IF EXISTS trg_cita_doctor_paciente_resumen ON public.cita_medica")
+    op.execute("DROP FUNCTION IF EXISTS public.sincronizar_doctor_paciente_resumen()")
+    op.execute("DROP FUNCTION IF EXISTS public.recalcular_doctor_paciente(bigint, bigint)")
+    op.execute("DROP TABLE IF EXISTS public.doctor_paciente_resumen")
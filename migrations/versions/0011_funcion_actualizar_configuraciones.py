@@ -0,0 +1,73 @@
+"""Función actualizar_configuraciones: cambio de valor de varias claves en una transacción
+
+Reemplaza el upsert de filas completas de /Configuracion/actualizar-multiple,
+que reescribía columnas leídas antes (pisando ediciones concurrentes) y volvía
+a insertar filas borradas entretanto. La función recibe solo id y valor, y
+únicamente hace UPDATE:
+- bloquea las filas pedidas (FOR UPDATE) y, si alguna ya no existe, retorna
+  {"error": "configuracion_inexistente", "ids": [...]} sin escribir nada;
+- actualiza todas las claves en un solo UPDATE ... FROM (un solo incremento
+  de configuracion_sistema_version).
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011"
+down_revision: Union[str, Sequence[str], None] = "0010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.actualizar_configuraciones(p_cambios jsonb)
+        RETURNS jsonb
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_faltantes bigint[];
+            v_actualizados jsonb;
+        BEGIN
+            PERFORM 1
+               FROM public.configuracion_sistema c
+              WHERE c.id IN (SELECT x.id FROM jsonb_to_recordset(p_cambios) AS x(id bigint))
+              ORDER BY c.id
+                FOR UPDATE;
+
+            SELECT array_agg(x.id ORDER BY x.id) INTO v_faltantes
+              FROM jsonb_to_recordset(p_cambios) AS x(id bigint)
+             WHERE NOT EXISTS (SELECT 1 FROM public.configuracion_sistema c WHERE c.id = x.id);
+            IF v_faltantes IS NOT NULL THEN
+                RETURN jsonb_build_object('error', 'configuracion_inexistente', 'ids', to_jsonb(v_faltantes));
+            END IF;
+
+            WITH actualizadas AS (
+                UPDATE public.configuracion_sistema c
+                   SET valor = x.valor
+                  FROM jsonb_to_recordset(p_cambios) AS x(id bigint, valor text)
+                 WHERE c.id = x.id
+                RETURNING c.*
+            )
+            SELECT coalesce(jsonb_agg(to_jsonb(a) ORDER BY a.id), '[]'::jsonb) INTO v_actualizados
+              FROM actualizadas a;
+
+            RETURN jsonb_build_object('actualizados', v_actualizados);
+        END;
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP FUNCTION IF EXISTS public.actualizar_configuraciones(jsonb)")
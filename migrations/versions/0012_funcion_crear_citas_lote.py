@@ -0,0 +1,131 @@
+"""Función crear_citas_lote: varias citas + estados + información en una transacción
+
+POST /Citas/crear-citas-lote asigna los bloques en la API y luego insertaba
+citas, estados e información con un INSERT por tabla y DELETE manuales si
+alguno fallaba: un error en esos DELETE o un request cancelado entre los
+INSERT dejaba citas sin estado ni información. La función hace las tres
+inserciones en la transacción de la llamada RPC.
+
+p_citas es [{"indice", "fecha_atencion", "horario_id"}]. Los bloques pedidos se
+bloquean (FOR UPDATE, en orden de id) antes de revisar si ya tienen cita, igual
+que crear_cita_completa. Con p_parcial = false, si algún bloque está tomado
+retorna {"error": "reserva_duplicada", "indices": [...]} sin escribir nada; con
+p_parcial = true se omiten esos bloques y se informan en "rechazadas".
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0012"
+down_revision: Union[str, Sequence[str], None] = "0011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.crear_citas_lote(
+            p_paciente_id bigint,
+            p_doctor_id bigint,
+            p_especialidad_id bigint,
+            p_estado_inicial text,
+            p_citas jsonb,
+            p_informacion jsonb DEFAULT '{}'::jsonb,
+            p_parcial boolean DEFAULT false
+        )
+        RETURNS jsonb
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_tomadas integer[];
+            v_citas jsonb;
+        BEGIN
+            PERFORM 1
+               FROM public.horarios_personal h
+              WHERE h.id IN (SELECT x.horario_id FROM jsonb_to_recordset(p_citas) AS x(horario_id bigint))
+              ORDER BY h.id
+                FOR UPDATE;
+
+            -- Bloques que ya tienen una cita activa del doctor (por horario o por hora)
+            SELECT array_agg(x.indice ORDER BY x.indice) INTO v_tomadas
+              FROM jsonb_to_recordset(p_citas) AS x(indice integer, horario_id bigint)
+              JOIN public.horarios_personal h ON h.id = x.horario_id
+             WHERE EXISTS (
+                   SELECT 1 FROM public.cita_medica c
+                    WHERE c.doctor_id = p_doctor_id
+                      AND c.estado_actual IS DISTINCT FROM 'Cancelada'
+                      AND (
+                          c.horario_id = h.id
+                          OR (c.fecha_atencion >= h.inicio_bloque AND c.fecha_atencion < h.finalizacion_bloque)
+                      )
+             );
+
+            IF v_tomadas IS NOT NULL AND NOT p_parcial THEN
+                RETURN jsonb_build_object('error', 'reserva_duplicada', 'indices', to_jsonb(v_tomadas));
+            END IF;
+
+            BEGIN
+                WITH pedidas AS (
+                    SELECT x.indice, x.fecha_atencion, x.horario_id
+                      FROM jsonb_to_recordset(p_citas) AS x(indice integer, fecha_atencion timestamptz, horario_id bigint)
+                     WHERE x.indice <> ALL (coalesce(v_tomadas, '{}'))
+                ),
+                citas AS (
+                    INSERT INTO public.cita_medica (fecha_atencion, paciente_id, doctor_id, especialidad_id, horario_id)
+                    SELECT p.fecha_atencion, p_paciente_id, p_doctor_id, p_especialidad_id, p.horario_id
+                      FROM pedidas p
+                     ORDER BY p.indice
+                    RETURNING *
+                ),
+                estados AS (
+                    INSERT INTO public.estado (estado, cita_medica_id)
+                    SELECT p_estado_inicial, c.id FROM citas c
+                    RETURNING id
+                ),
+                informaciones AS (
+                    INSERT INTO public.informacion_cita (
+                        cita_medica_id, motivo_consulta, antecedentes, dolores_sintomas,
+                        atenciones_quirurgicas, evaluacion_doctor, tratamiento, diagnostico_id
+                    )
+                    SELECT c.id,
+                           p_informacion->>'motivo_consulta',
+                           p_informacion->>'antecedentes',
+                           p_informacion->>'dolores_sintomas',
+                           p_informacion->>'atenciones_quirurgicas',
+                           p_informacion->>'evaluacion_doctor',
+                           p_informacion->>'tratamiento',
+                           (p_informacion->>'diagnostico_id')::bigint
+                      FROM citas c
+                    RETURNING id
+                )
+                SELECT coalesce(jsonb_agg(to_jsonb(c) ORDER BY c.fecha_atencion), '[]'::jsonb) INTO v_citas
+                  FROM citas c;
+            EXCEPTION WHEN unique_violation THEN
+                -- Una reserva que no pasó por el bloqueo tomó un bloque entretanto
+                RETURN jsonb_build_object('error', 'reserva_duplicada');
+            END;
+
+            RETURN jsonb_build_object(
+                'citas', v_citas,
+                'rechazadas', to_jsonb(coalesce(v_tomadas, '{}'))
+            );
+        END;
+        $$
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "DROP FUNCTION IF EXISTS public.crear_citas_lote(bigint, bigint, bigint, text, jsonb, jsonb, boolean)"
+    )
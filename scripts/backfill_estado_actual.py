@@ -0,0 +1,63 @@
+"""
+Pobla cita_medica.estado_actual a partir del historial de la tabla estado.
+
+Uso (desde la raíz del proyecto, con DATABASE_URL configurada):
+
+    python -m scripts.backfill_estado_actual
+    python -m scripts.backfill_estado_actual --lote 2000
+
+Procesa las citas por rangos de id para no bloquear la tabla completa, y solo
+escribe las filas cuyo estado_actual difiere del último estado registrado, por
+lo que se puede volver a ejecutar para reparar desincronizaciones.
+"""
+import argparse
+from sqlalchemy import text
+from src.utils.database import crear_engine
+
+ACTUALIZAR_RANGO = text(
+    """
+    UPDATE cita_medica c
+       SET estado_actual = u.estado,
+           estado_actualizado_en = now()
+      FROM (
+            SELECT DISTINCT ON (cita_medica_id) cita_medica_id, estado
+              FROM estado
+             WHERE cita_medica_id >= :desde AND cita_medica_id < :hasta
+             ORDER BY cita_medica_id, id DESC
+           ) u
+     WHERE c.id = u.cita_medica_id
+       AND c.estado_actual IS DISTINCT FROM u.estado
+    """
+)
+
+
+def backfill(lote: int) -> int:
+    engine = crear_engine()
+    total = 0
+
+    with engine.connect() as conn:
+        rango = conn.execute(text("SELECT min(id), max(id) FROM cita_medica")).one()
+
+    if rango[0] is None:
+        print("No hay citas para procesar.")
+        return 0
+
+    desde, maximo = rango
+    while desde <= maximo:
+        hasta = desde + lote
+        # Una transacción corta por rango
+        with engine.begin() as conn:
+            resultado = conn.execute(ACTUALIZAR_RANGO, {"desde": desde, "hasta": hasta})
+            total += resultado.rowcount or 0
+        print(f"Citas {desde}-{hasta - 1}: {resultado.rowcount} actualizadas")
+        desde = hasta
+
+    print(f"✅ Backfill terminado: {total} citas actualizadas")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de cita_medica.estado_actual")
+    parser.add_argument("--lote", type=int, default=5000, help="Cantidad de ids de cita por transacción")
+    args = parser.parse_args()
+    backfill(args.lote)
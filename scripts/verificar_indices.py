@@ -0,0 +1,217 @@
+"""
+Verifica que las consultas frecuentes de los routers usen índices.
+
+Ejecuta EXPLAIN sobre la forma de cada consulta contra la base indicada en
+DATABASE_URL (normalmente un Postgres local con las migraciones aplicadas) y
+termina con código 1 si alguna recorre una tabla completa (Seq Scan).
+
+    alembic upgrade head
+    python -m scripts.verificar_indices
+
+Se desactiva enable_seqscan para la sesión: en una base local con pocas filas
+el planificador prefiere un Seq Scan aunque exista el índice, pero si aun así
+elige uno es porque no hay índice utilizable para ese filtro.
+"""
+import json
+import sys
+from sqlalchemy import text
+from src.utils.database import crear_engine
+
+# (descripción, router que la usa, SQL equivalente a la consulta de PostgREST)
+CONSULTAS = [
+    (
+        "Agenda del doctor por rango de fechas",
+        "appointment_administration.obtener_citas_doctor",
+        """
+        SELECT id, fecha_atencion, estado_actual FROM cita_medica
+         WHERE doctor_id = 1
+           AND fecha_atencion >= '2026-01-01T00:00:00'
+           AND fecha_atencion <= '2026-01-31T23:59:59'
+         ORDER BY fecha_atencion
+        """,
+    ),
+    (
+        "Página siguiente de citas por cursor",
+        "appointment_administration.listar_citas",
+        """
+        SELECT id, fecha_atencion FROM cita_medica
+         WHERE fecha_atencion >= '2026-01-15T10:00:00'
+           AND (fecha_atencion > '2026-01-15T10:00:00'
+                OR (fecha_atencion = '2026-01-15T10:00:00' AND id > 100))
+         ORDER BY fecha_atencion, id
+         LIMIT 51
+        """,
+    ),
+    (
+        "Página siguiente de pagos por cursor",
+        "appointment_administration.listar_pagos",
+        """
+        SELECT * FROM pagos
+         WHERE fecha_pago <= '2026-01-15T10:00:00'
+           AND (fecha_pago < '2026-01-15T10:00:00'
+                OR (fecha_pago = '2026-01-15T10:00:00' AND id < 100))
+         ORDER BY fecha_pago DESC, id DESC
+         LIMIT 51
+        """,
+    ),
+    (
+        "Página siguiente del historial médico por cursor",
+        "appointment_administration.obtener_historial_medico",
+        """
+        SELECT id, fecha_atencion FROM cita_medica
+         WHERE paciente_id = 1
+           AND estado_actual = 'Completada'
+           AND fecha_atencion <= '2026-01-15T10:00:00'
+           AND (fecha_atencion < '2026-01-15T10:00:00'
+                OR (fecha_atencion = '2026-01-15T10:00:00' AND id < 100))
+         ORDER BY fecha_atencion DESC, id DESC
+         LIMIT 21
+        """,
+    ),
+    (
+        "Recetas de las consultas de una página del historial",
+        "appointment_administration.obtener_historial_medico",
+        """
+        SELECT * FROM receta
+         WHERE informacion_cita_id IN (1, 2, 3)
+        """,
+    ),
+    (
+        "Pacientes atendidos por un doctor",
+        "appointment_administration.obtener_pacientes_atendidos",
+        """
+        SELECT paciente_id, ultima_atencion FROM doctor_paciente_resumen
+         WHERE doctor_id = 1
+         ORDER BY ultima_atencion DESC, paciente_id
+         LIMIT 21
+        """,
+    ),
+    (
+        "Último estado de un lote de citas",
+        "estado_loader.obtener_estados_actuales",
+        """
+        SELECT cita_medica_id, estado, id FROM estado
+         WHERE cita_medica_id IN (1, 2, 3)
+         ORDER BY id DESC
+        """,
+    ),
+    (
+        "Historial de estados de una cita",
+        "appointment_administration.obtener_historial_estados",
+        """
+        SELECT * FROM estado
+         WHERE cita_medica_id = 1
+         ORDER BY id DESC
+         LIMIT 1
+        """,
+    ),
+    (
+        "Bloque de horario que contiene una fecha",
+        "appointment_administration.crear_cita",
+        """
+        SELECT id FROM horarios_personal
+         WHERE usuario_sistema_id = 1
+           AND inicio_bloque <= '2026-01-15T10:00:00'
+           AND finalizacion_bloque >= '2026-01-15T10:00:00'
+        """,
+    ),
+    (
+        "Bloques del doctor en un día",
+        "schedule_administration / attendance_administration",
+        """
+        SELECT * FROM horarios_personal
+         WHERE usuario_sistema_id = 1
+           AND inicio_bloque >= '2026-01-15T00:00:00'
+           AND inicio_bloque <= '2026-01-15T23:59:59'
+        """,
+    ),
+    (
+        "Turnos de asistencia del usuario",
+        "attendance_administration",
+        """
+        SELECT * FROM asistencia
+         WHERE usuario_sistema_id = 1
+           AND inicio_turno >= '2026-01-01T00:00:00'
+           AND inicio_turno <= '2026-01-31T23:59:59'
+        """,
+    ),
+    (
+        "Pagos por período",
+        "dashboard_administration",
+        """
+        SELECT total, fecha_pago FROM pagos
+         WHERE fecha_pago >= '2026-01-01T00:00:00'
+           AND fecha_pago <= '2026-01-31T23:59:59'
+        """,
+    ),
+    (
+        "Pagos de un lote de citas",
+        "appointment_administration.obtener_productividad_mensual",
+        """
+        SELECT cita_medica_id, total FROM pagos
+         WHERE cita_medica_id IN (1, 2, 3)
+        """,
+    ),
+    (
+        "Paciente por RUT",
+        "patient_administration",
+        """
+        SELECT id FROM paciente
+         WHERE rut = '11111111-1'
+        """,
+    ),
+]
+
+
+def _nodos_seq_scan(plan: dict) -> list:
+    """
+    Retorna las tablas recorridas completas dentro de un plan (recursivo).
+    Un Index Scan sin Index Cond (p.ej. la PK recorrida solo para ordenar)
+    lee la tabla entera igual que un Seq Scan, así que también cuenta.
+    """
+    encontrados = []
+    tipo = plan.get("Node Type")
+    if tipo == "Seq Scan":
+        encontrados.append(plan.get("Relation Name"))
+    elif tipo in ("Index Scan", "Index Only Scan") and "Index Cond" not in plan:
+        encontrados.append(f"{plan.get('Relation Name')} (índice completo {plan.get('Index Name')})")
+    for subplan in plan.get("Plans", []):
+        encontrados.extend(_nodos_seq_scan(subplan))
+    return encontrados
+
+
+def verificar() -> bool:
+    engine = crear_engine()
+    errores = 0
+
+    with engine.connect() as conn:
+        for descripcion, origen, sql in CONSULTAS:
+            try:
+                conn.execute(text("SET LOCAL enable_seqscan = off"))
+                fila = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar_one()
+            except Exception as e:
+                conn.rollback()
+                errores += 1
+                print(f"❌ {descripcion} ({origen}): {e.__class__.__name__}: {getattr(e, 'orig', e)}")
+                continue
+            conn.rollback()
+
+            plan = (fila if isinstance(fila, list) else json.loads(fila))[0]["Plan"]
+            tablas = _nodos_seq_scan(plan)
+
+            if tablas:
+                errores += 1
+                print(f"❌ {descripcion} ({origen}): recorrido completo de {', '.join(tablas)}")
+            else:
+                print(f"✅ {descripcion} ({origen})")
+
+    if errores:
+        print(f"\n{errores} consulta(s) sin índice utilizable")
+        return False
+
+    print(f"\nLas {len(CONSULTAS)} consultas usan índices")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if verificar() else 1)
@@ -1,5 +1,13 @@
 from fastapi.middleware.cors import CORSMiddleware
 from src.utils.supabase import supabase_client
+from src.utils.supabase_async import cerrar_supabase_async
+from src.utils.rpc_gateway import rpc_gateway
+from src.utils.cache_catalogos import cache_catalogos
+from src.utils.indice_disponibilidad import indice_disponibilidad
+from src.utils.guardia_citas import guardia_citas
+from src.utils.consultas_en_curso import consultas_en_curso
+from src.utils.eventos_citas import eventos_citas
+from src.utils.configuracion import configuracion_sistema
 from fastapi import FastAPI
 from src.routers.user_administration import user_router
 from src.routers.doctor_administration import doctor_router
@@ -37,6 +45,29 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def cargar_configuracion():
+    try:
+        await configuracion_sistema.recargar()
+    except Exception as e:
+        # La API arranca igual; el snapshot se carga en la primera lectura
+        print(f"⚠️ No se pudo cargar la configuración al iniciar: {str(e)}")
+
+
+@app.on_event("startup")
+async def cargar_consultas_en_curso():
+    try:
+        await consultas_en_curso.recargar()
+    except Exception as e:
+        # Se vuelve a intentar en la primera consulta de cita en curso
+        print(f"⚠️ No se pudieron cargar las consultas en curso al iniciar: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def cerrar_conexiones():
+    await cerrar_supabase_async()
+
+
 @app.get("/")
 def inicio() -> dict:
     return {"message": "Gestion de horarios médicos,",
@@ -52,3 +83,46 @@ async def test_connection():
         return {"status": "success", "message": "Cliente inicializado correctamente"}
     else:
         return {"status": "error", "message": "Cliente no está inicializado"}
+
+
+@app.get("/estado-rpc")
+async def estado_rpc():
+    """Disponibilidad de las funciones RPC (circuit breaker) para monitoreo."""
+    return rpc_gateway.estado()
+
+
+@app.post("/estado-rpc/reiniciar")
+async def reiniciar_estado_rpc(funcion: str = None):
+    """Cierra el circuito de una función (o de todas) tras desplegarla en Supabase."""
+    rpc_gateway.reiniciar(funcion)
+    return {"mensaje": "Circuito reiniciado", "funcion": funcion}
+
+
+@app.get("/estado-cache")
+async def estado_cache():
+    """Uso del cache de catálogos de este worker."""
+    return cache_catalogos.estado()
+
+
+@app.get("/estado-disponibilidad")
+async def estado_disponibilidad():
+    """Tamaño y uso del índice de disponibilidad de este worker."""
+    return indice_disponibilidad.estado()
+
+
+@app.get("/estado-guardia-citas")
+async def estado_guardia_citas():
+    """Índice de citas activas por doctor usado para rechazar reservas dobles."""
+    return guardia_citas.estado()
+
+
+@app.get("/estado-consultas-en-curso")
+async def estado_consultas_en_curso():
+    """Mapa en memoria de citas en consulta por doctor de este worker."""
+    return consultas_en_curso.estado()
+
+
+@app.get("/estado-eventos-citas")
+async def estado_eventos_citas():
+    """Suscripciones SSE y buffer de eventos de citas de este worker."""
+    return eventos_citas.estado()
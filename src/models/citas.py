@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -29,6 +29,21 @@ class CrearCitaCompleta(BaseModel):
     estado_inicial: str = Field(default="Pendiente", description="Estado inicial de la cita")
 
 
+class CrearCitasLote(BaseModel):
+    """Modelo para agendar varias sesiones del mismo paciente con un doctor"""
+    paciente_id: int = Field(..., description="ID del paciente")
+    doctor_id: int = Field(..., description="ID del doctor")
+    especialidad_id: Optional[int] = Field(None, description="ID de la especialidad por la que se agendan las citas")
+    fechas: List[datetime] = Field(..., min_length=1, max_length=100, description="Fecha y hora de cada sesión")
+    informacion: InformacionCita = Field(default_factory=InformacionCita, description="Información común a todas las citas")
+    estado_inicial: str = Field(default="Pendiente", description="Estado inicial de las citas")
+    modo: str = Field(
+        default="todo_o_nada",
+        pattern="^(todo_o_nada|parcial)$",
+        description="todo_o_nada: si una fecha falla no se crea ninguna; parcial: se crean las válidas"
+    )
+
+
 class ActualizarCita(BaseModel):
     """Modelo para actualizar una cita existente"""
     fecha_atencion: Optional[datetime] = Field(None, description="Nueva fecha y hora")
@@ -52,6 +67,17 @@ class CambiarEstado(BaseModel):
     estado: str = Field(..., description="Nuevo estado: Pendiente, Confirmada, En Consulta, Completada, Cancelada")
 
 
+class CambioEstadoLote(BaseModel):
+    """Un cambio de estado dentro de un lote"""
+    cita_id: int = Field(..., description="ID de la cita médica")
+    estado: str = Field(..., description="Nuevo estado: Pendiente, Confirmada, En Consulta, Completada, Cancelada")
+
+
+class CambiarEstadosLote(BaseModel):
+    """Modelo para cambiar el estado de varias citas en una sola operación"""
+    cambios: List[CambioEstadoLote] = Field(..., min_length=1, max_length=500, description="Pares (cita_id, estado)")
+
+
 class CrearPago(BaseModel):
     """Modelo para procesar un pago de cita"""
     cita_medica_id: int = Field(..., description="ID de la cita médica")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class HorarioBloque(BaseModel):
@@ -16,6 +16,18 @@ class CrearHorarioSemanal(BaseModel):
     fecha_inicio: str  # Fecha desde la cual aplicar (YYYY-MM-DD)
     fecha_fin: Optional[str] = None  # Fecha hasta la cual aplicar (opcional)
 
+class TurnoPlantilla(BaseModel):
+    usuario_sistema_id: int
+    dias_semana: List[int]  # 0=Lunes, 1=Martes, ..., 6=Domingo
+    hora_inicio: str  # Formato "HH:MM"
+    hora_fin: str  # Formato "HH:MM"
+    duracion_bloque_minutos: int
+
+class CrearPlantillaHorarios(BaseModel):
+    turnos: List[TurnoPlantilla]  # Un doctor puede tener varios turnos (ej: mañana y tarde)
+    fecha_inicio: str  # Fecha desde la cual aplicar (YYYY-MM-DD)
+    fecha_fin: Optional[str] = None  # Fecha hasta la cual aplicar (opcional, 3 meses por defecto)
+
 class ActualizarHorario(BaseModel):
     inicio_bloque: datetime
     finalizacion_bloque: datetime
@@ -1,12 +1,29 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import os
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
 from src.models.citas import (
     CrearCitaCompleta,
+    CrearCitasLote,
     ActualizarCita,
     ActualizarInformacionCita,
     CambiarEstado,
+    CambiarEstadosLote,
     CrearPago
 )
-from src.utils.supabase import supabase_client
+from postgrest.exceptions import APIError
+from src.utils.supabase_async import supabase_async
+from src.utils.paginacion import aplicar_cursor, cortar_pagina
+from src.utils.rpc_gateway import rpc_gateway
+from src.utils.cache_catalogos import CacheCatalogos, cache_catalogos, obtener_costos_servicio, obtener_costo_especialidad
+from src.utils.indice_disponibilidad import indice_disponibilidad
+from src.utils.guardia_citas import guardia_citas, es_reserva_duplicada
+from src.utils.consultas_en_curso import consultas_en_curso
+from src.utils.eventos_citas import eventos_citas, formato_sse
+from src.utils.disponibilidad import cargar_bloques, cargar_citas_activas
+from src.utils.intervalos import a_datetime
+from src.utils.recetas import diferencia_recetas
+from src.utils.reservas_lote import asignar_bloques, rango_fechas, MOTIVOS_RECHAZO
 from typing import Optional, List
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
@@ -15,6 +32,53 @@ from pydantic import BaseModel
 
 appointment_router = APIRouter(tags=["Gestión de Citas Médicas"], prefix="/Citas")
 
+# Modo de conteo de listar_citas -> parámetro count de PostgREST
+METODOS_CONTEO = {"exacto": "exact", "estimado": "estimated", "ninguno": None}
+
+# Códigos de error de crear_cita_completa -> respuesta HTTP
+ERRORES_CREAR_CITA = {
+    "paciente_inexistente": (404, "El paciente no existe."),
+    "doctor_inexistente": (404, "El doctor no existe."),
+    "no_es_doctor": (400, "El usuario seleccionado no es un doctor."),
+    "sin_horario": (409, "El doctor no tiene horarios asignados para la fecha/hora seleccionada."),
+    "reserva_duplicada": (409, "Ya existe una cita para este doctor en la fecha/hora seleccionada."),
+}
+
+# Códigos de error de la función guardar_consulta -> respuesta HTTP
+ERRORES_GUARDAR_CONSULTA = {
+    "cita_inexistente": (404, "La cita no existe."),
+    "diagnostico_inexistente": (400, "Uno o más diagnósticos no existen."),
+}
+
+# Estados de cita aceptados por los endpoints de cambio de estado
+ESTADOS_VALIDOS = ["Pendiente", "Confirmada", "En Consulta", "Completada", "Cancelada"]
+
+# Transiciones que acepta el cambio de estado en lote (estado actual -> nuevos estados).
+# Las citas sin estado se tratan como Pendiente; Completada es final.
+TRANSICIONES_PERMITIDAS = {
+    "Pendiente": {"Confirmada", "En Consulta", "Cancelada"},
+    "Confirmada": {"Pendiente", "En Consulta", "Completada", "Cancelada"},
+    "En Consulta": {"Completada", "Cancelada"},
+    "Completada": set(),
+    "Cancelada": {"Pendiente"},
+}
+
+
+# Filas por página en los fallbacks que recorren tablas completas (max_rows de PostgREST)
+TAMANO_PAGINA_FALLBACK = 1000
+
+# Tablero del día de recepción: compartido entre los terminales por unos segundos
+ZONA_CHILE = ZoneInfo("America/Santiago")
+TABLERO_TTL_SEGUNDOS = float(os.getenv("TABLERO_HOY_TTL_SEGUNDOS", "5"))
+cache_tablero = CacheCatalogos(ttl=TABLERO_TTL_SEGUNDOS, max_entradas=8)
+
+
+def _cita_modificada(doctor_id: int, fecha_atencion) -> None:
+    """Descarta lo cacheado en este worker sobre la agenda del doctor tras cambiar una cita."""
+    indice_disponibilidad.invalidar(doctor_id, fecha_atencion)
+    guardia_citas.invalidar(doctor_id)
+    cache_tablero.invalidar("tablero_hoy")
+
 
 # Modelos adicionales para recetas y diagnósticos
 class RecetaMedicamento(BaseModel):
@@ -36,140 +100,378 @@ class GuardarConsulta(BaseModel):
     recetas: Optional[List[RecetaMedicamento]] = None
 
 
+async def _crear_cita_por_pasos(cita_completa: CrearCitaCompleta) -> dict:
+    """
+    Fallback de crear_cita cuando la función crear_cita_completa no está disponible:
+    validaciones e inserciones por separado, con rollback manual.
+    """
+    fecha_cita = cita_completa.cita.fecha_atencion
+    doctor_id = cita_completa.cita.doctor_id
+
+    # Paciente, doctor y bloque de horario que contiene la fecha/hora: lecturas independientes, en paralelo
+    paciente, doctor, horarios_doctor = await asyncio.gather(
+        supabase_async
+        .table("paciente")
+        .select("id, nombre, apellido_paterno")
+        .eq("id", cita_completa.cita.paciente_id)
+        .execute(),
+        supabase_async
+        .table("usuario_sistema")
+        .select("id, nombre, apellido_paterno, rol_id")
+        .eq("id", doctor_id)
+        .execute(),
+        supabase_async
+        .table("horarios_personal")
+        .select("id, inicio_bloque, finalizacion_bloque")
+        .eq("usuario_sistema_id", doctor_id)
+        .lte("inicio_bloque", fecha_cita.isoformat())
+        .gt("finalizacion_bloque", fecha_cita.isoformat())
+        .order("inicio_bloque")
+        .limit(1)
+        .execute()
+    )
+
+    if not paciente.data:
+        raise HTTPException(status_code=404, detail="El paciente no existe.")
+
+    if not doctor.data:
+        raise HTTPException(status_code=404, detail="El doctor no existe.")
+
+    if doctor.data[0].get("rol_id") != 2:
+        raise HTTPException(status_code=400, detail="El usuario seleccionado no es un doctor.")
+
+    if not horarios_doctor.data:
+        raise HTTPException(
+            status_code=409,
+            detail="El doctor no tiene horarios asignados para la fecha/hora seleccionada."
+        )
+
+    # Verificar que el bloque no tenga otra cita activa (índice en memoria + una consulta)
+    bloque = horarios_doctor.data[0]
+    if await guardia_citas.conflicto(doctor_id, bloque["inicio_bloque"], bloque["finalizacion_bloque"]):
+        raise HTTPException(
+            status_code=409,
+            detail="Ya existe una cita para este doctor en la fecha/hora seleccionada."
+        )
+
+    # Crear la cita médica. El índice único por horario_id rechaza una reserva simultánea del mismo bloque
+    try:
+        nueva_cita = (
+            await supabase_async
+            .table("cita_medica")
+            .insert({
+                "fecha_atencion": fecha_cita.isoformat(),
+                "paciente_id": cita_completa.cita.paciente_id,
+                "doctor_id": doctor_id,
+                "especialidad_id": cita_completa.cita.especialidad_id,
+                "horario_id": bloque["id"]
+            })
+            .execute()
+        )
+    except Exception as e:
+        if es_reserva_duplicada(e):
+            raise HTTPException(
+                status_code=409,
+                detail="Ya existe una cita para este doctor en la fecha/hora seleccionada."
+            )
+        raise
+
+    if not nueva_cita.data:
+        raise HTTPException(status_code=500, detail="No se pudo crear la cita.")
+
+    cita_id = nueva_cita.data[0]["id"]
+
+    # Crear el estado inicial
+    estado_inicial = (
+        await supabase_async
+        .table("estado")
+        .insert({
+            "estado": cita_completa.estado_inicial,
+            "cita_medica_id": cita_id
+        })
+        .execute()
+    )
+
+    if not estado_inicial.data:
+        # Rollback: eliminar la cita creada
+        await supabase_async.table("cita_medica").delete().eq("id", cita_id).execute()
+        raise HTTPException(status_code=500, detail="No se pudo crear el estado inicial.")
+
+    # Crear la información de la cita
+    info_cita = (
+        await supabase_async
+        .table("informacion_cita")
+        .insert({
+            "cita_medica_id": cita_id,
+            "motivo_consulta": cita_completa.informacion.motivo_consulta,
+            "antecedentes": cita_completa.informacion.antecedentes,
+            "dolores_sintomas": cita_completa.informacion.dolores_sintomas,
+            "atenciones_quirurgicas": cita_completa.informacion.atenciones_quirurgicas,
+            "evaluacion_doctor": cita_completa.informacion.evaluacion_doctor,
+            "tratamiento": cita_completa.informacion.tratamiento,
+            "diagnostico_id": cita_completa.informacion.diagnostico_id
+        })
+        .execute()
+    )
+
+    if not info_cita.data:
+        # Rollback: eliminar cita y estado
+        await supabase_async.table("estado").delete().eq("id", estado_inicial.data[0]["id"]).execute()
+        await supabase_async.table("cita_medica").delete().eq("id", cita_id).execute()
+        raise HTTPException(status_code=500, detail="No se pudo crear la información de la cita.")
+
+    indice_disponibilidad.marcar_ocupado(doctor_id, fecha_cita)
+    guardia_citas.registrar(doctor_id, cita_id, fecha_cita)
+    consultas_en_curso.registrar_estado(cita_id, doctor_id, cita_completa.estado_inicial)
+    cache_tablero.invalidar("tablero_hoy")
+    eventos_citas.publicar("cita_creada", cita_id, doctor_id, fecha_cita, estado=cita_completa.estado_inicial)
+
+    return {
+        "mensaje": "Cita creada exitosamente.",
+        "cita": nueva_cita.data[0],
+        "estado": estado_inicial.data[0],
+        "informacion": info_cita.data[0]
+    }
+
+
 @appointment_router.post("/crear-cita")
 async def crear_cita(cita_completa: CrearCitaCompleta):
     """
     Crea una nueva cita médica con su información y estado inicial.
+    OPTIMIZADO: una sola llamada a la función SQL crear_cita_completa, que valida
+    e inserta cita, estado e información en una transacción (sin rollbacks manuales).
+    Si la función no está disponible se usa el flujo por pasos.
     """
     try:
-        # Verificar que el paciente existe
-        paciente = (
-            supabase_client
-            .table("paciente")
-            .select("id, nombre, apellido_paterno")
-            .eq("id", cita_completa.cita.paciente_id)
-            .execute()
+        cita = cita_completa.cita
+        informacion = cita_completa.informacion
+
+        resultado = await rpc_gateway.llamar("crear_cita_completa", {
+            "p_fecha_atencion": cita.fecha_atencion.isoformat(),
+            "p_paciente_id": cita.paciente_id,
+            "p_doctor_id": cita.doctor_id,
+            "p_especialidad_id": cita.especialidad_id,
+            "p_estado_inicial": cita_completa.estado_inicial,
+            "p_motivo_consulta": informacion.motivo_consulta,
+            "p_antecedentes": informacion.antecedentes,
+            "p_dolores_sintomas": informacion.dolores_sintomas,
+            "p_atenciones_quirurgicas": informacion.atenciones_quirurgicas,
+            "p_evaluacion_doctor": informacion.evaluacion_doctor,
+            "p_tratamiento": informacion.tratamiento,
+            "p_diagnostico_id": informacion.diagnostico_id
+        }, escritura=True)
+
+        if resultado is None:
+            return await _crear_cita_por_pasos(cita_completa)
+
+        datos = resultado.data or {}
+        if datos.get("error"):
+            status_code, detalle = ERRORES_CREAR_CITA.get(
+                datos["error"], (500, f"No se pudo crear la cita: {datos['error']}")
+            )
+            raise HTTPException(status_code=status_code, detail=detalle)
+
+        indice_disponibilidad.marcar_ocupado(cita.doctor_id, cita.fecha_atencion)
+        guardia_citas.registrar(cita.doctor_id, datos["cita"]["id"], cita.fecha_atencion)
+        consultas_en_curso.registrar_estado(datos["cita"]["id"], cita.doctor_id, cita_completa.estado_inicial)
+        cache_tablero.invalidar("tablero_hoy")
+        eventos_citas.publicar(
+            "cita_creada", datos["cita"]["id"], cita.doctor_id, cita.fecha_atencion, estado=cita_completa.estado_inicial
         )
-        if not paciente.data:
-            raise HTTPException(status_code=404, detail="El paciente no existe.")
 
-        # Verificar que el doctor existe y es médico
-        doctor = (
-            supabase_client
-            .table("usuario_sistema")
-            .select("id, nombre, apellido_paterno, rol_id")
-            .eq("id", cita_completa.cita.doctor_id)
-            .execute()
-        )
-        if not doctor.data:
-            raise HTTPException(status_code=404, detail="El doctor no existe.")
+        return {
+            "mensaje": "Cita creada exitosamente.",
+            "cita": datos["cita"],
+            "estado": datos["estado"],
+            "informacion": datos["informacion"]
+        }
 
-        if doctor.data[0].get("rol_id") != 2:
-            raise HTTPException(status_code=400, detail="El usuario seleccionado no es un doctor.")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Verificar que el doctor tenga horarios disponibles en la fecha/hora seleccionada
-        fecha_cita = cita_completa.cita.fecha_atencion
-
-        # Buscar horarios del doctor que contengan esta fecha/hora
-        horarios_doctor = (
-            supabase_client
-            .table("horarios_personal")
-            .select("id, inicio_bloque, finalizacion_bloque")
-            .eq("usuario_sistema_id", cita_completa.cita.doctor_id)
-            .lte("inicio_bloque", fecha_cita.isoformat())
-            .gte("finalizacion_bloque", fecha_cita.isoformat())
-            .execute()
-        )
 
-        if not horarios_doctor.data:
+async def _insertar_citas_lote(registros: List[dict], modo: str) -> List[dict]:
+    """
+    Inserta las citas en un solo INSERT. Si el índice único rechaza el lote (otra
+    reserva tomó un bloque mientras tanto): en modo parcial se reintenta una por
+    una y se omiten los bloques tomados; en todo_o_nada se responde 409.
+    """
+    try:
+        insertadas = await supabase_async.table("cita_medica").insert(registros).execute()
+        return insertadas.data or []
+    except Exception as e:
+        if not es_reserva_duplicada(e):
+            raise
+        if modo == "todo_o_nada":
             raise HTTPException(
                 status_code=409,
-                detail="El doctor no tiene horarios asignados para la fecha/hora seleccionada."
+                detail="Otra reserva tomó uno de los bloques solicitados. No se creó ninguna cita."
             )
 
-        # Verificar que no exista otra cita en la misma fecha/hora para este doctor
-        cita_existente = (
-            supabase_client
-            .table("cita_medica")
-            .select("id, estado(estado)")
-            .eq("doctor_id", cita_completa.cita.doctor_id)
-            .eq("fecha_atencion", fecha_cita.isoformat())
-            .execute()
-        )
+    print("⚠️ Lote de citas rechazado por reserva simultánea, insertando una por una")
+    filas = []
+    for registro in registros:
+        try:
+            insertada = await supabase_async.table("cita_medica").insert(registro).execute()
+            filas.extend(insertada.data or [])
+        except Exception as e:
+            if not es_reserva_duplicada(e):
+                raise
+    return filas
 
-        # Verificar que no sea una cita cancelada
-        for cita in (cita_existente.data or []):
-            estado_list = cita.get("estado", [])
-            if estado_list:
-                estado_actual = estado_list[0].get("estado") if isinstance(estado_list, list) else estado_list.get("estado")
-                if estado_actual != "Cancelada":
-                    raise HTTPException(
-                        status_code=409,
-                        detail="Ya existe una cita para este doctor en la fecha/hora seleccionada."
-                    )
 
-        # Crear la cita médica
-        nueva_cita = (
-            supabase_client
-            .table("cita_medica")
-            .insert({
-                "fecha_atencion": fecha_cita.isoformat(),
-                "paciente_id": cita_completa.cita.paciente_id,
-                "doctor_id": cita_completa.cita.doctor_id,
-                "especialidad_id": cita_completa.cita.especialidad_id
-            })
-            .execute()
+async def _crear_citas_lote_por_pasos(lote: CrearCitasLote, validos: List[dict]) -> List[dict]:
+    """
+    Flujo por pasos de crear-citas-lote, usado solo si la función crear_citas_lote
+    no está disponible. NO es atómico: citas, estados e información se insertan
+    en requests separados y el rollback son DELETE manuales.
+    """
+    citas = await _insertar_citas_lote([
+        {
+            "fecha_atencion": r["fecha_atencion"],
+            "paciente_id": lote.paciente_id,
+            "doctor_id": lote.doctor_id,
+            "especialidad_id": lote.especialidad_id,
+            "horario_id": r["horario_id"]
+        }
+        for r in validos
+    ], lote.modo)
+
+    if citas:
+        cita_ids = [cita["id"] for cita in citas]
+        informacion = lote.informacion.model_dump()
+        try:
+            estados = await supabase_async.table("estado").insert([
+                {"estado": lote.estado_inicial, "cita_medica_id": cita_id} for cita_id in cita_ids
+            ]).execute()
+            if len(estados.data or []) != len(cita_ids):
+                raise HTTPException(status_code=500, detail="No se pudieron crear los estados iniciales.")
+
+            infos = await supabase_async.table("informacion_cita").insert([
+                {"cita_medica_id": cita_id, **informacion} for cita_id in cita_ids
+            ]).execute()
+            if len(infos.data or []) != len(cita_ids):
+                raise HTTPException(status_code=500, detail="No se pudo crear la información de las citas.")
+        except Exception:
+            # Rollback: eliminar lo creado en este lote
+            await supabase_async.table("informacion_cita").delete().in_("cita_medica_id", cita_ids).execute()
+            await supabase_async.table("estado").delete().in_("cita_medica_id", cita_ids).execute()
+            await supabase_async.table("cita_medica").delete().in_("id", cita_ids).execute()
+            _cita_modificada(lote.doctor_id, None)
+            raise
+
+    return citas
+
+
+@appointment_router.post("/crear-citas-lote")
+async def crear_citas_lote(lote: CrearCitasLote):
+    """
+    Agenda varias sesiones del mismo paciente con un doctor (tratamientos recurrentes).
+    Todas las fechas se validan de una vez contra los bloques del doctor y sus citas
+    activas; citas, estados e información se insertan en una transacción con la
+    función SQL crear_citas_lote (flujo por pasos si no está disponible).
+    modo=todo_o_nada: si alguna fecha falla no se crea ninguna (409 con el detalle).
+    modo=parcial: se crean las fechas válidas y se informa el resultado de cada una.
+    """
+    try:
+        desde, hasta = rango_fechas(lote.fechas)
+
+        # Paciente, doctor y bloques que cubren las fechas: lecturas independientes, en paralelo
+        paciente, doctor, bloques = await asyncio.gather(
+            supabase_async.table("paciente").select("id").eq("id", lote.paciente_id).execute(),
+            supabase_async.table("usuario_sistema").select("id, rol_id").eq("id", lote.doctor_id).execute(),
+            cargar_bloques([lote.doctor_id], desde, hasta)
         )
 
-        if not nueva_cita.data:
-            raise HTTPException(status_code=500, detail="No se pudo crear la cita.")
+        if not paciente.data:
+            raise HTTPException(status_code=404, detail="El paciente no existe.")
 
-        cita_id = nueva_cita.data[0]["id"]
+        if not doctor.data:
+            raise HTTPException(status_code=404, detail="El doctor no existe.")
 
-        # Crear el estado inicial
-        estado_inicial = (
-            supabase_client
-            .table("estado")
-            .insert({
-                "estado": cita_completa.estado_inicial,
-                "cita_medica_id": cita_id
-            })
-            .execute()
-        )
+        if doctor.data[0].get("rol_id") != 2:
+            raise HTTPException(status_code=400, detail="El usuario seleccionado no es un doctor.")
 
-        if not estado_inicial.data:
-            # Rollback: eliminar la cita creada
-            supabase_client.table("cita_medica").delete().eq("id", cita_id).execute()
-            raise HTTPException(status_code=500, detail="No se pudo crear el estado inicial.")
+        citas_existentes = []
+        if bloques:
+            citas_existentes = await cargar_citas_activas(
+                [lote.doctor_id],
+                min(bloques, key=lambda b: a_datetime(b["inicio_bloque"]))["inicio_bloque"],
+                max(bloques, key=lambda b: a_datetime(b["finalizacion_bloque"]))["finalizacion_bloque"]
+            )
 
-        # Crear la información de la cita
-        info_cita = (
-            supabase_client
-            .table("informacion_cita")
-            .insert({
-                "cita_medica_id": cita_id,
-                "motivo_consulta": cita_completa.informacion.motivo_consulta,
-                "antecedentes": cita_completa.informacion.antecedentes,
-                "dolores_sintomas": cita_completa.informacion.dolores_sintomas,
-                "atenciones_quirurgicas": cita_completa.informacion.atenciones_quirurgicas,
-                "evaluacion_doctor": cita_completa.informacion.evaluacion_doctor,
-                "tratamiento": cita_completa.informacion.tratamiento,
-                "diagnostico_id": cita_completa.informacion.diagnostico_id
-            })
-            .execute()
-        )
+        resultados = asignar_bloques(lote.fechas, bloques, citas_existentes)
+        for resultado in resultados:
+            resultado["creada"] = False
+            resultado["motivo"] = MOTIVOS_RECHAZO.get(resultado["error"])
+            resultado["cita"] = None
+
+        validos = [r for r in resultados if r["horario_id"] is not None]
+        rechazados = len(resultados) - len(validos)
+
+        if lote.modo == "todo_o_nada" and rechazados:
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "mensaje": f"{rechazados} de {len(resultados)} fechas no se pueden agendar. No se creó ninguna cita.",
+                    "resultados": resultados
+                }
+            )
 
-        if not info_cita.data:
-            # Rollback: eliminar cita y estado
-            supabase_client.table("estado").delete().eq("id", estado_inicial.data[0]["id"]).execute()
-            supabase_client.table("cita_medica").delete().eq("id", cita_id).execute()
-            raise HTTPException(status_code=500, detail="No se pudo crear la información de la cita.")
+        citas = []
+        if validos:
+            resultado_rpc = await rpc_gateway.llamar("crear_citas_lote", {
+                "p_paciente_id": lote.paciente_id,
+                "p_doctor_id": lote.doctor_id,
+                "p_especialidad_id": lote.especialidad_id,
+                "p_estado_inicial": lote.estado_inicial,
+                "p_citas": [
+                    {"indice": r["indice"], "fecha_atencion": r["fecha_atencion"], "horario_id": r["horario_id"]}
+                    for r in validos
+                ],
+                "p_informacion": lote.informacion.model_dump(),
+                "p_parcial": lote.modo == "parcial"
+            }, escritura=True)
+
+            if resultado_rpc is None:
+                citas = await _crear_citas_lote_por_pasos(lote, validos)
+            else:
+                datos = resultado_rpc.data or {}
+                if datos.get("error"):
+                    raise HTTPException(
+                        status_code=409,
+                        detail="Otra reserva tomó uno de los bloques solicitados. No se creó ninguna cita."
+                    )
+                citas = datos.get("citas") or []
+
+        # Cada bloque tiene una sola cita activa: el horario_id identifica su fecha
+        citas_por_horario = {cita["horario_id"]: cita for cita in citas}
+        for resultado in validos:
+            cita = citas_por_horario.get(resultado["horario_id"])
+            if cita:
+                resultado["creada"] = True
+                resultado["cita"] = cita
+                indice_disponibilidad.marcar_ocupado(lote.doctor_id, cita["fecha_atencion"])
+                guardia_citas.registrar(lote.doctor_id, cita["id"], cita["fecha_atencion"])
+                consultas_en_curso.registrar_estado(cita["id"], lote.doctor_id, lote.estado_inicial)
+                eventos_citas.publicar(
+                    "cita_creada", cita["id"], lote.doctor_id, cita["fecha_atencion"], estado=lote.estado_inicial
+                )
+            else:
+                resultado["error"] = "reserva_duplicada"
+                resultado["motivo"] = MOTIVOS_RECHAZO["reserva_duplicada"]
 
+        creadas = len(citas)
+        if creadas:
+            cache_tablero.invalidar("tablero_hoy")
         return {
-            "mensaje": "Cita creada exitosamente.",
-            "cita": nueva_cita.data[0],
-            "estado": estado_inicial.data[0],
-            "informacion": info_cita.data[0]
+            "mensaje": f"Se crearon {creadas} de {len(resultados)} citas.",
+            "modo": lote.modo,
+            "citas_creadas": creadas,
+            "citas_rechazadas": len(resultados) - creadas,
+            "resultados": resultados
         }
 
     except HTTPException:
@@ -178,6 +480,26 @@ async def crear_cita(cita_completa: CrearCitaCompleta):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _filtrar_citas(query, fecha: Optional[str], doctor_id: Optional[int], paciente_id: Optional[int], estado: Optional[str]):
+    """Filtros de listar_citas sobre cita_medica (el estado usa la columna denormalizada)."""
+    if fecha:
+        # Día de Chile con el cambio de horario resuelto, igual que contar_citas_con_estado
+        try:
+            dia = date.fromisoformat(fecha)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+        inicio = datetime.combine(dia, datetime.min.time(), tzinfo=ZONA_CHILE)
+        fin = datetime.combine(dia + timedelta(days=1), datetime.min.time(), tzinfo=ZONA_CHILE)
+        query = query.gte("fecha_atencion", inicio.isoformat()).lt("fecha_atencion", fin.isoformat())
+    if doctor_id:
+        query = query.eq("doctor_id", doctor_id)
+    if paciente_id:
+        query = query.eq("paciente_id", paciente_id)
+    if estado:
+        query = query.eq("estado_actual", estado)
+    return query
+
+
 @appointment_router.get("/listar-citas")
 async def listar_citas(
     fecha: Optional[str] = None,
@@ -185,138 +507,138 @@ async def listar_citas(
     paciente_id: Optional[int] = None,
     estado: Optional[str] = None,
     limite: int = 100,
-    offset: int = 0
+    offset: int = 0,
+    conteo: str = Query(
+        "exacto",
+        pattern="^(exacto|estimado|ninguno)$",
+        description="Total de la paginación: exacto, estimado (planificador) o ninguno (scroll infinito)"
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="siguiente_cursor de la respuesta anterior; reemplaza a offset"
+    )
 ):
     """
     Lista todas las citas con información del paciente, doctor y especialidad.
     Filtros opcionales: fecha, doctor_id, paciente_id, estado.
     OPTIMIZADO: Usa función SQL con JOINs y paginación (con fallback).
+    El total se obtiene en paralelo a la página según el modo de conteo;
+    con conteo=ninguno se retorna total=None y solo se indica si hay_mas.
+    Paginación por cursor: con conteo=ninguno o cursor la página sale de la
+    consulta por (fecha_atencion, id) y trae siguiente_cursor; enviarlo en cursor
+    evita recorrer el offset. La función SQL (paginación por offset) no garantiza
+    ese orden, así que sus páginas no traen cursor.
     """
-    try:
-        # Intentar usar la función SQL optimizada
-        try:
-            resultado = supabase_client.rpc(
-                "listar_citas_con_estado",
-                {
-                    "fecha_filtro": fecha,
-                    "p_doctor_id": doctor_id,
-                    "p_paciente_id": paciente_id,
-                    "estado_filtro": estado,
-                    "limite": limite,
-                    "offset": offset
-                }
-            ).execute()
+    # Se pide una fila extra para saber si hay más páginas
+    limite_consulta = limite + 1
+    # Total ya obtenido con contar_citas_con_estado (no se vuelve a contar en el fallback)
+    total_rpc = None
 
-            if resultado.data:
-                # Obtener total
-                total_resultado = supabase_client.rpc(
+    try:
+        # Intentar usar la función SQL optimizada (solo pagina por offset y con total)
+        if not cursor and conteo != "ninguno":
+            consultas = [
+                rpc_gateway.llamar(
                     "listar_citas_con_estado",
                     {
                         "fecha_filtro": fecha,
                         "p_doctor_id": doctor_id,
                         "p_paciente_id": paciente_id,
                         "estado_filtro": estado,
-                        "limite": 999999,
-                        "offset": 0
+                        "limite": limite_consulta,
+                        "offset": offset
                     }
-                ).execute()
-
-                total = len(total_resultado.data) if total_resultado.data else 0
-
+                ),
+                rpc_gateway.llamar(
+                    "contar_citas_con_estado",
+                    {
+                        "fecha_filtro": fecha,
+                        "p_doctor_id": doctor_id,
+                        "p_paciente_id": paciente_id,
+                        "estado_filtro": estado,
+                        "p_estimado": conteo == "estimado"
+                    }
+                )
+            ]
+
+            # Página y total en paralelo (None = RPC no disponible)
+            resultado, total_resultado = await asyncio.gather(*consultas)
+
+            if total_resultado is not None:
+                total_rpc = total_resultado.data
+
+            if resultado is not None:
+                # La página de la función se usa tal cual (aunque venga vacía);
+                # si solo falta el total se pide sin filas a PostgREST
+                if total_rpc is None:
+                    conteo_result = await _filtrar_citas(
+                        supabase_async.table("cita_medica").select("id", count=METODOS_CONTEO[conteo]),
+                        fecha, doctor_id, paciente_id, estado
+                    ).limit(0).execute()
+                    total_rpc = conteo_result.count
                 return {
-                    "citas": resultado.data,
-                    "total": total,
+                    "citas": (resultado.data or [])[:limite],
+                    "total": total_rpc,
                     "limite": limite,
-                    "offset": offset
+                    "offset": offset,
+                    "hay_mas": len(resultado.data) > limite,
+                    "siguiente_cursor": None
                 }
-        except Exception as rpc_error:
-            print(f"⚠️ RPC no disponible, usando fallback: {str(rpc_error)}")
 
-        # FALLBACK: Query optimizada con bulk
-        chile_tz = ZoneInfo("America/Santiago")
+        # FALLBACK / keyset: Query optimizada con bulk
         
-        # Query con JOINs para obtener todo de una vez
+        # Query con JOINs para obtener todo de una vez; el total llega en el
+        # header Content-Range de la misma respuesta
         query = (
-            supabase_client
+            supabase_async
             .table("cita_medica")
             .select("""
                 id,
                 fecha_atencion,
                 doctor_id,
                 especialidad_id,
+                estado_actual,
                 paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, telefono, rut),
                 doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
                 especialidad:especialidad_id(id, nombre)
-            """)
+            """, count=None if cursor or total_rpc is not None else METODOS_CONTEO.get(conteo))
         )
+        query = _filtrar_citas(query, fecha, doctor_id, paciente_id, estado)
 
-        # Aplicar filtros
-        if fecha:
-            query = query.gte("fecha_atencion", f"{fecha}T00:00:00-03:00").lte("fecha_atencion", f"{fecha}T23:59:59-03:00")
-        
-        if doctor_id:
-            query = query.eq("doctor_id", doctor_id)
-        if paciente_id:
-            query = query.eq("paciente_id", paciente_id)
+        # Orden estable (fecha_atencion, id); con cursor se continúa por índice
+        query = aplicar_cursor(query, cursor, "fecha_atencion")
+        if cursor:
+            query = query.limit(limite_consulta)
+        else:
+            query = query.range(offset, offset + limite_consulta - 1)
 
-        citas_result = query.order("fecha_atencion", desc=False).execute()
-        
-        citas_filtradas = citas_result.data or []
+        citas_result = await query.execute()
+
+        # Con cursor no se calcula total (el conteo se obtiene en la primera página)
+        if total_rpc is not None:
+            total = total_rpc
+        else:
+            total = citas_result.count if conteo != "ninguno" and not cursor else None
+        citas_filtradas, siguiente_cursor = cortar_pagina(citas_result.data or [], limite, "fecha_atencion")
 
         if not citas_filtradas:
-            return {"citas": [], "total": 0}
+            return {
+                "citas": [],
+                "total": total,
+                "limite": limite,
+                "offset": offset,
+                "hay_mas": False,
+                "siguiente_cursor": None
+            }
+
+        # Precios de especialidades desde el cache de catálogos
+        costos = await obtener_costos_servicio()
+        precios_dict = {esp_id: costo["precio"] for esp_id, costo in costos.items()}
 
-        # Extraer IDs de citas para bulk queries
-        citas_ids = [cita["id"] for cita in citas_filtradas]
-        
-        # Bulk query de TODOS los estados
-        estados_response = (
-            supabase_client
-            .table("estado")
-            .select("cita_medica_id, estado, id")
-            .in_("cita_medica_id", citas_ids)
-            .order("id", desc=True)
-            .execute()
-        )
-        
-        # Crear diccionario de estados (solo el más reciente por cita)
-        estados_dict = {}
-        if estados_response.data:
-            for est in estados_response.data:
-                cita_id = est["cita_medica_id"]
-                if cita_id not in estados_dict:
-                    estados_dict[cita_id] = est["estado"]
-        
-        # Bulk query de precios de especialidades únicas
-        especialidad_ids = list(set(
-            cita.get("especialidad_id") 
-            for cita in citas_filtradas 
-            if cita.get("especialidad_id")
-        ))
-        
-        precios_dict = {}
-        if especialidad_ids:
-            precios_response = (
-                supabase_client
-                .table("costos_servicio")
-                .select("especialidad_id, precio")
-                .in_("especialidad_id", especialidad_ids)
-                .execute()
-            )
-            
-            if precios_response.data:
-                for precio in precios_response.data:
-                    precios_dict[precio["especialidad_id"]] = precio["precio"]
-        
         # Construir respuesta usando datos pre-cargados
         citas_con_estado = []
         for cita in citas_filtradas:
-            # Obtener estado del diccionario (O(1) lookup)
-            estado_texto = estados_dict.get(cita["id"], "Sin estado")
-
-            # Filtrar por estado si se especificó
-            if estado and estado_texto != estado:
-                continue
+            estado_texto = cita.get("estado_actual") or "Sin estado"
 
             # Obtener precio del diccionario (O(1) lookup)
             precio_especialidad = None
@@ -330,17 +652,17 @@ async def listar_citas(
                 "precio_especialidad": precio_especialidad
             })
 
-        # Aplicar paginación
-        total = len(citas_con_estado)
-        citas_paginadas = citas_con_estado[offset:offset+limite]
-
         return {
-            "citas": citas_paginadas,
+            "citas": citas_con_estado,
             "total": total,
             "limite": limite,
-            "offset": offset
+            "offset": offset,
+            "hay_mas": siguiente_cursor is not None,
+            "siguiente_cursor": siguiente_cursor
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"ERROR en listar_citas: {str(e)}")
@@ -356,7 +678,7 @@ async def obtener_cita(cita_id: int):
     try:
         # Obtener la cita con información del paciente y doctor
         cita = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("""
                 id,
@@ -373,7 +695,7 @@ async def obtener_cita(cita_id: int):
 
         # Obtener el estado actual
         estado_actual = (
-            supabase_client
+            await supabase_async
             .table("estado")
             .select("estado")
             .eq("cita_medica_id", cita_id)
@@ -384,7 +706,7 @@ async def obtener_cita(cita_id: int):
 
         # Obtener información de la cita
         info_cita = (
-            supabase_client
+            await supabase_async
             .table("informacion_cita")
             .select("*")
             .eq("cita_medica_id", cita_id)
@@ -411,9 +733,9 @@ async def modificar_cita(cita_id: int, cita: ActualizarCita):
     try:
         # Verificar que la cita existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
-            .select("id")
+            .select("id, doctor_id, fecha_atencion")
             .eq("id", cita_id)
             .execute()
         )
@@ -426,13 +748,13 @@ async def modificar_cita(cita_id: int, cita: ActualizarCita):
             datos_actualizar["fecha_atencion"] = cita.fecha_atencion.isoformat()
         if cita.paciente_id:
             # Verificar que el paciente existe
-            paciente = supabase_client.table("paciente").select("id").eq("id", cita.paciente_id).execute()
+            paciente = await supabase_async.table("paciente").select("id").eq("id", cita.paciente_id).execute()
             if not paciente.data:
                 raise HTTPException(status_code=404, detail="El paciente no existe.")
             datos_actualizar["paciente_id"] = cita.paciente_id
         if cita.doctor_id:
             # Verificar que el doctor existe
-            doctor = supabase_client.table("usuario_sistema").select("id").eq("id", cita.doctor_id).execute()
+            doctor = await supabase_async.table("usuario_sistema").select("id").eq("id", cita.doctor_id).execute()
             if not doctor.data:
                 raise HTTPException(status_code=404, detail="El doctor no existe.")
             datos_actualizar["doctor_id"] = cita.doctor_id
@@ -440,18 +762,67 @@ async def modificar_cita(cita_id: int, cita: ActualizarCita):
         if not datos_actualizar:
             raise HTTPException(status_code=400, detail="No hay datos para actualizar.")
 
+        # Si cambia la fecha o el doctor, la cita pasa al bloque que contiene la nueva fecha/hora
+        if "fecha_atencion" in datos_actualizar or "doctor_id" in datos_actualizar:
+            nuevo_doctor = datos_actualizar.get("doctor_id", existe.data[0]["doctor_id"])
+            nueva_fecha = datos_actualizar.get("fecha_atencion", existe.data[0]["fecha_atencion"])
+            bloque = (
+                await supabase_async
+                .table("horarios_personal")
+                .select("id, inicio_bloque, finalizacion_bloque")
+                .eq("usuario_sistema_id", nuevo_doctor)
+                .lte("inicio_bloque", nueva_fecha)
+                .gt("finalizacion_bloque", nueva_fecha)
+                .order("inicio_bloque")
+                .limit(1)
+                .execute()
+            )
+            datos_actualizar["horario_id"] = bloque.data[0]["id"] if bloque.data else None
+
+            if bloque.data and await guardia_citas.conflicto(
+                nuevo_doctor,
+                bloque.data[0]["inicio_bloque"],
+                bloque.data[0]["finalizacion_bloque"],
+                excluir_id=cita_id
+            ):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Ya existe una cita para este doctor en la fecha/hora seleccionada."
+                )
+
         # Actualizar la cita
-        actualizada = (
-            supabase_client
-            .table("cita_medica")
-            .update(datos_actualizar)
-            .eq("id", cita_id)
-            .execute()
-        )
+        try:
+            actualizada = (
+                await supabase_async
+                .table("cita_medica")
+                .update(datos_actualizar)
+                .eq("id", cita_id)
+                .execute()
+            )
+        except Exception as e:
+            if es_reserva_duplicada(e):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Ya existe una cita para este doctor en la fecha/hora seleccionada."
+                )
+            raise
 
         if not actualizada.data:
             raise HTTPException(status_code=500, detail="No se pudo actualizar la cita.")
 
+        # El bloque anterior queda libre y el nuevo ocupado
+        _cita_modificada(existe.data[0]["doctor_id"], existe.data[0]["fecha_atencion"])
+        _cita_modificada(actualizada.data[0]["doctor_id"], actualizada.data[0]["fecha_atencion"])
+        consultas_en_curso.cambiar_doctor(cita_id, actualizada.data[0]["doctor_id"])
+        eventos_citas.publicar(
+            "cita_modificada",
+            cita_id,
+            actualizada.data[0]["doctor_id"],
+            actualizada.data[0]["fecha_atencion"],
+            doctor_anterior=existe.data[0]["doctor_id"],
+            fecha_atencion_anterior=existe.data[0]["fecha_atencion"]
+        )
+
         return {
             "mensaje": "Cita actualizada exitosamente.",
             "cita": actualizada.data[0]
@@ -471,7 +842,7 @@ async def modificar_informacion_cita(cita_id: int, informacion: ActualizarInform
     try:
         # Verificar que la cita existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("id")
             .eq("id", cita_id)
@@ -482,7 +853,7 @@ async def modificar_informacion_cita(cita_id: int, informacion: ActualizarInform
 
         # Verificar si ya existe información de la cita
         info_existe = (
-            supabase_client
+            await supabase_async
             .table("informacion_cita")
             .select("id")
             .eq("cita_medica_id", cita_id)
@@ -512,7 +883,7 @@ async def modificar_informacion_cita(cita_id: int, informacion: ActualizarInform
         if info_existe.data:
             # Actualizar información existente
             actualizada = (
-                supabase_client
+                await supabase_async
                 .table("informacion_cita")
                 .update(datos_actualizar)
                 .eq("cita_medica_id", cita_id)
@@ -522,7 +893,7 @@ async def modificar_informacion_cita(cita_id: int, informacion: ActualizarInform
             # Crear nueva información
             datos_actualizar["cita_medica_id"] = cita_id
             actualizada = (
-                supabase_client
+                await supabase_async
                 .table("informacion_cita")
                 .insert(datos_actualizar)
                 .execute()
@@ -551,9 +922,9 @@ async def cambiar_estado(cita_id: int, cambio: CambiarEstado):
     try:
         # Verificar que la cita existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
-            .select("id")
+            .select("id, doctor_id, fecha_atencion, estado_actual")
             .eq("id", cita_id)
             .execute()
         )
@@ -561,27 +932,46 @@ async def cambiar_estado(cita_id: int, cambio: CambiarEstado):
             raise HTTPException(status_code=404, detail="La cita no existe.")
 
         # Validar estado
-        estados_validos = ["Pendiente", "Confirmada", "En Consulta", "Completada", "Cancelada"]
-        if cambio.estado not in estados_validos:
+        if cambio.estado not in ESTADOS_VALIDOS:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Estado inválido. Estados válidos: {', '.join(estados_validos)}"
+                detail=f"Estado inválido. Estados válidos: {', '.join(ESTADOS_VALIDOS)}"
             )
 
         # Insertar nuevo estado en el historial
-        nuevo_estado = (
-            supabase_client
-            .table("estado")
-            .insert({
-                "estado": cambio.estado,
-                "cita_medica_id": cita_id
-            })
-            .execute()
-        )
+        try:
+            nuevo_estado = (
+                await supabase_async
+                .table("estado")
+                .insert({
+                    "estado": cambio.estado,
+                    "cita_medica_id": cita_id
+                })
+                .execute()
+            )
+        except Exception as e:
+            # Reactivar una cita cancelada cuyo bloque ya tomó otra cita
+            if es_reserva_duplicada(e):
+                raise HTTPException(
+                    status_code=409,
+                    detail="El horario de esta cita ya fue reservado por otra cita."
+                )
+            raise
 
         if not nuevo_estado.data:
             raise HTTPException(status_code=500, detail="No se pudo cambiar el estado.")
 
+        _cita_modificada(existe.data[0]["doctor_id"], existe.data[0]["fecha_atencion"])
+        consultas_en_curso.registrar_estado(cita_id, existe.data[0]["doctor_id"], cambio.estado)
+        eventos_citas.publicar(
+            "estado_cambiado",
+            cita_id,
+            existe.data[0]["doctor_id"],
+            existe.data[0]["fecha_atencion"],
+            estado=cambio.estado,
+            estado_anterior=existe.data[0].get("estado_actual")
+        )
+
         return {
             "mensaje": f"Estado cambiado a '{cambio.estado}' exitosamente.",
             "estado": nuevo_estado.data[0]
@@ -593,6 +983,103 @@ async def cambiar_estado(cita_id: int, cambio: CambiarEstado):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@appointment_router.put("/cambiar-estados-lote")
+async def cambiar_estados_lote(lote: CambiarEstadosLote):
+    """
+    Cambia el estado de varias citas (cierre del día: inasistencias a Cancelada,
+    confirmar citas pagadas, etc.).
+    OPTIMIZADO: una lectura con in_() de las citas, validación de transiciones en
+    memoria (TRANSICIONES_PERMITIDAS) y un solo INSERT con todas las filas de estado.
+    El trigger de estado mantiene cita_medica.estado_actual. Los cambios no válidos
+    se informan por cita y no impiden aplicar el resto.
+    """
+    try:
+        cita_ids = list({cambio.cita_id for cambio in lote.cambios})
+        citas = await supabase_async.table("cita_medica").select(
+            "id, doctor_id, fecha_atencion, estado_actual"
+        ).in_("id", cita_ids).execute()
+        citas_por_id = {cita["id"]: cita for cita in (citas.data or [])}
+
+        resultados = []
+        vistos = set()
+        for cambio in lote.cambios:
+            cita = citas_por_id.get(cambio.cita_id)
+            estado_anterior = cita.get("estado_actual") if cita else None
+            resultado = {
+                "cita_id": cambio.cita_id,
+                "estado_anterior": estado_anterior,
+                "estado": cambio.estado,
+                "aplicado": False,
+                "motivo": None
+            }
+            resultados.append(resultado)
+
+            if cambio.estado not in ESTADOS_VALIDOS:
+                resultado["motivo"] = f"Estado inválido. Estados válidos: {', '.join(ESTADOS_VALIDOS)}"
+            elif not cita:
+                resultado["motivo"] = "La cita no existe."
+            elif cambio.cita_id in vistos:
+                resultado["motivo"] = "La cita aparece más de una vez en el lote."
+            elif (estado_anterior or "Pendiente") == cambio.estado:
+                resultado["motivo"] = f"La cita ya está en estado '{cambio.estado}'."
+            elif cambio.estado not in TRANSICIONES_PERMITIDAS.get(estado_anterior or "Pendiente", set()):
+                resultado["motivo"] = f"No se permite pasar de '{estado_anterior or 'Pendiente'}' a '{cambio.estado}'."
+            vistos.add(cambio.cita_id)
+
+        validos = [r for r in resultados if r["motivo"] is None]
+        insertados = []
+        if validos:
+            filas = [{"estado": r["estado"], "cita_medica_id": r["cita_id"]} for r in validos]
+            try:
+                nuevos = await supabase_async.table("estado").insert(filas).execute()
+                insertados = nuevos.data or []
+            except Exception as e:
+                if not es_reserva_duplicada(e):
+                    raise
+                # Una reactivación choca con otra cita de su bloque: se aplican una por una
+                print("⚠️ Lote de estados rechazado por una reactivación, insertando uno por uno")
+                for fila in filas:
+                    try:
+                        nuevo = await supabase_async.table("estado").insert(fila).execute()
+                        insertados.extend(nuevo.data or [])
+                    except Exception as e_fila:
+                        if not es_reserva_duplicada(e_fila):
+                            raise
+
+        estados_por_cita = {fila["cita_medica_id"]: fila for fila in insertados}
+        for resultado in validos:
+            nuevo = estados_por_cita.get(resultado["cita_id"])
+            if nuevo:
+                resultado["aplicado"] = True
+                resultado["registro"] = nuevo
+                cita = citas_por_id[resultado["cita_id"]]
+                _cita_modificada(cita["doctor_id"], cita["fecha_atencion"])
+                consultas_en_curso.registrar_estado(cita["id"], cita["doctor_id"], resultado["estado"])
+                eventos_citas.publicar(
+                    "estado_cambiado",
+                    cita["id"],
+                    cita["doctor_id"],
+                    cita["fecha_atencion"],
+                    estado=resultado["estado"],
+                    estado_anterior=resultado["estado_anterior"]
+                )
+            else:
+                resultado["motivo"] = "El horario de esta cita ya fue reservado por otra cita."
+
+        aplicados = len(estados_por_cita)
+        return {
+            "mensaje": f"Se cambiaron {aplicados} de {len(resultados)} estados.",
+            "aplicados": aplicados,
+            "rechazados": len(resultados) - aplicados,
+            "resultados": resultados
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @appointment_router.get("/historial-estados/{cita_id}")
 async def obtener_historial_estados(cita_id: int):
     """
@@ -601,7 +1088,7 @@ async def obtener_historial_estados(cita_id: int):
     try:
         # Verificar que la cita existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("id")
             .eq("id", cita_id)
@@ -612,7 +1099,7 @@ async def obtener_historial_estados(cita_id: int):
 
         # Obtener historial de estados
         historial = (
-            supabase_client
+            await supabase_async
             .table("estado")
             .select("*")
             .eq("cita_medica_id", cita_id)
@@ -639,9 +1126,9 @@ async def cancelar_cita(cita_id: int):
     try:
         # Verificar que la cita existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
-            .select("id")
+            .select("id, doctor_id, fecha_atencion, estado_actual")
             .eq("id", cita_id)
             .execute()
         )
@@ -650,7 +1137,7 @@ async def cancelar_cita(cita_id: int):
 
         # Insertar estado 'Cancelada'
         cancelada = (
-            supabase_client
+            await supabase_async
             .table("estado")
             .insert({
                 "estado": "Cancelada",
@@ -662,6 +1149,17 @@ async def cancelar_cita(cita_id: int):
         if not cancelada.data:
             raise HTTPException(status_code=500, detail="No se pudo cancelar la cita.")
 
+        _cita_modificada(existe.data[0]["doctor_id"], existe.data[0]["fecha_atencion"])
+        consultas_en_curso.registrar_estado(cita_id, existe.data[0]["doctor_id"], "Cancelada")
+        eventos_citas.publicar(
+            "estado_cambiado",
+            cita_id,
+            existe.data[0]["doctor_id"],
+            existe.data[0]["fecha_atencion"],
+            estado="Cancelada",
+            estado_anterior=existe.data[0].get("estado_actual")
+        )
+
         return {
             "mensaje": "Cita cancelada exitosamente.",
             "estado": cancelada.data[0]
@@ -679,18 +1177,17 @@ async def listar_especialidades():
     Lista todas las especialidades disponibles.
     """
     try:
-        especialidades = (
-            supabase_client
-            .table("especialidad")
-            .select("id, nombre, descripcion")
-            .order("nombre", desc=False)
-            .execute()
-        )
-
-        if not especialidades.data:
-            return {"especialidades": []}
+        async def cargar():
+            especialidades = (
+                await supabase_async
+                .table("especialidad")
+                .select("id, nombre, descripcion")
+                .order("nombre", desc=False)
+                .execute()
+            )
+            return especialidades.data or []
 
-        return {"especialidades": especialidades.data}
+        return {"especialidades": await cache_catalogos.obtener("especialidad", "por_nombre", cargar)}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -706,7 +1203,7 @@ async def listar_doctores(especialidad_id: Optional[int] = None):
         if especialidad_id:
             # Obtener doctores filtrados por especialidad
             doctores_especialidad = (
-                supabase_client
+                await supabase_async
                 .table("especialidades_doctor")
                 .select("usuario_sistema_id")
                 .eq("especialidad_id", especialidad_id)
@@ -721,7 +1218,7 @@ async def listar_doctores(especialidad_id: Optional[int] = None):
 
             # Obtener información completa de los doctores
             doctores = (
-                supabase_client
+                await supabase_async
                 .table("usuario_sistema")
                 .select("id, nombre, apellido_paterno, apellido_materno, email")
                 .in_("id", doctor_ids)
@@ -731,7 +1228,7 @@ async def listar_doctores(especialidad_id: Optional[int] = None):
         else:
             # Obtener todos los doctores
             doctores = (
-                supabase_client
+                await supabase_async
                 .table("usuario_sistema")
                 .select("id, nombre, apellido_paterno, apellido_materno, email")
                 .order("nombre", desc=False)
@@ -762,7 +1259,7 @@ async def obtener_estadisticas(fecha: Optional[str] = None):
         if fecha:
             # Consultar vista materializada directamente
             resultado = (
-                supabase_client
+                await supabase_async
                 .table("vista_estadisticas_diarias")
                 .select("*")
                 .eq("fecha", fecha)
@@ -792,7 +1289,7 @@ async def obtener_estadisticas(fecha: Optional[str] = None):
         else:
             # Sin filtro de fecha, sumar todas las estadísticas de la vista
             resultado = (
-                supabase_client
+                await supabase_async
                 .table("vista_estadisticas_diarias")
                 .select("*")
                 .execute()
@@ -835,9 +1332,9 @@ async def procesar_pago(pago: CrearPago):
     try:
         # Verificar que la cita existe
         cita = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
-            .select("id, doctor_id")
+            .select("id, doctor_id, fecha_atencion, estado_actual")
             .eq("id", pago.cita_medica_id)
             .execute()
         )
@@ -854,7 +1351,7 @@ async def procesar_pago(pago: CrearPago):
 
         # Verificar que no exista ya un pago para esta cita
         pago_existe = (
-            supabase_client
+            await supabase_async
             .table("pagos")
             .select("id")
             .eq("cita_medica_id", pago.cita_medica_id)
@@ -872,7 +1369,7 @@ async def procesar_pago(pago: CrearPago):
 
         # Crear el registro de pago
         nuevo_pago = (
-            supabase_client
+            await supabase_async
             .table("pagos")
             .insert({
                 "fecha_pago": datetime.now().isoformat(),
@@ -895,7 +1392,7 @@ async def procesar_pago(pago: CrearPago):
 
             # Obtener la especialidad del doctor
             especialidad_doctor = (
-                supabase_client
+                await supabase_async
                 .table("especialidades_doctor")
                 .select("especialidad_id")
                 .eq("usuario_sistema_id", doctor_id)
@@ -906,31 +1403,47 @@ async def procesar_pago(pago: CrearPago):
             if especialidad_doctor.data:
                 especialidad_id = especialidad_doctor.data[0]["especialidad_id"]
 
-                # Obtener el costo_servicio_id de esta especialidad
-                costo_servicio = (
-                    supabase_client
-                    .table("costos_servicio")
-                    .select("id")
-                    .eq("especialidad_id", especialidad_id)
-                    .limit(1)
-                    .execute()
-                )
+                # Obtener el costo_servicio_id de esta especialidad (cache de catálogos)
+                costo_servicio = await obtener_costo_especialidad(especialidad_id)
 
-                if costo_servicio.data:
-                    costo_servicio_id = costo_servicio.data[0]["id"]
+                if costo_servicio:
+                    costo_servicio_id = costo_servicio["id"]
 
                     # Crear el registro de detalle con el motivo del descuento
-                    supabase_client.table("detalle").insert({
+                    await supabase_async.table("detalle").insert({
                         "descuento_aseguradora": pago.descuento_aseguradora,
                         "costo_servicio_id": costo_servicio_id,
                         "pago_id": pago_id
                     }).execute()
 
         # Cambiar el estado de la cita a "Confirmada"
-        supabase_client.table("estado").insert({
-            "estado": "Confirmada",
-            "cita_medica_id": pago.cita_medica_id
-        }).execute()
+        try:
+            await supabase_async.table("estado").insert({
+                "estado": "Confirmada",
+                "cita_medica_id": pago.cita_medica_id
+            }).execute()
+        except Exception as e:
+            # Cita cancelada cuyo bloque ya tomó otra cita: se deshace el pago
+            if es_reserva_duplicada(e):
+                await supabase_async.table("detalle").delete().eq("pago_id", pago_id).execute()
+                await supabase_async.table("pagos").delete().eq("id", pago_id).execute()
+                raise HTTPException(
+                    status_code=409,
+                    detail="El horario de esta cita ya fue reservado por otra cita."
+                )
+            raise
+        consultas_en_curso.registrar_estado(pago.cita_medica_id, None, "Confirmada")
+        cache_tablero.invalidar("tablero_hoy")
+        eventos_citas.publicar(
+            "pago_registrado",
+            pago.cita_medica_id,
+            cita.data[0]["doctor_id"],
+            cita.data[0]["fecha_atencion"],
+            estado="Confirmada",
+            estado_anterior=cita.data[0].get("estado_actual"),
+            pago_id=pago_id,
+            monto_final=monto_final
+        )
 
         return {
             "mensaje": "Pago procesado exitosamente.",
@@ -947,15 +1460,19 @@ async def procesar_pago(pago: CrearPago):
 
 
 @appointment_router.get("/listar-pagos")
-async def listar_pagos():
+async def listar_pagos(
+    limite: Optional[int] = Query(None, ge=1, le=500, description="Pagos por página (sin limite ni cursor se listan todos)"),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la respuesta anterior")
+):
     """
     Lista todos los pagos procesados con información completa de paciente, doctor, especialidad y cita.
     OPTIMIZADO: Usa JOINs y bulk queries para eliminar N+1.
+    Con limite/cursor pagina por (fecha_pago, id) descendente en la base de datos.
     """
     try:
-        # Query 1: Obtener todos los pagos con información de cita mediante JOIN
-        pagos_response = (
-            supabase_client
+        # Query 1: Obtener los pagos con información de cita mediante JOIN
+        query = (
+            supabase_async
             .table("pagos")
             .select("""
                 *,
@@ -968,19 +1485,29 @@ async def listar_pagos():
                     fecha_atencion
                 )
             """)
-            .order("fecha_pago", desc=True)
-            .execute()
         )
 
-        if not pagos_response.data:
-            return {"pagos": []}
+        paginar = limite is not None or cursor is not None
+        query = aplicar_cursor(query, cursor, "fecha_pago", desc=True)
+        if paginar:
+            limite = limite or 50
+            query = query.limit(limite + 1)
+
+        pagos_response = await query.execute()
+        pagos = pagos_response.data or []
+        siguiente_cursor = None
+        if paginar:
+            pagos, siguiente_cursor = cortar_pagina(pagos, limite, "fecha_pago")
+
+        if not pagos:
+            return {"pagos": [], "siguiente_cursor": None}
 
         # Extraer IDs únicos para bulk queries
         paciente_ids = set()
         doctor_ids = set()
         especialidad_ids = set()
         
-        for pago in pagos_response.data:
+        for pago in pagos:
             if pago.get("cita_medica"):
                 cita = pago["cita_medica"]
                 if cita.get("paciente_id"):
@@ -994,7 +1521,7 @@ async def listar_pagos():
         pacientes_dict = {}
         if paciente_ids:
             pacientes_response = (
-                supabase_client
+                await supabase_async
                 .table("paciente")
                 .select("id, nombre, apellido_paterno, apellido_materno, rut, telefono, correo")
                 .in_("id", list(paciente_ids))
@@ -1006,7 +1533,7 @@ async def listar_pagos():
         doctores_dict = {}
         if doctor_ids:
             doctores_response = (
-                supabase_client
+                await supabase_async
                 .table("usuario_sistema")
                 .select("id, nombre, apellido_paterno, apellido_materno")
                 .in_("id", list(doctor_ids))
@@ -1018,7 +1545,7 @@ async def listar_pagos():
         especialidades_dict = {}
         if especialidad_ids:
             especialidades_response = (
-                supabase_client
+                await supabase_async
                 .table("especialidad")
                 .select("id, nombre")
                 .in_("id", list(especialidad_ids))
@@ -1028,7 +1555,7 @@ async def listar_pagos():
 
         # Query 5: Bulk query para especialidades de doctores (si alguna cita no tiene especialidad)
         doctores_sin_especialidad = []
-        for pago in pagos_response.data:
+        for pago in pagos:
             if pago.get("cita_medica"):
                 cita = pago["cita_medica"]
                 if not cita.get("especialidad_id") and cita.get("doctor_id"):
@@ -1037,7 +1564,7 @@ async def listar_pagos():
         doctor_especialidades_dict = {}
         if doctores_sin_especialidad:
             doctor_esp_response = (
-                supabase_client
+                await supabase_async
                 .table("especialidades_doctor")
                 .select("usuario_sistema_id, especialidad_id")
                 .in_("usuario_sistema_id", list(set(doctores_sin_especialidad)))
@@ -1053,7 +1580,7 @@ async def listar_pagos():
             especialidad_ids_adicionales = set(doctor_especialidades_dict.values()) - especialidad_ids
             if especialidad_ids_adicionales:
                 especialidades_adicionales_response = (
-                    supabase_client
+                    await supabase_async
                     .table("especialidad")
                     .select("id, nombre")
                     .in_("id", list(especialidad_ids_adicionales))
@@ -1064,7 +1591,7 @@ async def listar_pagos():
 
         # Ensamblar respuesta usando los diccionarios
         pagos_completos = []
-        for pago in pagos_response.data:
+        for pago in pagos:
             if not pago.get("cita_medica"):
                 continue
 
@@ -1092,8 +1619,10 @@ async def listar_pagos():
                     "especialidad": especialidad
                 })
 
-        return {"pagos": pagos_completos}
+        return {"pagos": pagos_completos, "siguiente_cursor": siguiente_cursor}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al listar pagos: {str(e)}")
 
@@ -1105,12 +1634,12 @@ async def obtener_ingresos(fecha: Optional[str] = None):
     Si se proporciona fecha, filtra por ese día.
     """
     try:
-        query = supabase_client.table("pagos").select("total, fecha_pago")
+        query = supabase_async.table("pagos").select("total, fecha_pago")
 
         if fecha:
             query = query.gte("fecha_pago", f"{fecha}T00:00:00").lte("fecha_pago", f"{fecha}T23:59:59")
 
-        pagos = query.execute()
+        pagos = await query.execute()
 
         if not pagos.data:
             return {
@@ -1139,21 +1668,15 @@ async def obtener_precio_especialidad(especialidad_id: int):
     Obtiene el precio de consulta de una especialidad.
     """
     try:
-        costo = (
-            supabase_client
-            .table("costos_servicio")
-            .select("id, servicio, precio")
-            .eq("especialidad_id", especialidad_id)
-            .execute()
-        )
+        costo = await obtener_costo_especialidad(especialidad_id)
 
-        if not costo.data:
+        if not costo:
             raise HTTPException(
                 status_code=404,
                 detail="No se encontró un precio para esta especialidad."
             )
 
-        return {"costo_servicio": costo.data[0]}
+        return {"costo_servicio": {"id": costo["id"], "servicio": costo["servicio"], "precio": costo["precio"]}}
 
     except HTTPException:
         raise
@@ -1182,12 +1705,13 @@ async def obtener_citas_doctor(
         
         # Construir query base CON especialidad incluida
         query = (
-            supabase_client
+            supabase_async
             .table("cita_medica")
             .select("""
                 id,
                 fecha_atencion,
                 especialidad_id,
+                estado_actual,
                 especialidad:especialidad_id(
                     id, nombre
                 ),
@@ -1195,7 +1719,8 @@ async def obtener_citas_doctor(
                     id, nombre, apellido_paterno, apellido_materno, 
                     fecha_nacimiento, telefono, rut, correo, sexo,
                     estado_civil, direccion, ocupacion, alergias
-                )
+                ),
+                informacion_cita(motivo_consulta)
             """)
             .eq("doctor_id", doctor_id)
         )
@@ -1219,50 +1744,33 @@ async def obtener_citas_doctor(
             
             query = query.gte("fecha_atencion", inicio_utc.isoformat()).lt("fecha_atencion", fin_utc.isoformat())
 
-        citas = query.order("fecha_atencion", desc=False).execute()
+        # Filtrar por estados en BD usando la columna denormalizada
+        lista_estados = estados.split(",") if estados else []
+        print(f"🔍 DEBUG - Lista de estados para filtrar: {lista_estados}")
+        if lista_estados:
+            query = query.in_("estado_actual", lista_estados)
+
+        citas = await query.order("fecha_atencion", desc=False).execute()
         
-        print(f"🔍 DEBUG - Citas encontradas (antes de filtrar por estado): {len(citas.data) if citas.data else 0}")
+        print(f"🔍 DEBUG - Citas encontradas: {len(citas.data) if citas.data else 0}")
 
         if not citas.data:
             return {"citas": []}
 
-        # Obtener estados y filtrar
-        lista_estados = estados.split(",") if estados else []
-        print(f"🔍 DEBUG - Lista de estados para filtrar: {lista_estados}")
         citas_filtradas = []
 
         for cita in citas.data:
-            # Obtener estado actual
-            estado_actual = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .order("id", desc=True)
-                .limit(1)
-                .execute()
-            )
-
-            estado_texto = estado_actual.data[0]["estado"] if estado_actual.data else "Sin estado"
-            print(f"🔍 DEBUG - Cita ID {cita['id']}: Estado = {estado_texto}")
+            estado_texto = cita.get("estado_actual") or "Sin estado"
 
-            # Filtrar por estados si se especificó
-            if lista_estados and estado_texto not in lista_estados:
-                continue
-
-            # Obtener información de la cita si existe
-            info_cita = (
-                supabase_client
-                .table("informacion_cita")
-                .select("motivo_consulta")
-                .eq("cita_medica_id", cita["id"])
-                .execute()
-            )
+            # Información de la cita viene embebida en la query principal
+            info_cita = cita.pop("informacion_cita", None)
+            if isinstance(info_cita, list):
+                info_cita = info_cita[0] if info_cita else None
 
             citas_filtradas.append({
                 **cita,
                 "estado_actual": estado_texto,
-                "motivo_consulta": info_cita.data[0]["motivo_consulta"] if info_cita.data else None
+                "motivo_consulta": info_cita.get("motivo_consulta") if info_cita else None
             })
 
         return {"citas": citas_filtradas}
@@ -1287,71 +1795,50 @@ async def obtener_stats_doctor(doctor_id: int, fecha: Optional[str] = None):
         print(f"🔍 DEBUG Stats - Doctor ID: {doctor_id}, Fecha: {fecha_actual}")
         
         # Intentar usar la función SQL optimizada
-        try:
-            resultado = supabase_client.rpc(
-                "obtener_stats_doctor",
-                {
-                    "p_doctor_id": doctor_id,
-                    "fecha_filtro": fecha_actual
-                }
-            ).execute()
+        resultado = await rpc_gateway.llamar(
+            "obtener_stats_doctor",
+            {
+                "p_doctor_id": doctor_id,
+                "fecha_filtro": fecha_actual
+            }
+        )
 
-            if resultado.data and len(resultado.data) > 0:
-                stats = resultado.data[0]
-                print(f"🔍 DEBUG Stats - Resultado: {stats}")
-                return stats
-        except Exception as rpc_error:
-            print(f"⚠️ RPC no disponible, usando fallback: {str(rpc_error)}")
+        if resultado and resultado.data and len(resultado.data) > 0:
+            stats = resultado.data[0]
+            print(f"🔍 DEBUG Stats - Resultado: {stats}")
+            return stats
 
         # FALLBACK: Query optimizada con bulk
-        # Obtener todas las citas del día
+        # Obtener todas las citas del día que tienen estado (columna denormalizada)
         citas_hoy = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
-            .select("id")
+            .select("id, estado_actual")
             .eq("doctor_id", doctor_id)
             .gte("fecha_atencion", f"{fecha_actual}T00:00:00-03:00")
             .lte("fecha_atencion", f"{fecha_actual}T23:59:59-03:00")
+            .not_.is_("estado_actual", "null")
             .execute()
         )
 
         print(f"🔍 DEBUG Stats - Citas hoy: {len(citas_hoy.data) if citas_hoy.data else 0}")
 
-        # Contar por estados con bulk query
+        # Contar por estados
         total_hoy = 0
         atendidos_hoy = 0
         pendientes_hoy = 0
         cancelados_hoy = 0
 
-        if citas_hoy.data:
-            citas_ids = [c["id"] for c in citas_hoy.data]
-            
-            # Bulk query de estados
-            estados = (
-                supabase_client
-                .table("estado")
-                .select("cita_medica_id, estado, id")
-                .in_("cita_medica_id", citas_ids)
-                .order("id", desc=True)
-                .execute()
-            )
-            
-            estados_dict = {}
-            for est in (estados.data or []):
-                if est["cita_medica_id"] not in estados_dict:
-                    estados_dict[est["cita_medica_id"]] = est["estado"]
-            
-            for cita in citas_hoy.data:
-                if cita["id"] in estados_dict:
-                    estado_actual = estados_dict[cita["id"]]
-                    total_hoy += 1
-                    
-                    if estado_actual == "Completada":
-                        atendidos_hoy += 1
-                    elif estado_actual in ["Pendiente", "Confirmada", "En Consulta"]:
-                        pendientes_hoy += 1
-                    elif estado_actual == "Cancelada":
-                        cancelados_hoy += 1
+        for cita in (citas_hoy.data or []):
+            estado_actual = cita["estado_actual"]
+            total_hoy += 1
+
+            if estado_actual == "Completada":
+                atendidos_hoy += 1
+            elif estado_actual in ["Pendiente", "Confirmada", "En Consulta"]:
+                pendientes_hoy += 1
+            elif estado_actual == "Cancelada":
+                cancelados_hoy += 1
 
         # Obtener total de pacientes del mes
         año_mes = fecha_actual[:7]  # YYYY-MM
@@ -1364,7 +1851,7 @@ async def obtener_stats_doctor(doctor_id: int, fecha: Optional[str] = None):
         print(f"🔍 DEBUG Stats - Buscando citas del mes: {año_mes}-01 al {año_mes}-{ultimo_dia}")
         
         citas_mes = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("paciente_id")
             .eq("doctor_id", doctor_id)
@@ -1409,9 +1896,9 @@ async def cambiar_estado_cita(cita_id: int, cambio: CambiarEstado):
     try:
         # Verificar que la cita existe
         cita = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
-            .select("id")
+            .select("id, doctor_id, fecha_atencion, estado_actual")
             .eq("id", cita_id)
             .execute()
         )
@@ -1420,14 +1907,34 @@ async def cambiar_estado_cita(cita_id: int, cambio: CambiarEstado):
             raise HTTPException(status_code=404, detail="La cita no existe.")
 
         # Crear nuevo estado
-        nuevo_estado = (
-            supabase_client
-            .table("estado")
-            .insert({
-                "estado": cambio.estado,
-                "cita_medica_id": cita_id
-            })
-            .execute()
+        try:
+            nuevo_estado = (
+                await supabase_async
+                .table("estado")
+                .insert({
+                    "estado": cambio.estado,
+                    "cita_medica_id": cita_id
+                })
+                .execute()
+            )
+        except Exception as e:
+            # Reactivar una cita cancelada cuyo bloque ya tomó otra cita
+            if es_reserva_duplicada(e):
+                raise HTTPException(
+                    status_code=409,
+                    detail="El horario de esta cita ya fue reservado por otra cita."
+                )
+            raise
+
+        _cita_modificada(cita.data[0]["doctor_id"], cita.data[0]["fecha_atencion"])
+        consultas_en_curso.registrar_estado(cita_id, cita.data[0]["doctor_id"], cambio.estado)
+        eventos_citas.publicar(
+            "estado_cambiado",
+            cita_id,
+            cita.data[0]["doctor_id"],
+            cita.data[0]["fecha_atencion"],
+            estado=cambio.estado,
+            estado_anterior=cita.data[0].get("estado_actual")
         )
 
         return {
@@ -1449,7 +1956,7 @@ async def obtener_detalle_completo_cita(cita_id: int):
     try:
         # Obtener cita con información del paciente y doctor
         cita = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("""
                 id,
@@ -1474,7 +1981,7 @@ async def obtener_detalle_completo_cita(cita_id: int):
 
         # Obtener estado actual
         estado = (
-            supabase_client
+            await supabase_async
             .table("estado")
             .select("estado")
             .eq("cita_medica_id", cita_id)
@@ -1485,7 +1992,7 @@ async def obtener_detalle_completo_cita(cita_id: int):
 
         # Obtener información de consulta
         info_cita = (
-            supabase_client
+            await supabase_async
             .table("informacion_cita")
             .select("*")
             .eq("cita_medica_id", cita_id)
@@ -1496,7 +2003,7 @@ async def obtener_detalle_completo_cita(cita_id: int):
         recetas = []
         if info_cita.data:
             recetas_data = (
-                supabase_client
+                await supabase_async
                 .table("receta")
                 .select("*")
                 .eq("informacion_cita_id", info_cita.data[0]["id"])
@@ -1517,147 +2024,220 @@ async def obtener_detalle_completo_cita(cita_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Columnas embebidas del historial médico (un solo SELECT con JOINs de PostgREST)
+def _select_historial(con_diagnosticos: bool) -> str:
+    diagnosticos = (
+        ",\n            informacion_cita_diagnostico(diagnostico:diagnostico_id(id, nombre_enfermedad))"
+        if con_diagnosticos else ""
+    )
+    return f"""
+        id,
+        fecha_atencion,
+        doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
+        especialidad:especialidad_id(id, nombre),
+        informacion_cita(
+            id,
+            motivo_consulta,
+            antecedentes,
+            dolores_sintomas,
+            atenciones_quirurgicas,
+            evaluacion_doctor,
+            tratamiento,
+            diagnostico:diagnostico_id(id, nombre_enfermedad),
+            receta(*){diagnosticos}
+        )
+    """
+
+
+# Proyección resumida para la línea de tiempo del historial
+SELECT_HISTORIAL_RESUMEN = """
+    id,
+    fecha_atencion,
+    doctor:doctor_id(id, nombre, apellido_paterno),
+    especialidad:especialidad_id(id, nombre),
+    informacion_cita(motivo_consulta, diagnostico:diagnostico_id(id, nombre_enfermedad))
+"""
+
+
+def _informacion_embebida(cita: dict) -> Optional[dict]:
+    # informacion_cita es 1 a 1 (UNIQUE cita_medica_id); según la versión de PostgREST llega como objeto o lista
+    info = cita.get("informacion_cita")
+    if isinstance(info, list):
+        return info[0] if info else None
+    return info
+
+
 @appointment_router.get("/paciente/{paciente_id}/historial-medico")
-async def obtener_historial_medico(paciente_id: int):
+async def obtener_historial_medico(
+    paciente_id: int,
+    limite: Optional[int] = Query(None, ge=1, le=100, description="Consultas por página (sin limite ni cursor se retorna todo)"),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la respuesta anterior"),
+    resumen: bool = Query(False, description="Solo fecha, doctor, especialidad, motivo y diagnóstico (línea de tiempo)")
+):
     """
-    Obtiene el historial médico completo de un paciente.
-    Retorna todas las consultas completadas con su información detallada.
+    Obtiene el historial médico de un paciente: sus consultas completadas, de la
+    más reciente a la más antigua, con información, diagnósticos y recetas.
+    OPTIMIZADO: un solo SELECT con JOINs embebidos (filtrando por estado_actual)
+    en vez de 4 consultas por cita. Con limite/cursor pagina por
+    (fecha_atencion, id) descendente en la base de datos.
     """
     try:
-        # Obtener todas las citas del paciente ordenadas por fecha (más reciente primero)
-        citas_response = (
-            supabase_client
-            .table("cita_medica")
-            .select("""
-                id,
-                fecha_atencion,
-                doctor_id,
-                especialidad_id,
-                doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
-                especialidad:especialidad_id(id, nombre)
-            """)
-            .eq("paciente_id", paciente_id)
-            .order("fecha_atencion", desc=True)
-            .execute()
-        )
-
-        if not citas_response.data:
-            return {"historial": []}
+        paginar = limite is not None or cursor is not None
+        if paginar:
+            limite = limite or 20
+
+        async def consultar(select: str):
+            query = (
+                supabase_async
+                .table("cita_medica")
+                .select(select)
+                .eq("paciente_id", paciente_id)
+                .eq("estado_actual", "Completada")
+            )
+            query = aplicar_cursor(query, cursor, "fecha_atencion", desc=True)
+            if paginar:
+                query = query.limit(limite + 1)
+            return await query.execute()
 
-        historial = []
+        if resumen:
+            citas_response = await consultar(SELECT_HISTORIAL_RESUMEN)
+        else:
+            try:
+                citas_response = await consultar(_select_historial(con_diagnosticos=True))
+            except APIError as e:
+                # Sin la migración 0008 no existe informacion_cita_diagnostico: solo el diagnóstico principal
+                print(f"⚠️ Historial sin diagnósticos múltiples: {e}")
+                citas_response = await consultar(_select_historial(con_diagnosticos=False))
 
-        for cita in citas_response.data:
-            # Obtener estado actual de la cita
-            estado_response = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .order("id", desc=True)
-                .limit(1)
-                .execute()
-            )
+        citas = citas_response.data or []
+        siguiente_cursor = None
+        if paginar:
+            citas, siguiente_cursor = cortar_pagina(citas, limite, "fecha_atencion")
 
-            estado_actual = estado_response.data[0]["estado"] if estado_response.data else "Sin estado"
+        historial = []
+        for cita in citas:
+            info_consulta = _informacion_embebida(cita) or {}
 
-            # Solo incluir citas completadas en el historial
-            if estado_actual != "Completada":
+            if resumen:
+                historial.append({
+                    "cita_id": cita["id"],
+                    "fecha_atencion": cita["fecha_atencion"],
+                    "doctor": cita.get("doctor"),
+                    "especialidad": cita.get("especialidad"),
+                    "motivo_consulta": info_consulta.get("motivo_consulta"),
+                    "diagnostico": info_consulta.get("diagnostico")
+                })
                 continue
 
-            # Obtener información de la consulta
-            info_consulta_response = (
-                supabase_client
-                .table("informacion_cita")
-                .select("*")
-                .eq("cita_medica_id", cita["id"])
-                .execute()
-            )
-
-            info_consulta = None
-            diagnostico = None
-            recetas = []
-
-            if info_consulta_response.data:
-                info_consulta = info_consulta_response.data[0]
-
-                # Obtener diagnóstico si existe
-                if info_consulta.get("diagnostico_id"):
-                    diagnostico_response = (
-                        supabase_client
-                        .table("diagnosticos")
-                        .select("id, nombre_enfermedad")
-                        .eq("id", info_consulta["diagnostico_id"])
-                        .execute()
-                    )
-                    if diagnostico_response.data:
-                        diagnostico = diagnostico_response.data[0]
-
-                # Obtener recetas
-                recetas_response = (
-                    supabase_client
-                    .table("receta")
-                    .select("*")
-                    .eq("informacion_cita_id", info_consulta["id"])
-                    .execute()
-                )
-                recetas = recetas_response.data if recetas_response.data else []
+            diagnosticos = [
+                enlace["diagnostico"]
+                for enlace in info_consulta.get("informacion_cita_diagnostico") or []
+                if enlace.get("diagnostico")
+            ]
+            if not diagnosticos and info_consulta.get("diagnostico"):
+                diagnosticos = [info_consulta["diagnostico"]]
 
-            # Construir objeto de consulta
-            consulta_data = {
+            historial.append({
                 "cita_id": cita["id"],
                 "fecha_atencion": cita["fecha_atencion"],
                 "doctor": cita.get("doctor"),
                 "especialidad": cita.get("especialidad"),
                 "informacion_consulta": {
-                    "motivo_consulta": info_consulta.get("motivo_consulta") if info_consulta else None,
-                    "antecedentes": info_consulta.get("antecedentes") if info_consulta else None,
-                    "dolores_sintomas": info_consulta.get("dolores_sintomas") if info_consulta else None,
-                    "atenciones_quirurgicas": info_consulta.get("atenciones_quirurgicas") if info_consulta else None,
-                    "evaluacion_doctor": info_consulta.get("evaluacion_doctor") if info_consulta else None,
-                    "tratamiento": info_consulta.get("tratamiento") if info_consulta else None,
-                    "diagnostico": diagnostico
+                    "motivo_consulta": info_consulta.get("motivo_consulta"),
+                    "antecedentes": info_consulta.get("antecedentes"),
+                    "dolores_sintomas": info_consulta.get("dolores_sintomas"),
+                    "atenciones_quirurgicas": info_consulta.get("atenciones_quirurgicas"),
+                    "evaluacion_doctor": info_consulta.get("evaluacion_doctor"),
+                    "tratamiento": info_consulta.get("tratamiento"),
+                    "diagnostico": info_consulta.get("diagnostico"),
+                    "diagnosticos": diagnosticos
                 },
-                "recetas": recetas
-            }
-
-            historial.append(consulta_data)
+                "recetas": info_consulta.get("receta") or []
+            })
 
-        return {"historial": historial}
+        return {
+            "historial": historial,
+            "hay_mas": siguiente_cursor is not None,
+            "siguiente_cursor": siguiente_cursor
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@appointment_router.put("/cita/{cita_id}/guardar-consulta")
-async def guardar_consulta(cita_id: int, consulta: GuardarConsulta):
+async def _guardar_consulta_por_pasos(cita_id: int, datos_info: dict, diagnostico_ids: List[int], recetas: List[dict]) -> dict:
     """
-    Guarda o actualiza la información de una consulta (borrador o final).
+    Fallback de guardar_consulta cuando la función SQL no está disponible: upsert
+    de la información y diff de recetas con escrituras en bloque (sin transacción).
     """
-    try:
-        # Verificar que la cita existe
-        cita = (
-            supabase_client
-            .table("cita_medica")
-            .select("id")
-            .eq("id", cita_id)
-            .execute()
+    # Cita y diagnósticos: lecturas independientes, en paralelo
+    consultas = [supabase_async.table("cita_medica").select("id").eq("id", cita_id).execute()]
+    if diagnostico_ids:
+        consultas.append(
+            supabase_async.table("diagnosticos").select("id").in_("id", diagnostico_ids).execute()
         )
+    resultados = await asyncio.gather(*consultas)
+
+    if not resultados[0].data:
+        raise HTTPException(status_code=404, detail="La cita no existe.")
+
+    if diagnostico_ids and len(resultados[1].data or []) != len(diagnostico_ids):
+        raise HTTPException(status_code=400, detail=ERRORES_GUARDAR_CONSULTA["diagnostico_inexistente"][1])
+
+    # informacion_cita tiene UNIQUE (cita_medica_id): crear o actualizar en una escritura
+    info = await supabase_async.table("informacion_cita").upsert(
+        {"cita_medica_id": cita_id, **datos_info, "diagnostico_id": diagnostico_ids[0] if diagnostico_ids else None},
+        on_conflict="cita_medica_id"
+    ).execute()
+    info_cita_id = info.data[0]["id"]
+
+    actuales = await supabase_async.table("receta").select("*").eq("informacion_cita_id", info_cita_id).execute()
+    eliminar, insertar = diferencia_recetas(actuales.data or [], recetas)
+    if eliminar:
+        await supabase_async.table("receta").delete().in_("id", eliminar).execute()
+    if insertar:
+        await supabase_async.table("receta").insert(
+            [{**receta, "informacion_cita_id": info_cita_id} for receta in insertar]
+        ).execute()
 
-        if not cita.data:
-            raise HTTPException(status_code=404, detail="La cita no existe.")
+    try:
+        borrar = supabase_async.table("informacion_cita_diagnostico").delete().eq("informacion_cita_id", info_cita_id)
+        if diagnostico_ids:
+            borrar = borrar.not_.in_("diagnostico_id", diagnostico_ids)
+        await borrar.execute()
+        if diagnostico_ids:
+            await supabase_async.table("informacion_cita_diagnostico").upsert(
+                [{"informacion_cita_id": info_cita_id, "diagnostico_id": d} for d in diagnostico_ids],
+                on_conflict="informacion_cita_id,diagnostico_id",
+                ignore_duplicates=True
+            ).execute()
+    except Exception as e:
+        # Sin la migración 0008 solo se guarda el diagnóstico principal
+        print(f"⚠️ No se pudieron guardar todos los diagnósticos de la consulta {cita_id}: {e}")
+
+    return {
+        "informacion_cita_id": info_cita_id,
+        "diagnostico_ids": diagnostico_ids,
+        "recetas": {
+            "insertadas": len(insertar),
+            "eliminadas": len(eliminar),
+            "sin_cambios": len(recetas) - len(insertar)
+        }
+    }
 
-        # Verificar si ya existe información de la cita
-        info_existente = (
-            supabase_client
-            .table("informacion_cita")
-            .select("id")
-            .eq("cita_medica_id", cita_id)
-            .execute()
-        )
 
-        # Preparar datos para información de cita
+@appointment_router.put("/cita/{cita_id}/guardar-consulta")
+async def guardar_consulta(cita_id: int, consulta: GuardarConsulta):
+    """
+    Guarda o actualiza la información de una consulta (borrador o final).
+    OPTIMIZADO: una sola llamada a la función SQL guardar_consulta, que guarda
+    información, todos los diagnósticos y las recetas en una transacción. Las
+    recetas se comparan con las guardadas y solo se escriben las que cambiaron.
+    """
+    try:
         datos_info = {
-            "cita_medica_id": cita_id,
             "motivo_consulta": consulta.motivo_consulta,
             "antecedentes": consulta.antecedentes,
             "dolores_sintomas": consulta.dolores_sintomas or "No aplica dolor",
@@ -1665,51 +2245,30 @@ async def guardar_consulta(cita_id: int, consulta: GuardarConsulta):
             "evaluacion_doctor": consulta.evaluacion_doctor,
             "tratamiento": consulta.tratamiento
         }
-
-        # Manejar diagnósticos (tomar el primero si hay varios)
-        if consulta.diagnostico_ids and len(consulta.diagnostico_ids) > 0:
-            datos_info["diagnostico_id"] = consulta.diagnostico_ids[0]
-
-        info_cita_id = None
-
-        if info_existente.data:
-            # Actualizar información existente
-            info_actualizada = (
-                supabase_client
-                .table("informacion_cita")
-                .update(datos_info)
-                .eq("id", info_existente.data[0]["id"])
-                .execute()
-            )
-            info_cita_id = info_existente.data[0]["id"]
-
-            # Eliminar recetas anteriores
-            supabase_client.table("receta").delete().eq("informacion_cita_id", info_cita_id).execute()
+        # Sin repetidos y en el orden recibido: el primero es el diagnóstico principal
+        diagnostico_ids = list(dict.fromkeys(consulta.diagnostico_ids or []))
+        recetas = [receta.model_dump() for receta in (consulta.recetas or [])]
+
+        resultado = await rpc_gateway.llamar("guardar_consulta", {
+            "p_cita_id": cita_id,
+            "p_informacion": datos_info,
+            "p_diagnostico_ids": diagnostico_ids,
+            "p_recetas": recetas
+        }, escritura=True)
+
+        if resultado is None:
+            guardado = await _guardar_consulta_por_pasos(cita_id, datos_info, diagnostico_ids, recetas)
         else:
-            # Crear nueva información de cita
-            nueva_info = (
-                supabase_client
-                .table("informacion_cita")
-                .insert(datos_info)
-                .execute()
-            )
-            info_cita_id = nueva_info.data[0]["id"]
-
-        # Guardar recetas si existen
-        if consulta.recetas:
-            for receta in consulta.recetas:
-                supabase_client.table("receta").insert({
-                    "nombre": receta.nombre,
-                    "presentacion": receta.presentacion,
-                    "dosis": receta.dosis,
-                    "duracion": receta.duracion,
-                    "cantidad": receta.cantidad,
-                    "informacion_cita_id": info_cita_id
-                }).execute()
+            guardado = resultado.data or {}
+            if guardado.get("error"):
+                status_code, detalle = ERRORES_GUARDAR_CONSULTA.get(
+                    guardado["error"], (500, f"No se pudo guardar la consulta: {guardado['error']}")
+                )
+                raise HTTPException(status_code=status_code, detail=detalle)
 
         return {
             "mensaje": "Consulta guardada exitosamente.",
-            "informacion_cita_id": info_cita_id
+            **guardado
         }
 
     except HTTPException:
@@ -1724,15 +2283,17 @@ async def listar_diagnosticos():
     Lista todos los diagnósticos disponibles.
     """
     try:
-        diagnosticos = (
-            supabase_client
-            .table("diagnosticos")
-            .select("id, nombre_enfermedad")
-            .order("nombre_enfermedad", desc=False)
-            .execute()
-        )
+        async def cargar():
+            diagnosticos = (
+                await supabase_async
+                .table("diagnosticos")
+                .select("id, nombre_enfermedad")
+                .order("nombre_enfermedad", desc=False)
+                .execute()
+            )
+            return diagnosticos.data or []
 
-        return {"diagnosticos": diagnosticos.data if diagnosticos.data else []}
+        return {"diagnosticos": await cache_catalogos.obtener("diagnosticos", "nombres", cargar)}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1743,225 +2304,265 @@ async def obtener_cita_en_consulta(doctor_id: int):
     """
     Obtiene la cita que está actualmente en consulta para un doctor.
     Retorna None si no hay ninguna cita en consulta.
+    OPTIMIZADO: búsqueda O(1) en el mapa en memoria doctor -> cita en consulta
+    (ver src.utils.consultas_en_curso), sin consultar el historial del doctor.
     """
     try:
-        # Obtener todas las citas del doctor
-        citas = (
-            supabase_client
-            .table("cita_medica")
-            .select("id, fecha_atencion")
-            .eq("doctor_id", doctor_id)
-            .execute()
-        )
+        return {"cita_en_consulta": await consultas_en_curso.cita_de(doctor_id)}
 
-        if not citas.data:
-            return {"cita_en_consulta": None}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Buscar la que esté en consulta
-        for cita in citas.data:
-            estado = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .order("id", desc=True)
-                .limit(1)
-                .execute()
-            )
 
-            if estado.data and estado.data[0]["estado"] == "En Consulta":
-                return {"cita_en_consulta": cita["id"]}
+def _edad(fecha_nacimiento) -> Optional[int]:
+    if not fecha_nacimiento:
+        return None
+    try:
+        nacimiento = date.fromisoformat(str(fecha_nacimiento)[:10])
+    except ValueError:
+        return None
+    hoy = date.today()
+    return hoy.year - nacimiento.year - ((hoy.month, hoy.day) < (nacimiento.month, nacimiento.day))
+
+
+def _paciente_atendido(fila: dict) -> dict:
+    return {
+        "id": fila["id"],
+        "nombre": fila.get("nombre") or "",
+        "apellido_paterno": fila.get("apellido_paterno") or "",
+        "apellido_materno": fila.get("apellido_materno") or "",
+        "nombre_completo": f"{fila.get('nombre') or ''} {fila.get('apellido_paterno') or ''} {fila.get('apellido_materno') or ''}".strip(),
+        "rut": fila.get("rut") or "",
+        "edad": fila.get("edad"),
+        "ultima_atencion": fila["ultima_atencion"],
+        "consultas_completadas": fila["consultas_completadas"]
+    }
 
-        return {"cita_en_consulta": None}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-        costo = (
-            supabase_client
-            .table("costos_servicio")
-            .select("precio, servicio")
-            .eq("especialidad_id", especialidad_id)
-            .execute()
-        )
+@appointment_router.get("/doctor/{doctor_id}/pacientes-atendidos")
+async def obtener_pacientes_atendidos(
+    doctor_id: int,
+    busqueda: Optional[str] = Query(None, description="Filtra por nombre, apellidos o RUT"),
+    limite: Optional[int] = Query(None, ge=1, le=200, description="Pacientes por página (sin limite se retornan todos)"),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Obtiene la lista de pacientes únicos que un doctor ha atendido (consultas completadas).
+    Retorna información básica del paciente, la fecha de última atención y la
+    cantidad de consultas, de la atención más reciente a la más antigua.
+    OPTIMIZADO: función SQL sobre doctor_paciente_resumen (mantenida por trigger
+    al completar citas), con búsqueda y paginación en la base de datos (con fallback).
+    """
+    try:
+        busqueda = (busqueda or "").strip()
+
+        resultado = await rpc_gateway.llamar("pacientes_atendidos", {
+            "p_doctor_id": doctor_id,
+            "p_busqueda": busqueda or None,
+            "p_limite": limite,
+            "p_offset": offset
+        })
+
+        if resultado is not None:
+            filas = resultado.data or []
+            total = filas[0]["total"] if filas else 0
+            if not filas and offset:
+                # Página fuera de rango: el total sale de la primera fila, que aquí no existe
+                total = None
+            pacientes = [_paciente_atendido(fila) for fila in filas]
+        else:
+            # FALLBACK: citas completadas del doctor, leídas por páginas (max_rows de
+            # PostgREST truncaría una sola consulta) y agregadas en memoria
+            citas = []
+            while True:
+                pagina = (
+                    await supabase_async
+                    .table("cita_medica")
+                    .select("""
+                        id,
+                        fecha_atencion,
+                        paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, rut, fecha_nacimiento)
+                    """)
+                    .eq("doctor_id", doctor_id)
+                    .eq("estado_actual", "Completada")
+                    .order("fecha_atencion", desc=True)
+                    .order("id", desc=True)
+                    .range(len(citas), len(citas) + TAMANO_PAGINA_FALLBACK - 1)
+                    .execute()
+                )
+                citas.extend(pagina.data or [])
+                if len(pagina.data or []) < TAMANO_PAGINA_FALLBACK:
+                    break
+
+            pacientes_map = {}
+            for cita in citas:
+                paciente = cita.get("paciente")
+                if not paciente:
+                    continue
+                if paciente["id"] in pacientes_map:
+                    pacientes_map[paciente["id"]]["consultas_completadas"] += 1
+                    continue
+                # Las citas vienen de la más reciente a la más antigua
+                pacientes_map[paciente["id"]] = _paciente_atendido({
+                    **paciente,
+                    "edad": _edad(paciente.get("fecha_nacimiento")),
+                    "ultima_atencion": cita["fecha_atencion"],
+                    "consultas_completadas": 1
+                })
 
-        if not costo.data:
-            raise HTTPException(status_code=404, detail="No se encontró el precio para esta especialidad.")
+            pacientes = list(pacientes_map.values())
+            if busqueda:
+                termino = busqueda.lower()
+                pacientes = [
+                    p for p in pacientes
+                    if termino in p["nombre_completo"].lower() or termino in p["rut"].lower()
+                ]
+            total = len(pacientes)
+            pacientes = pacientes[offset:offset + limite] if limite else pacientes[offset:]
 
         return {
-            "precio": costo.data[0]["precio"],
-            "servicio": costo.data[0]["servicio"]
+            "pacientes": pacientes,
+            "total": total,
+            "hay_mas": limite is not None and total is not None and offset + len(pacientes) < total
         }
 
-    except HTTPException:
-        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@appointment_router.get("/doctor/{doctor_id}/pacientes-atendidos")
-async def obtener_pacientes_atendidos(doctor_id: int):
+# ============== ENDPOINTS PARA SECRETARIA ==============
+
+async def _citas_del_dia(fecha: date) -> List[dict]:
     """
-    Obtiene la lista de pacientes únicos que un doctor ha atendido (consultas completadas).
-    Retorna información básica del paciente y la fecha de última atención.
+    Citas de un día de Chile (medianoche a medianoche en America/Santiago, con el
+    cambio de horario resuelto por zoneinfo) con paciente, doctor, especialidad y
+    estado_actual, en una sola consulta. Cacheado TABLERO_TTL_SEGUNDOS.
     """
-    try:
-        # Obtener todas las citas completadas del doctor
-        citas_response = (
-            supabase_client
+    async def cargar():
+        inicio = datetime.combine(fecha, datetime.min.time(), tzinfo=ZONA_CHILE)
+        fin = datetime.combine(fecha + timedelta(days=1), datetime.min.time(), tzinfo=ZONA_CHILE)
+        citas = (
+            await supabase_async
             .table("cita_medica")
             .select("""
                 id,
                 fecha_atencion,
-                paciente_id,
-                paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, rut, fecha_nacimiento)
+                estado_actual,
+                paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, rut, telefono),
+                doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
+                especialidad:especialidad_id(id, nombre)
             """)
-            .eq("doctor_id", doctor_id)
-            .order("fecha_atencion", desc=True)
+            .gte("fecha_atencion", inicio.isoformat())
+            .lt("fecha_atencion", fin.isoformat())
+            .order("fecha_atencion", desc=False)
+            .order("id", desc=False)
             .execute()
         )
+        return [{**cita, "estado_actual": cita.get("estado_actual") or "Sin estado"} for cita in citas.data or []]
 
-        if not citas_response.data:
-            return {"pacientes": []}
+    return await cache_tablero.obtener("tablero_hoy", fecha.isoformat(), cargar)
 
-        # Diccionario para almacenar pacientes únicos con su última consulta
-        pacientes_map = {}
 
-        for cita in citas_response.data:
-            # Verificar que la cita esté completada
-            estado_response = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .order("id", desc=True)
-                .limit(1)
-                .execute()
-            )
+def _filtrar_estados(citas: List[dict], estados: List[str]) -> List[dict]:
+    buscados = {estado.strip().lower() for estado in estados if estado.strip()}
+    if not buscados:
+        return citas
+    return [cita for cita in citas if cita["estado_actual"].lower() in buscados]
 
-            if not estado_response.data or estado_response.data[0]["estado"] != "Completada":
-                continue
 
-            paciente = cita.get("paciente")
-            if not paciente:
-                continue
+@appointment_router.get("/hoy/tablero")
+async def obtener_tablero_hoy(
+    estados: Optional[str] = Query(None, description="Estados separados por comas, ej: 'Pendiente,Confirmada'"),
+    fecha: Optional[str] = Query(None, description="Día a consultar (YYYY-MM-DD); por defecto hoy en Chile")
+):
+    """
+    Tablero del día para recepción: citas del día (hora de Chile) con su estado
+    actual, filtro por uno o varios estados y cantidad de citas por estado.
+    OPTIMIZADO: una sola consulta (estado_actual desnormalizado), compartida entre
+    los terminales durante TABLERO_HOY_TTL_SEGUNDOS; filtro y conteos en memoria.
+    """
+    try:
+        if fecha:
+            try:
+                dia = date.fromisoformat(fecha)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+        else:
+            dia = datetime.now(ZONA_CHILE).date()
 
-            paciente_id = paciente["id"]
+        citas_dia = await _citas_del_dia(dia)
 
-            # Si el paciente no está en el map o esta cita es más reciente, actualizar
-            if paciente_id not in pacientes_map:
-                # Calcular edad
-                edad = None
-                if paciente.get("fecha_nacimiento"):
-                    try:
-                        fecha_nac = datetime.strptime(str(paciente["fecha_nacimiento"]), "%Y-%m-%d")
-                        hoy = datetime.now()
-                        edad = hoy.year - fecha_nac.year - ((hoy.month, hoy.day) < (fecha_nac.month, fecha_nac.day))
-                    except:
-                        edad = None
-
-                pacientes_map[paciente_id] = {
-                    "id": paciente["id"],
-                    "nombre": paciente.get("nombre", ""),
-                    "apellido_paterno": paciente.get("apellido_paterno", ""),
-                    "apellido_materno": paciente.get("apellido_materno", ""),
-                    "nombre_completo": f"{paciente.get('nombre', '')} {paciente.get('apellido_paterno', '')} {paciente.get('apellido_materno', '')}".strip(),
-                    "rut": paciente.get("rut", ""),
-                    "edad": edad,
-                    "ultima_atencion": cita["fecha_atencion"]
-                }
+        conteo_por_estado: dict = {}
+        for cita in citas_dia:
+            conteo_por_estado[cita["estado_actual"]] = conteo_por_estado.get(cita["estado_actual"], 0) + 1
 
-        # Convertir a lista y ordenar por última atención (más reciente primero)
-        pacientes_list = list(pacientes_map.values())
-        pacientes_list.sort(key=lambda x: x["ultima_atencion"], reverse=True)
+        citas = _filtrar_estados(citas_dia, estados.split(",") if estados else [])
 
-        return {"pacientes": pacientes_list}
+        return {
+            "fecha": dia.isoformat(),
+            "citas": citas,
+            "total": len(citas),
+            "total_dia": len(citas_dia),
+            "conteo_por_estado": conteo_por_estado
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ============== ENDPOINTS PARA SECRETARIA ==============
+@appointment_router.get("/eventos")
+async def suscribir_eventos_citas(
+    request: Request,
+    doctor_id: Optional[int] = Query(None, description="Solo eventos de las citas de este doctor"),
+    fecha: Optional[str] = Query(None, description="Solo eventos de citas de este día (YYYY-MM-DD, hora de Chile)"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Eventos de citas por Server-Sent Events (text/event-stream), para que el tablero
+    de recepción y el panel del doctor se actualicen sin polling.
+    Tipos: cita_creada, estado_cambiado, cita_modificada, pago_registrado y
+    resincronizar (el cliente debe recargar con los endpoints normales).
+    Al reconectar, el navegador envía Last-Event-ID y se reenvían los eventos perdidos.
+    """
+    dia = None
+    if fecha:
+        try:
+            dia = date.fromisoformat(fecha)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Use YYYY-MM-DD")
+
+    async def flujo():
+        eventos = eventos_citas.escuchar(doctor_id=doctor_id, fecha=dia, ultimo_id=last_event_id)
+        try:
+            async for evento in eventos:
+                if await request.is_disconnected():
+                    break
+                yield formato_sse(evento)
+        finally:
+            await eventos.aclose()
+
+    return StreamingResponse(
+        flujo(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @appointment_router.get("/hoy/pendientes")
 async def obtener_citas_pendientes_hoy():
     """
     Obtiene todas las citas del día actual en estado 'Pendiente'.
     Retorna información de paciente, doctor, especialidad y hora.
-    OPTIMIZADO: Usa función SQL con filtrado directo (con fallback).
+    Usa los datos compartidos del tablero del día (ver /hoy/tablero).
     """
     try:
-        from datetime import datetime
-        import pytz
-
-        # Obtener fecha actual en zona horaria de Chile
-        tz_chile = pytz.timezone('America/Santiago')
-        ahora_chile = datetime.now(tz_chile)
-        fecha_actual = ahora_chile.date().isoformat()
-
-        # Intentar usar la función SQL optimizada
-        try:
-            resultado = supabase_client.rpc(
-                "obtener_citas_pendientes_hoy",
-                {"fecha_filtro": fecha_actual}
-            ).execute()
-
-            if resultado.data:
-                return {"citas": resultado.data}
-        except Exception as rpc_error:
-            print(f"⚠️ RPC no disponible, usando fallback: {str(rpc_error)}")
-
-        # FALLBACK: Query optimizada con bulk
-        citas = (
-            supabase_client
-            .table("cita_medica")
-            .select("""
-                id,
-                fecha_atencion,
-                paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, rut, telefono),
-                doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
-                especialidad:especialidad_id(id, nombre)
-            """)
-            .gte("fecha_atencion", f"{fecha_actual}T00:00:00-03:00")
-            .lte("fecha_atencion", f"{fecha_actual}T23:59:59-03:00")
-            .order("fecha_atencion", desc=False)
-            .execute()
-        )
-
-        if not citas.data:
-            return {"citas": []}
-
-        # Obtener estados en bulk
-        citas_ids = [c["id"] for c in citas.data]
-        estados = (
-            supabase_client
-            .table("estado")
-            .select("cita_medica_id, estado, id")
-            .in_("cita_medica_id", citas_ids)
-            .order("id", desc=True)
-            .execute()
-        )
-
-        estados_dict = {}
-        for est in (estados.data or []):
-            if est["cita_medica_id"] not in estados_dict:
-                estados_dict[est["cita_medica_id"]] = est["estado"]
-
-        # Filtrar solo pendientes
-        citas_pendientes = []
-        for cita in citas.data:
-            estado_actual = estados_dict.get(cita["id"], "Sin estado")
-            if estado_actual.lower() == "pendiente":
-                citas_pendientes.append({
-                    **cita,
-                    "estado_actual": estado_actual
-                })
-
-        return {"citas": citas_pendientes}
+        citas = await _citas_del_dia(datetime.now(ZONA_CHILE).date())
+        return {"citas": _filtrar_estados(citas, ["Pendiente"])}
 
     except Exception as e:
         print(f"❌ Error en hoy/pendientes: {str(e)}")
-        import traceback
-        traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1970,57 +2571,11 @@ async def obtener_citas_confirmadas_hoy():
     """
     Obtiene todas las citas del día actual en estado 'Confirmada'.
     Retorna información de paciente, doctor, especialidad y hora.
+    Usa los datos compartidos del tablero del día (ver /hoy/tablero).
     """
     try:
-        from datetime import date as date_module
-
-        # Obtener fecha actual
-        fecha_actual = date_module.today().isoformat()
-
-        # Obtener todas las citas del día
-        citas_hoy = (
-            supabase_client
-            .table("cita_medica")
-            .select("""
-                id,
-                fecha_atencion,
-                paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, rut, telefono),
-                doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
-                especialidad:especialidad_id(id, nombre)
-            """)
-            .gte("fecha_atencion", f"{fecha_actual}T00:00:00")
-            .lte("fecha_atencion", f"{fecha_actual}T23:59:59")
-            .order("fecha_atencion", desc=False)
-            .execute()
-        )
-
-        if not citas_hoy.data:
-            return {"citas": []}
-
-        citas_confirmadas = []
-
-        for cita in citas_hoy.data:
-            # Obtener estado actual
-            estado = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .order("id", desc=True)
-                .limit(1)
-                .execute()
-            )
-
-            estado_texto = estado.data[0]["estado"] if estado.data else "Sin estado"
-
-            # Solo incluir si está en estado Confirmada (case-insensitive)
-            if estado_texto.lower() == "confirmada":
-                citas_confirmadas.append({
-                    **cita,
-                    "estado_actual": estado_texto
-                })
-
-        return {"citas": citas_confirmadas}
+        citas = await _citas_del_dia(datetime.now(ZONA_CHILE).date())
+        return {"citas": _filtrar_estados(citas, ["Confirmada"])}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2031,55 +2586,10 @@ async def obtener_todas_citas_hoy():
     """
     Obtiene todas las citas del día actual con sus estados.
     Útil para ver el panorama completo del día.
+    Usa los datos compartidos del tablero del día (ver /hoy/tablero).
     """
     try:
-        from datetime import date as date_module
-
-        # Obtener fecha actual
-        fecha_actual = date_module.today().isoformat()
-
-        # Obtener todas las citas del día
-        citas_hoy = (
-            supabase_client
-            .table("cita_medica")
-            .select("""
-                id,
-                fecha_atencion,
-                paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno, rut, telefono),
-                doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno),
-                especialidad:especialidad_id(id, nombre)
-            """)
-            .gte("fecha_atencion", f"{fecha_actual}T00:00:00")
-            .lte("fecha_atencion", f"{fecha_actual}T23:59:59")
-            .order("fecha_atencion", desc=False)
-            .execute()
-        )
-
-        if not citas_hoy.data:
-            return {"citas": []}
-
-        citas_con_estado = []
-
-        for cita in citas_hoy.data:
-            # Obtener estado actual
-            estado = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .order("id", desc=True)
-                .limit(1)
-                .execute()
-            )
-
-            estado_texto = estado.data[0]["estado"] if estado.data else "Sin estado"
-
-            citas_con_estado.append({
-                **cita,
-                "estado_actual": estado_texto
-            })
-
-        return {"citas": citas_con_estado}
+        return {"citas": await _citas_del_dia(datetime.now(ZONA_CHILE).date())}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2107,21 +2617,18 @@ async def obtener_actividad_reciente(fecha: Optional[str] = None):
             fecha_filtro = fecha
 
         # Intentar usar la función SQL optimizada
-        try:
-            resultado = supabase_client.rpc(
-                "obtener_actividad_reciente",
-                {"fecha_filtro": fecha_filtro}
-            ).execute()
+        resultado = await rpc_gateway.llamar(
+            "obtener_actividad_reciente",
+            {"fecha_filtro": fecha_filtro}
+        )
 
-            if resultado.data and len(resultado.data) > 0:
-                return resultado.data[0]
-        except Exception as rpc_error:
-            print(f"⚠️ RPC no disponible, usando fallback: {str(rpc_error)}")
+        if resultado and resultado.data and len(resultado.data) > 0:
+            return resultado.data[0]
 
         # FALLBACK: Query optimizada con bulk
         # Obtener pagos del día con JOIN
         pagos = (
-            supabase_client
+            await supabase_async
             .table("pagos")
             .select("""
                 id,
@@ -2154,11 +2661,12 @@ async def obtener_actividad_reciente(fecha: Optional[str] = None):
 
         # Obtener citas del día con JOINs
         citas = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("""
                 id,
                 fecha_atencion,
+                estado_actual,
                 paciente:paciente_id(id, nombre, apellido_paterno, apellido_materno),
                 doctor:doctor_id(id, nombre, apellido_paterno, apellido_materno)
             """)
@@ -2169,31 +2677,10 @@ async def obtener_actividad_reciente(fecha: Optional[str] = None):
             .execute()
         )
 
-        # Obtener estados en bulk
-        if citas.data:
-            citas_ids = [c["id"] for c in citas.data]
-            estados = (
-                supabase_client
-                .table("estado")
-                .select("cita_medica_id, estado, id")
-                .in_("cita_medica_id", citas_ids)
-                .order("id", desc=True)
-                .execute()
-            )
-
-            estados_dict = {}
-            for est in (estados.data or []):
-                if est["cita_medica_id"] not in estados_dict:
-                    estados_dict[est["cita_medica_id"]] = est["estado"]
-
-            citas_con_estado = []
-            for cita in citas.data:
-                citas_con_estado.append({
-                    **cita,
-                    "estado_actual": estados_dict.get(cita["id"], "Sin estado")
-                })
-        else:
-            citas_con_estado = []
+        citas_con_estado = [
+            {**cita, "estado_actual": cita.get("estado_actual") or "Sin estado"}
+            for cita in (citas.data or [])
+        ]
 
         return {
             "pagos_recientes": pagos_con_info,
@@ -2240,12 +2727,13 @@ async def obtener_productividad_mensual(doctor_id: int, mes: int, anio: int):
         
         # Query OPTIMIZADO: Una sola consulta con JOINs
         citas_response = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("""
                 id,
                 fecha_atencion,
                 especialidad_id,
+                estado_actual,
                 especialidad:especialidad_id(
                     id, nombre
                 ),
@@ -2275,29 +2763,11 @@ async def obtener_productividad_mensual(doctor_id: int, mes: int, anio: int):
                 }
             }
         
-        # Obtener estados en BULK (una sola query)
         citas_ids = [c["id"] for c in citas]
-        estados_response = (
-            supabase_client
-            .table("estado")
-            .select("cita_medica_id, estado, id")
-            .in_("cita_medica_id", citas_ids)
-            .order("id", desc=True)
-            .execute()
-        )
-        
-        # Crear diccionario de estados (último estado por cita)
-        estados_dict = {}
-        for estado in (estados_response.data or []):
-            cita_id = estado["cita_medica_id"]
-            if cita_id not in estados_dict:
-                estados_dict[cita_id] = estado["estado"]
-        
-        print(f"✅ Estados recuperados para {len(estados_dict)} citas")
-        
+
         # Obtener pagos en BULK (una sola query)
         pagos_response = (
-            supabase_client
+            await supabase_async
             .table("pagos")
             .select("id, total, fecha_pago, cita_medica_id")
             .in_("cita_medica_id", citas_ids)
@@ -2323,7 +2793,7 @@ async def obtener_productividad_mensual(doctor_id: int, mes: int, anio: int):
         
         for cita in citas:
             cita_id = cita["id"]
-            estado = estados_dict.get(cita_id, "Sin estado")
+            estado = cita.get("estado_actual") or "Sin estado"
             pagos_cita = pagos_dict.get(cita_id, [])
             monto_total_cita = sum(float(p["total"]) for p in pagos_cita)
             
@@ -6,7 +6,7 @@ from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import List, Optional
 from datetime import datetime, date, time, timedelta, timezone
 from zoneinfo import ZoneInfo
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
 from src.models.asistencia import (
     MarcaAsistenciaCreate, MarcaAsistenciaResponse,
     JustificacionCreate, EstadoAsistenciaResponse,
@@ -65,7 +65,7 @@ async def obtener_turnos_trabajados(
         fecha_inicio_ampliada = fecha_consulta - timedelta(days=1)
         fecha_fin_ampliada = fecha_consulta + timedelta(days=1)
         
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("*, usuario:usuario_sistema_id(id, nombre, apellido_paterno, apellido_materno, rut, email, celular)") \
             .gte("inicio_bloque", f"{fecha_inicio_ampliada}T00:00:00") \
             .lte("finalizacion_bloque", f"{fecha_fin_ampliada}T23:59:59") \
@@ -115,7 +115,7 @@ async def obtener_turnos_trabajados(
         
         # PASO 2: Obtener TODAS las asistencias de estos doctores (sin filtro de fecha)
         # Para asociar correctamente asistencias con turnos programados
-        asistencias_response = supabase_client.from_("asistencia") \
+        asistencias_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .in_("usuario_sistema_id", doctor_ids) \
             .gte("inicio_turno", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -133,7 +133,7 @@ async def obtener_turnos_trabajados(
                     asistencias_dict[doctor_id] = asist
         
         # PASO 3: Obtener especialidades de todos los doctores (bulk query)
-        especialidades_response = supabase_client.from_("especialidades_doctor") \
+        especialidades_response = await supabase_async.from_("especialidades_doctor") \
             .select("usuario_sistema_id, especialidad:especialidad_id(nombre)") \
             .in_("usuario_sistema_id", doctor_ids) \
             .execute()
@@ -170,7 +170,7 @@ async def obtener_turnos_trabajados(
         fecha_inicio_utc = datetime.combine(fecha_consulta, time.min).replace(tzinfo=chile_tz).astimezone(timezone.utc)
         fecha_fin_utc = datetime.combine(fecha_consulta, time.max).replace(tzinfo=chile_tz).astimezone(timezone.utc)
         
-        pacientes_response = supabase_client.from_("cita_medica") \
+        pacientes_response = await supabase_async.from_("cita_medica") \
             .select("doctor_id, fecha_atencion") \
             .in_("doctor_id", doctor_ids) \
             .gte("fecha_atencion", fecha_inicio_utc.isoformat()) \
@@ -340,7 +340,7 @@ async def obtener_turnos_dia(
         fecha_inicio_ampliada = fecha_consulta - timedelta(days=1)
         fecha_fin_ampliada = fecha_consulta + timedelta(days=1)
         
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("*, usuario:usuario_sistema_id(id, nombre, apellido_paterno, apellido_materno, rut, email, celular)") \
             .gte("inicio_bloque", f"{fecha_inicio_ampliada}T00:00:00") \
             .lte("inicio_bloque", f"{fecha_fin_ampliada}T23:59:59") \
@@ -387,7 +387,7 @@ async def obtener_turnos_dia(
         fecha_inicio_ampliada = fecha_consulta - timedelta(days=1)
         fecha_fin_ampliada = fecha_consulta + timedelta(days=1)
         
-        asistencias_response = supabase_client.from_("asistencia") \
+        asistencias_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .in_("usuario_sistema_id", doctor_ids) \
             .gte("inicio_turno", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -404,7 +404,7 @@ async def obtener_turnos_dia(
                     asistencias_dict[asist['usuario_sistema_id']] = asist
         
         # OPTIMIZACIÓN 3: Bulk query de especialidades de TODOS los doctores
-        especialidades_response = supabase_client.from_("especialidades_doctor") \
+        especialidades_response = await supabase_async.from_("especialidades_doctor") \
             .select("usuario_sistema_id, especialidad:especialidad_id(nombre)") \
             .in_("usuario_sistema_id", doctor_ids) \
             .execute()
@@ -420,7 +420,7 @@ async def obtener_turnos_dia(
                     especialidades_dict[doctor_id].append(esp['especialidad']['nombre'])
         
         # OPTIMIZACIÓN 4: Bulk query de pacientes de TODOS los doctores (ampliar rango)
-        pacientes_response = supabase_client.from_("cita_medica") \
+        pacientes_response = await supabase_async.from_("cita_medica") \
             .select("doctor_id, fecha_atencion") \
             .in_("doctor_id", doctor_ids) \
             .gte("fecha_atencion", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -605,7 +605,7 @@ async def registrar_entrada(usuario_sistema_id: int):
     """Registra la entrada (inicio de turno) de un doctor."""
     try:
         # Verificar turno activo
-        turno_activo = supabase_client.from_("asistencia").select("id").eq("usuario_sistema_id", usuario_sistema_id).is_("finalizacion_turno", "null").execute()
+        turno_activo = await supabase_async.from_("asistencia").select("id").eq("usuario_sistema_id", usuario_sistema_id).is_("finalizacion_turno", "null").execute()
         
         if turno_activo.data:
             raise HTTPException(status_code=409, detail="Ya tiene un turno activo")
@@ -616,7 +616,7 @@ async def registrar_entrada(usuario_sistema_id: int):
             "inicio_turno": datetime.now(timezone.utc).isoformat()
         }
         
-        resultado = supabase_client.from_("asistencia").insert(nuevo_registro).execute()
+        resultado = await supabase_async.from_("asistencia").insert(nuevo_registro).execute()
         
         return {"mensaje": "Entrada registrada", "asistencia": resultado.data[0]}
     except HTTPException:
@@ -630,7 +630,7 @@ async def registrar_salida(asistencia_id: int):
     """Registra la salida (finalización de turno) de un doctor."""
     try:
         # Verificar registro
-        registro = supabase_client.from_("asistencia").select("*").eq("id", asistencia_id).execute()
+        registro = await supabase_async.from_("asistencia").select("*").eq("id", asistencia_id).execute()
         
         if not registro.data:
             raise HTTPException(status_code=404, detail="Registro no encontrado")
@@ -639,7 +639,7 @@ async def registrar_salida(asistencia_id: int):
             raise HTTPException(status_code=409, detail="Turno ya finalizado")
         
         # Registrar finalización
-        resultado = supabase_client.from_("asistencia").update({"finalizacion_turno": datetime.now(timezone.utc).isoformat()}).eq("id", asistencia_id).execute()
+        resultado = await supabase_async.from_("asistencia").update({"finalizacion_turno": datetime.now(timezone.utc).isoformat()}).eq("id", asistencia_id).execute()
         
         return {"mensaje": "Salida registrada", "asistencia": resultado.data[0]}
     except HTTPException:
@@ -665,7 +665,7 @@ async def obtener_detalle_completo_doctor(
     
     try:
         # 1. Datos básicos del doctor
-        doctor_response = supabase_client.from_("usuario_sistema") \
+        doctor_response = await supabase_async.from_("usuario_sistema") \
             .select("id, nombre, apellido_paterno, apellido_materno, rut, email") \
             .eq("id", doctor_id) \
             .single() \
@@ -677,7 +677,7 @@ async def obtener_detalle_completo_doctor(
         doctor_data = doctor_response.data
         
         # 2. Especialidades
-        esp_response = supabase_client.from_("especialidades_doctor") \
+        esp_response = await supabase_async.from_("especialidades_doctor") \
             .select("especialidad:especialidad_id(nombre)") \
             .eq("usuario_sistema_id", doctor_id) \
             .execute()
@@ -687,7 +687,7 @@ async def obtener_detalle_completo_doctor(
             especialidades = [e["especialidad"]["nombre"] for e in esp_response.data if e.get("especialidad")]
         
         # 3. Horario programado del día
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("*") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_bloque", f"{fecha_consulta}T00:00:00") \
@@ -706,7 +706,7 @@ async def obtener_detalle_completo_doctor(
             }
         
         # 4. Asistencia del día (entrada/salida real)
-        asist_response = supabase_client.from_("asistencia") \
+        asist_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_turno", f"{fecha_consulta}T00:00:00") \
@@ -736,7 +736,7 @@ async def obtener_detalle_completo_doctor(
                 minutos_trabajados = int((ahora - inicio_real).total_seconds() / 60)
         
         # 5. Pacientes del día
-        pacientes_response = supabase_client.from_("cita_medica") \
+        pacientes_response = await supabase_async.from_("cita_medica") \
             .select("id, fecha_atencion, paciente:paciente_id(nombre, apellido_paterno)") \
             .eq("doctor_id", doctor_id) \
             .gte("fecha_atencion", f"{fecha_consulta}T00:00:00") \
@@ -749,7 +749,7 @@ async def obtener_detalle_completo_doctor(
         pacientes_atendidos = 0
         if pacientes_response.data:
             citas_ids = [c['id'] for c in pacientes_response.data]
-            estados_response = supabase_client.from_("estado") \
+            estados_response = await supabase_async.from_("estado") \
                 .select("cita_medica_id, estado") \
                 .in_("cita_medica_id", citas_ids) \
                 .eq("estado", "COMPLETADA") \
@@ -848,7 +848,7 @@ async def obtener_estadisticas_periodo(
     
     try:
         # 1. ASISTENCIA: Obtener todos los horarios programados en el período
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("inicio_bloque, finalizacion_bloque") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_bloque", f"{fecha_inicio}T00:00:00") \
@@ -865,7 +865,7 @@ async def obtener_estadisticas_periodo(
         total_dias_turno = len(dias_con_turno)
         
         # 2. Obtener asistencias en el período
-        asistencias_response = supabase_client.from_("asistencia") \
+        asistencias_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_turno", f"{fecha_inicio}T00:00:00") \
@@ -878,7 +878,7 @@ async def obtener_estadisticas_periodo(
         dias_asistio = len(asistencias_data)
         
         # 3. Obtener justificaciones
-        estados_response = supabase_client.from_("asistencia_estados") \
+        estados_response = await supabase_async.from_("asistencia_estados") \
             .select("*, asistencia:asistencia_id(inicio_turno)") \
             .in_("asistencia_id", [a['id'] for a in asistencias_data]) \
             .execute()
@@ -898,7 +898,7 @@ async def obtener_estadisticas_periodo(
             fecha_asist = asistencia['inicio_turno'][:10]
             
             # Buscar horario programado ese día
-            horario_dia = supabase_client.from_("horarios_personal") \
+            horario_dia = await supabase_async.from_("horarios_personal") \
                 .select("*") \
                 .eq("usuario_sistema_id", doctor_id) \
                 .gte("inicio_bloque", f"{fecha_asist}T00:00:00") \
@@ -930,7 +930,7 @@ async def obtener_estadisticas_periodo(
         peor_atraso = max(atrasos) if atrasos else 0
         
         # 5. PACIENTES
-        pacientes_response = supabase_client.from_("cita_medica") \
+        pacientes_response = await supabase_async.from_("cita_medica") \
             .select("id, fecha_atencion") \
             .eq("doctor_id", doctor_id) \
             .gte("fecha_atencion", f"{fecha_inicio}T00:00:00") \
@@ -943,7 +943,7 @@ async def obtener_estadisticas_periodo(
         pacientes_atendidos = 0
         if pacientes_response.data:
             citas_ids = [c['id'] for c in pacientes_response.data]
-            estados_pac = supabase_client.from_("estado") \
+            estados_pac = await supabase_async.from_("estado") \
                 .select("*") \
                 .in_("cita_medica_id", citas_ids) \
                 .eq("estado", "COMPLETADA") \
@@ -1006,7 +1006,7 @@ async def obtener_historial_diario(
     
     try:
         # 1. Obtener todas las asistencias en el rango
-        asistencias_response = supabase_client.from_("asistencia") \
+        asistencias_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_turno", f"{fecha_desde}T00:00:00") \
@@ -1021,7 +1021,7 @@ async def obtener_historial_diario(
             fecha_dia = asist['inicio_turno'][:10]
             
             # Horario programado ese día
-            horarios = supabase_client.from_("horarios_personal") \
+            horarios = await supabase_async.from_("horarios_personal") \
                 .select("*") \
                 .eq("usuario_sistema_id", doctor_id) \
                 .gte("inicio_bloque", f"{fecha_dia}T00:00:00") \
@@ -1047,7 +1047,7 @@ async def obtener_historial_diario(
             
             # Justificación (si existe)
             justificacion = None
-            estado_response = supabase_client.from_("asistencia_estados") \
+            estado_response = await supabase_async.from_("asistencia_estados") \
                 .select("*") \
                 .eq("asistencia_id", asist['id']) \
                 .execute()
@@ -1057,7 +1057,7 @@ async def obtener_historial_diario(
                     justificacion = estado_response.data[0].get('justificacion')
             
             # Pacientes ese día
-            pacientes = supabase_client.from_("cita_medica") \
+            pacientes = await supabase_async.from_("cita_medica") \
                 .select("id", count="exact") \
                 .eq("doctor_id", doctor_id) \
                 .gte("fecha_atencion", f"{fecha_dia}T00:00:00") \
@@ -1070,7 +1070,7 @@ async def obtener_historial_diario(
             pacientes_atendidos = 0
             if pacientes.data:
                 citas_ids = [p['id'] for p in pacientes.data]
-                estados_pac = supabase_client.from_("estado") \
+                estados_pac = await supabase_async.from_("estado") \
                     .select("*", count="exact") \
                     .in_("cita_medica_id", citas_ids) \
                     .eq("estado", "COMPLETADA") \
@@ -1118,7 +1118,7 @@ async def obtener_justificaciones_doctor(doctor_id: int):
     """
     try:
         # Obtener todas las asistencias del doctor
-        asistencias = supabase_client.from_("asistencia") \
+        asistencias = await supabase_async.from_("asistencia") \
             .select("id, inicio_turno") \
             .eq("usuario_sistema_id", doctor_id) \
             .execute()
@@ -1129,7 +1129,7 @@ async def obtener_justificaciones_doctor(doctor_id: int):
         asist_ids = [a['id'] for a in asistencias.data]
         
         # Obtener estados justificados
-        estados = supabase_client.from_("asistencia_estados") \
+        estados = await supabase_async.from_("asistencia_estados") \
             .select("*") \
             .in_("asistencia_id", asist_ids) \
             .eq("estado", "JUSTIFICADO") \
@@ -1174,7 +1174,7 @@ async def agregar_justificacion_doctor(
     """
     try:
         # Verificar que la asistencia existe y pertenece al doctor
-        asist = supabase_client.from_("asistencia") \
+        asist = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("id", asistencia_id) \
             .eq("usuario_sistema_id", doctor_id) \
@@ -1195,20 +1195,20 @@ async def agregar_justificacion_doctor(
         }
         
         # Verificar si ya existe
-        existing = supabase_client.from_("asistencia_estados") \
+        existing = await supabase_async.from_("asistencia_estados") \
             .select("id") \
             .eq("asistencia_id", asistencia_id) \
             .execute()
         
         if existing.data:
             # Actualizar
-            result = supabase_client.from_("asistencia_estados") \
+            result = await supabase_async.from_("asistencia_estados") \
                 .update(estado_data) \
                 .eq("asistencia_id", asistencia_id) \
                 .execute()
         else:
             # Insertar
-            result = supabase_client.from_("asistencia_estados") \
+            result = await supabase_async.from_("asistencia_estados") \
                 .insert(estado_data) \
                 .execute()
         
@@ -1239,7 +1239,7 @@ async def obtener_mi_turno_hoy(
         fecha_inicio_ampliada = fecha_consulta - timedelta(days=1)
         fecha_fin_ampliada = fecha_consulta + timedelta(days=1)
         
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("*") \
             .eq("usuario_sistema_id", usuario_id) \
             .gte("inicio_bloque", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -1269,7 +1269,7 @@ async def obtener_mi_turno_hoy(
         fin_turno = ultimo_bloque['finalizacion_bloque']
         
         # Buscar asistencia registrada (ampliar rango para cubrir horarios que cruzan medianoche)
-        asistencia_response = supabase_client.from_("asistencia") \
+        asistencia_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", usuario_id) \
             .gte("inicio_turno", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -1353,7 +1353,7 @@ async def marcar_entrada_doctor(
         fecha_inicio_ampliada = fecha_hoy - timedelta(days=1)
         fecha_fin_ampliada = fecha_hoy + timedelta(days=1)
         
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("*") \
             .eq("usuario_sistema_id", usuario_id) \
             .gte("inicio_bloque", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -1372,7 +1372,7 @@ async def marcar_entrada_doctor(
             raise HTTPException(status_code=400, detail="No tienes turno programado para hoy")
         
         # Verificar que no haya marcado ya (ampliar rango)
-        asistencia_response = supabase_client.from_("asistencia") \
+        asistencia_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", usuario_id) \
             .gte("inicio_turno", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -1393,7 +1393,7 @@ async def marcar_entrada_doctor(
             "finalizacion_turno": None
         }
         
-        result = supabase_client.from_("asistencia") \
+        result = await supabase_async.from_("asistencia") \
             .insert(asistencia_data) \
             .execute()
         
@@ -1425,7 +1425,7 @@ async def marcar_salida_doctor(
         fecha_inicio_ampliada = fecha_hoy - timedelta(days=1)
         fecha_fin_ampliada = fecha_hoy + timedelta(days=1)
         
-        asistencia_response = supabase_client.from_("asistencia") \
+        asistencia_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", usuario_id) \
             .gte("inicio_turno", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -1448,7 +1448,7 @@ async def marcar_salida_doctor(
             raise HTTPException(status_code=400, detail="Ya marcaste salida hoy")
         
         # Registrar salida
-        result = supabase_client.from_("asistencia") \
+        result = await supabase_async.from_("asistencia") \
             .update({"finalizacion_turno": ahora.isoformat()}) \
             .eq("id", asistencia['id']) \
             .execute()
@@ -1490,7 +1490,7 @@ async def obtener_historial_reciente_doctor(
         fecha_inicio_utc = datetime.combine(fecha_inicio, time.min).replace(tzinfo=chile_tz).astimezone(timezone.utc)
         fecha_fin_utc = datetime.combine(fecha_fin, time.max).replace(tzinfo=chile_tz).astimezone(timezone.utc)
         
-        asistencias_response = supabase_client.from_("asistencia") \
+        asistencias_response = await supabase_async.from_("asistencia") \
             .select("*") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_turno", fecha_inicio_utc.isoformat()) \
@@ -1502,7 +1502,7 @@ async def obtener_historial_reciente_doctor(
             return {"turnos": [], "total": 0}
         
         # PASO 2: Obtener info del doctor (una sola vez)
-        doctor_response = supabase_client.from_("usuario_sistema") \
+        doctor_response = await supabase_async.from_("usuario_sistema") \
             .select("id, nombre, apellido_paterno, apellido_materno, rut, email, celular") \
             .eq("id", doctor_id) \
             .single() \
@@ -1514,7 +1514,7 @@ async def obtener_historial_reciente_doctor(
         doctor_data = doctor_response.data
         
         # PASO 3: Obtener especialidades
-        especialidades_response = supabase_client.from_("especialidades_doctor") \
+        especialidades_response = await supabase_async.from_("especialidades_doctor") \
             .select("especialidad:especialidad_id(nombre)") \
             .eq("usuario_sistema_id", doctor_id) \
             .execute()
@@ -1541,7 +1541,7 @@ async def obtener_historial_reciente_doctor(
         fecha_inicio_ampliada = fecha_inicio - timedelta(days=1)
         fecha_fin_ampliada = fecha_fin + timedelta(days=1)
         
-        horarios_response = supabase_client.from_("horarios_personal") \
+        horarios_response = await supabase_async.from_("horarios_personal") \
             .select("inicio_bloque, finalizacion_bloque") \
             .eq("usuario_sistema_id", doctor_id) \
             .gte("inicio_bloque", f"{fecha_inicio_ampliada}T00:00:00") \
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, status
 from src.models.auth import LoginRequest, LoginResponse, UserData
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
 from typing import Dict
 import bcrypt
 import secrets
@@ -28,7 +28,7 @@ async def login(credentials: LoginRequest):
     try:
         # 1. Obtener información del usuario desde la tabla usuario_sistema
         user_query = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, nombre, apellido_paterno, apellido_materno, email, rut, rol_id, rol(id, nombre)")
             .eq("email", credentials.email)
@@ -45,7 +45,7 @@ async def login(credentials: LoginRequest):
 
         # 2. Verificar la contraseña desde la tabla contraseñas
         password_query = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .select("contraseña, contraseña_temporal")
             .eq("id_profesional_salud", user_info["id"])
@@ -146,7 +146,7 @@ async def login(credentials: LoginRequest):
 
         if rol_normalizado == "medico":
             especialidad_query = (
-                supabase_client
+                await supabase_async
                 .table("especialidades_doctor")
                 .select("especialidad_id, especialidad(id, nombre)")
                 .eq("usuario_sistema_id", user_info["id"])
@@ -229,7 +229,7 @@ async def cambiar_contrasena_temporal(data: dict):
 
         # Actualizar en la base de datos: establecer contraseña y eliminar contraseña temporal
         update_result = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .update({
                 "contraseña": hashed_password,
@@ -275,7 +275,7 @@ async def debug_roles():
     """
     try:
         roles_query = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .select("*")
             .execute()
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException
-from src.utils.supabase import supabase_client
+from fastapi import APIRouter, HTTPException, Depends
+from src.utils.supabase_async import supabase_async
+from src.utils.estado_loader import EstadoCitaLoader, obtener_estado_loader
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any
 
@@ -17,7 +18,7 @@ async def obtener_estadisticas():
     try:
         # 1. Total de pacientes
         pacientes = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .select("id", count="exact")
             .execute()
@@ -30,7 +31,7 @@ async def obtener_estadisticas():
         hoy_fin = f"{hoy}T23:59:59"
 
         citas_hoy = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("id", count="exact")
             .gte("fecha_atencion", hoy_inicio)
@@ -41,7 +42,7 @@ async def obtener_estadisticas():
 
         # 3. Doctores activos (usuarios con rol_id=2 que es médico)
         doctores = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id", count="exact")
             .eq("rol_id", 2)
@@ -54,7 +55,7 @@ async def obtener_estadisticas():
         ultimo_dia_mes = (primer_dia_mes + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
 
         pagos_mes = (
-            supabase_client
+            await supabase_async
             .table("pagos")
             .select("total")
             .gte("fecha_pago", primer_dia_mes.isoformat())
@@ -72,7 +73,7 @@ async def obtener_estadisticas():
 
         # Pacientes del mes anterior
         pacientes_mes_anterior = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .select("id", count="exact")
             .execute()
@@ -84,7 +85,7 @@ async def obtener_estadisticas():
         dia_anterior_fin = f"{dia_mes_anterior}T23:59:59"
 
         citas_dia_anterior = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("id", count="exact")
             .gte("fecha_atencion", dia_anterior_inicio)
@@ -95,7 +96,7 @@ async def obtener_estadisticas():
 
         # Ingresos del mes anterior
         pagos_mes_anterior = (
-            supabase_client
+            await supabase_async
             .table("pagos")
             .select("total")
             .gte("fecha_pago", mes_anterior_inicio.isoformat())
@@ -134,7 +135,10 @@ async def obtener_estadisticas():
 
 
 @dashboard_router.get("/citas-recientes")
-async def obtener_citas_recientes(limite: int = 5):
+async def obtener_citas_recientes(
+    limite: int = 5,
+    estado_loader: EstadoCitaLoader = Depends(obtener_estado_loader)
+):
     """
     Obtiene las citas más recientes con información del paciente, doctor y estado.
     """
@@ -143,7 +147,7 @@ async def obtener_citas_recientes(limite: int = 5):
         hoy = datetime.now()
 
         citas = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("""
                 id,
@@ -157,20 +161,12 @@ async def obtener_citas_recientes(limite: int = 5):
             .execute()
         )
 
+        # Estado actual de todas las citas en una sola consulta
+        estados_actuales = await estado_loader.load_many(cita["id"] for cita in citas.data)
+
         citas_formateadas = []
         for cita in citas.data:
-            # Obtener el estado de la cita
-            estado_result = (
-                supabase_client
-                .table("estado")
-                .select("estado")
-                .eq("cita_medica_id", cita["id"])
-                .execute()
-            )
-
-            estado = "En espera"
-            if estado_result.data and len(estado_result.data) > 0:
-                estado = estado_result.data[0].get("estado", "En espera")
+            estado = estados_actuales.get(cita["id"]) or "En espera"
 
             # Formatear fecha
             fecha_atencion = datetime.fromisoformat(cita["fecha_atencion"].replace('Z', '+00:00'))
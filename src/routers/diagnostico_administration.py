@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query
 from src.models.diagnosticos import Diagnostico
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
+from src.utils.cache_catalogos import cache_catalogos
 
 diagnostico_router = APIRouter(tags=["Funciones de diagnósticos"], prefix="/Diagnosticos")
 
@@ -14,7 +15,7 @@ async def crear_diagnostico(diagnostico: Diagnostico):
     try:
         # Verificar si ya existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .select("id, nombre_enfermedad")
             .eq("nombre_enfermedad", diagnostico.nombre_enfermedad)
@@ -28,7 +29,7 @@ async def crear_diagnostico(diagnostico: Diagnostico):
 
         # Insertar nuevo diagnóstico
         nuevo = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .insert({
                 "nombre_enfermedad": diagnostico.nombre_enfermedad,
@@ -36,6 +37,7 @@ async def crear_diagnostico(diagnostico: Diagnostico):
             })
             .execute()
         )
+        cache_catalogos.invalidar("diagnosticos")
         if not nuevo.data:
             raise HTTPException(status_code=500, detail="No se pudo insertar el diagnóstico.")
 
@@ -60,7 +62,7 @@ async def modificar_diagnostico(diagnostico_id: int, diagnostico: Diagnostico):
     try:
         # Verificar existencia
         existente = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .select("id, nombre_enfermedad")
             .eq("id", diagnostico_id)
@@ -72,7 +74,7 @@ async def modificar_diagnostico(diagnostico_id: int, diagnostico: Diagnostico):
 
         # Verificar duplicado de nombre (otro diagnóstico con mismo nombre)
         duplicado = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .select("id")
             .eq("nombre_enfermedad", diagnostico.nombre_enfermedad)
@@ -87,7 +89,7 @@ async def modificar_diagnostico(diagnostico_id: int, diagnostico: Diagnostico):
 
         # Actualizar datos
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .update({
                 "nombre_enfermedad": diagnostico.nombre_enfermedad,
@@ -97,6 +99,7 @@ async def modificar_diagnostico(diagnostico_id: int, diagnostico: Diagnostico):
             .execute()
         )
 
+        cache_catalogos.invalidar("diagnosticos")
         if not actualizado.data:
             raise HTTPException(status_code=500, detail="No se pudo actualizar el diagnóstico.")
 
@@ -121,7 +124,7 @@ async def eliminar_diagnostico(diagnostico_id: int):
     try:
         # Verificar existencia
         existe = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .select("id, nombre_enfermedad")
             .eq("id", diagnostico_id)
@@ -134,7 +137,7 @@ async def eliminar_diagnostico(diagnostico_id: int):
 
         # Verificar si está siendo usado en informacion_cita
         usado = (
-            supabase_client
+            await supabase_async
             .table("informacion_cita")
             .select("id")
             .eq("diagnostico_id", diagnostico_id)
@@ -149,13 +152,14 @@ async def eliminar_diagnostico(diagnostico_id: int):
 
         # Eliminar el diagnóstico
         eliminado = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .delete()
             .eq("id", diagnostico_id)
             .execute()
         )
 
+        cache_catalogos.invalidar("diagnosticos")
         if not eliminado.data:
             raise HTTPException(status_code=500, detail="No se pudo eliminar el diagnóstico.")
 
@@ -182,46 +186,54 @@ async def listar_diagnosticos(
     - search: Buscar por nombre de enfermedad o descripción (opcional)
     """
     try:
-        # Construir query base
-        query = supabase_client.table("diagnosticos").select("*", count="exact")
-        
-        # Aplicar búsqueda si se especifica
-        if search and search.strip():
-            search_term = search.strip()
-            # Buscar en nombre y descripción
-            query = query.or_(
-                f"nombre_enfermedad.ilike.%{search_term}%,"
-                f"descripcion_enfermedad.ilike.%{search_term}%"
+        async def cargar():
+            # Construir query base
+            query = supabase_async.table("diagnosticos").select("*", count="exact")
+
+            # Aplicar búsqueda si se especifica
+            if search and search.strip():
+                search_term = search.strip()
+                # Buscar en nombre y descripción
+                query = query.or_(
+                    f"nombre_enfermedad.ilike.%{search_term}%,"
+                    f"descripcion_enfermedad.ilike.%{search_term}%"
+                )
+
+            # Calcular offset para la paginación
+            offset = (page - 1) * limit
+
+            # Ejecutar query con paginación
+            res = (
+                await query
+                .order("id", desc=False)
+                .range(offset, offset + limit - 1)
+                .execute()
             )
-        
-        # Calcular offset para la paginación
-        offset = (page - 1) * limit
-        
-        # Ejecutar query con paginación
-        res = (
-            query
-            .order("id", desc=False)
-            .range(offset, offset + limit - 1)
-            .execute()
-        )
-        
-        diagnosticos = res.data or []
-        total_count = res.count if hasattr(res, 'count') else len(diagnosticos)
-        
-        # Calcular total de páginas
-        total_pages = (total_count + limit - 1) // limit
-        
-        return {
-            "diagnosticos": diagnosticos,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": total_count,
-                "total_pages": total_pages,
-                "has_next": page < total_pages,
-                "has_prev": page > 1
+
+            diagnosticos = res.data or []
+            total_count = res.count if hasattr(res, 'count') else len(diagnosticos)
+
+            # Calcular total de páginas
+            total_pages = (total_count + limit - 1) // limit
+
+            return {
+                "diagnosticos": diagnosticos,
+                "pagination": {
+                    "page": page,
+                    "limit": limit,
+                    "total": total_count,
+                    "total_pages": total_pages,
+                    "has_next": page < total_pages,
+                    "has_prev": page > 1
+                }
             }
-        }
+
+        # Cada combinación de página/búsqueda se cachea por separado
+        return await cache_catalogos.obtener(
+            "diagnosticos",
+            ("pagina", page, limit, (search or "").strip().lower()),
+            cargar
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -236,7 +248,7 @@ async def estadisticas_diagnosticos():
     try:
         # Total de diagnósticos
         total = (
-            supabase_client
+            await supabase_async
             .table("diagnosticos")
             .select("id", count="exact")
             .execute()
@@ -245,7 +257,7 @@ async def estadisticas_diagnosticos():
         
         # Diagnósticos más usados (top 5)
         diagnosticos_usados = (
-            supabase_client
+            await supabase_async
             .table("informacion_cita")
             .select("diagnostico_id")
             .execute()
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
+from src.utils.cache_catalogos import cache_catalogos
 from src.models.users import Especialidad, SubEspecialidad, VinculoEspSub
 
 doctor_router = APIRouter(tags=["Funciones de administración de doctores"], prefix="/doctores")
@@ -11,15 +12,16 @@ doctor_router = APIRouter(tags=["Funciones de administración de doctores"], pre
 @doctor_router.post("/crear-especialidad")
 async def crear_especialidad(especialidad: Especialidad):
     try:
-        existe = supabase_client.table("especialidad").select("id").eq("nombre", especialidad.nombre).execute()
+        existe = await supabase_async.table("especialidad").select("id").eq("nombre", especialidad.nombre).execute()
         if existe.data:
             raise HTTPException(status_code=409, detail=f"La especialidad '{especialidad.nombre}' ya existe.")
 
         # Crear la especialidad
-        creado_esp = supabase_client.table("especialidad").insert({
+        creado_esp = await supabase_async.table("especialidad").insert({
             "nombre": especialidad.nombre,
             "descripcion": especialidad.descripcion
         }).execute()
+        cache_catalogos.invalidar("especialidad", "costos_servicio")
         if not creado_esp.data:
             raise HTTPException(status_code=500, detail="No se pudo insertar la especialidad.")
 
@@ -27,13 +29,14 @@ async def crear_especialidad(especialidad: Especialidad):
 
         # Si se proporcionó un precio, crear el registro en costos_servicio
         if especialidad.precio is not None and especialidad.precio > 0:
-            supabase_client.table("costos_servicio").insert({
+            await supabase_async.table("costos_servicio").insert({
                 "servicio": f"Consulta {especialidad.nombre}",
                 "precio": especialidad.precio,
                 "especialidad_id": especialidad_id
             }).execute()
+            cache_catalogos.invalidar("costos_servicio")
 
-        lista = supabase_client.table("especialidad").select("id,nombre,descripcion").order("id").execute()
+        lista = await supabase_async.table("especialidad").select("id,nombre,descripcion").order("id").execute()
         return {"mensaje": f"Especialidad '{especialidad.nombre}' creada.", "especialidades": lista.data}
     except HTTPException:
         raise
@@ -44,38 +47,40 @@ async def crear_especialidad(especialidad: Especialidad):
 @doctor_router.put("/modificar-especialidad/{especialidad_id}")
 async def modificar_especialidad(especialidad_id: int, especialidad: Especialidad):
     try:
-        existe = supabase_client.table("especialidad").select("id").eq("id", especialidad_id).execute()
+        existe = await supabase_async.table("especialidad").select("id").eq("id", especialidad_id).execute()
         if not existe.data:
             raise HTTPException(status_code=404, detail=f"No existe la especialidad con ID {especialidad_id}.")
 
-        duplicado = (supabase_client.table("especialidad")
+        duplicado = (await supabase_async.table("especialidad")
                      .select("id").eq("nombre", especialidad.nombre).neq("id", especialidad_id).execute())
         if duplicado.data:
             raise HTTPException(status_code=409, detail=f"Ya existe otra especialidad con nombre '{especialidad.nombre}'.")
 
-        act = (supabase_client.table("especialidad")
+        act = (await supabase_async.table("especialidad")
                .update({"nombre": especialidad.nombre, "descripcion": especialidad.descripcion})
                .eq("id", especialidad_id).execute())
+        cache_catalogos.invalidar("especialidad", "costos_servicio")
         if not act.data:
             raise HTTPException(status_code=500, detail="No se pudo actualizar la especialidad.")
 
         # Actualizar o crear el precio en costos_servicio
         if especialidad.precio is not None:
-            costo_existe = supabase_client.table("costos_servicio").select("id").eq("especialidad_id", especialidad_id).execute()
+            costo_existe = await supabase_async.table("costos_servicio").select("id").eq("especialidad_id", especialidad_id).execute()
 
             if costo_existe.data:
                 # Actualizar precio existente
-                supabase_client.table("costos_servicio").update({
+                await supabase_async.table("costos_servicio").update({
                     "servicio": f"Consulta {especialidad.nombre}",
                     "precio": especialidad.precio
                 }).eq("especialidad_id", especialidad_id).execute()
             else:
                 # Crear nuevo precio
-                supabase_client.table("costos_servicio").insert({
+                await supabase_async.table("costos_servicio").insert({
                     "servicio": f"Consulta {especialidad.nombre}",
                     "precio": especialidad.precio,
                     "especialidad_id": especialidad_id
                 }).execute()
+            cache_catalogos.invalidar("costos_servicio")
 
         return {"mensaje": f"Especialidad '{especialidad.nombre}' modificada.", "especialidad": act.data[0]}
     except HTTPException:
@@ -87,30 +92,31 @@ async def modificar_especialidad(especialidad_id: int, especialidad: Especialida
 @doctor_router.delete("/eliminar-especialidad/{especialidad_id}")
 async def eliminar_especialidad(especialidad_id: int):
     try:
-        esp = supabase_client.table("especialidad").select("id,nombre").eq("id", especialidad_id).execute()
+        esp = await supabase_async.table("especialidad").select("id,nombre").eq("id", especialidad_id).execute()
         if not esp.data:
             raise HTTPException(status_code=404, detail=f"No existe la especialidad con ID {especialidad_id}.")
         nombre = esp.data[0]["nombre"]
 
 
         # Bloquea si hay vínculos o referencias
-        ref_vinculos = (supabase_client.table("especialidad_con_subespecialidad")
+        ref_vinculos = (await supabase_async.table("especialidad_con_subespecialidad")
                         .select("id").eq("especialidad_id", especialidad_id).limit(1).execute())
         if ref_vinculos.data:
             raise HTTPException(status_code=409, detail=f"No puedes eliminar '{nombre}' porque tiene subespecialidades vinculadas.")
 
         # Cambiado: revisa si hay usuarios asignados a la especialidad en especialidades_doctor
-        ref_users = (supabase_client.table("especialidades_doctor")
+        ref_users = (await supabase_async.table("especialidades_doctor")
                      .select("id").eq("especialidad_id", especialidad_id).limit(1).execute())
         if ref_users.data:
             raise HTTPException(status_code=409, detail=f"No puedes eliminar '{nombre}' porque está asignada a usuarios.")
 
-        ref_costos = (supabase_client.table("costos_servicio")
+        ref_costos = (await supabase_async.table("costos_servicio")
                       .select("id").eq("especialidad_id", especialidad_id).limit(1).execute())
         if ref_costos.data:
             raise HTTPException(status_code=409, detail=f"No puedes eliminar '{nombre}' porque está referenciada por costos de servicio.")
 
-        delr = supabase_client.table("especialidad").delete().eq("id", especialidad_id).execute()
+        delr = await supabase_async.table("especialidad").delete().eq("id", especialidad_id).execute()
+        cache_catalogos.invalidar("especialidad", "costos_servicio")
         if not delr.data:
             raise HTTPException(status_code=500, detail="No se pudo eliminar la especialidad.")
 
@@ -127,18 +133,18 @@ async def eliminar_especialidad(especialidad_id: int):
 @doctor_router.post("/crear-subespecialidad")
 async def crear_subespecialidad(sub: SubEspecialidad):
     try:
-        existe = supabase_client.table("sub_especialidad").select("id").eq("nombre", sub.nombre).execute()
+        existe = await supabase_async.table("sub_especialidad").select("id").eq("nombre", sub.nombre).execute()
         if existe.data:
             raise HTTPException(status_code=409, detail=f"La subespecialidad '{sub.nombre}' ya existe.")
 
-        creado = supabase_client.table("sub_especialidad").insert({
+        creado = await supabase_async.table("sub_especialidad").insert({
             "nombre": sub.nombre,
             "descripcion": sub.descripcion
         }).execute()
         if not creado.data:
             raise HTTPException(status_code=500, detail="No se pudo insertar la subespecialidad.")
 
-        lista = supabase_client.table("sub_especialidad").select("id,nombre,descripcion").order("id").execute()
+        lista = await supabase_async.table("sub_especialidad").select("id,nombre,descripcion").order("id").execute()
         return {"mensaje": f"Subespecialidad '{sub.nombre}' creada.", "subespecialidades": lista.data}
     except HTTPException:
         raise
@@ -149,16 +155,16 @@ async def crear_subespecialidad(sub: SubEspecialidad):
 @doctor_router.put("/modificar-subespecialidad/{sub_id}")
 async def modificar_subespecialidad(sub_id: int, sub: SubEspecialidad):
     try:
-        existe = supabase_client.table("sub_especialidad").select("id").eq("id", sub_id).execute()
+        existe = await supabase_async.table("sub_especialidad").select("id").eq("id", sub_id).execute()
         if not existe.data:
             raise HTTPException(status_code=404, detail=f"No existe la subespecialidad con ID {sub_id}.")
 
-        duplicado = (supabase_client.table("sub_especialidad")
+        duplicado = (await supabase_async.table("sub_especialidad")
                      .select("id").eq("nombre", sub.nombre).neq("id", sub_id).execute())
         if duplicado.data:
             raise HTTPException(status_code=409, detail=f"Ya existe otra subespecialidad con nombre '{sub.nombre}'.")
 
-        act = (supabase_client.table("sub_especialidad")
+        act = (await supabase_async.table("sub_especialidad")
                .update({"nombre": sub.nombre, "descripcion": sub.descripcion})
                .eq("id", sub_id).execute())
         if not act.data:
@@ -174,17 +180,17 @@ async def modificar_subespecialidad(sub_id: int, sub: SubEspecialidad):
 @doctor_router.delete("/eliminar-subespecialidad/{sub_id}")
 async def eliminar_subespecialidad(sub_id: int):
     try:
-        sub = supabase_client.table("sub_especialidad").select("id,nombre").eq("id", sub_id).execute()
+        sub = await supabase_async.table("sub_especialidad").select("id,nombre").eq("id", sub_id).execute()
         if not sub.data:
             raise HTTPException(status_code=404, detail=f"No existe la subespecialidad con ID {sub_id}.")
         nombre = sub.data[0]["nombre"]
 
-        ref_vinculos = (supabase_client.table("especialidad_con_subespecialidad")
+        ref_vinculos = (await supabase_async.table("especialidad_con_subespecialidad")
                         .select("id").eq("sub_especialidad_id", sub_id).limit(1).execute())
         if ref_vinculos.data:
             raise HTTPException(status_code=409, detail=f"No puedes eliminar '{nombre}' porque está vinculada a especialidades.")
 
-        delr = supabase_client.table("sub_especialidad").delete().eq("id", sub_id).execute()
+        delr = await supabase_async.table("sub_especialidad").delete().eq("id", sub_id).execute()
         if not delr.data:
             raise HTTPException(status_code=500, detail="No se pudo eliminar la subespecialidad.")
 
@@ -206,13 +212,13 @@ async def vincular_subespecialidad(v: VinculoEspSub):
     """
     try:
         # Evitar duplicados
-        ya = (supabase_client.table("especialidad_con_subespecialidad")
+        ya = (await supabase_async.table("especialidad_con_subespecialidad")
               .select("id").eq("especialidad_id", v.especialidad_id)
               .eq("sub_especialidad_id", v.sub_especialidad_id).execute())
         if ya.data:
             raise HTTPException(status_code=409, detail="Ya existe ese vínculo.")
 
-        creado = (supabase_client.table("especialidad_con_subespecialidad")
+        creado = (await supabase_async.table("especialidad_con_subespecialidad")
                   .insert({"especialidad_id": v.especialidad_id, "sub_especialidad_id": v.sub_especialidad_id})
                   .execute())
         if not creado.data:
@@ -228,7 +234,7 @@ async def vincular_subespecialidad(v: VinculoEspSub):
 @doctor_router.delete("/desvincular-subespecialidad")
 async def desvincular_subespecialidad(v: VinculoEspSub):
     try:
-        delr = (supabase_client.table("especialidad_con_subespecialidad")
+        delr = (await supabase_async.table("especialidad_con_subespecialidad")
                 .delete().eq("especialidad_id", v.especialidad_id)
                 .eq("sub_especialidad_id", v.sub_especialidad_id).execute())
         if delr.data == []:
@@ -246,14 +252,14 @@ async def listar_subespecialidades_de_especialidad(especialidad_id: int):
     Lista las subespecialidades vinculadas a una especialidad.
     """
     try:
-        vinculos = (supabase_client.table("especialidad_con_subespecialidad")
+        vinculos = (await supabase_async.table("especialidad_con_subespecialidad")
                     .select("sub_especialidad_id").eq("especialidad_id", especialidad_id).execute())
         ids = [row["sub_especialidad_id"] for row in (vinculos.data or [])]
         if not ids:
             return {"subespecialidades": []}
 
         # Trae las subespecialidades por sus IDs
-        res = supabase_client.table("sub_especialidad").select("id,nombre,descripcion").in_("id", ids).execute()
+        res = await supabase_async.table("sub_especialidad").select("id,nombre,descripcion").in_("id", ids).execute()
         return {"subespecialidades": res.data or []}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -267,31 +273,33 @@ async def listar_especialidades():
     OPTIMIZADO: JOIN directo en lugar de N+1 queries.
     """
     try:
-        # OPTIMIZACIÓN: LEFT JOIN con costos_servicio para obtener precios en una sola query
-        res = (
-            supabase_client
-            .table("especialidad")
-            .select("id,nombre,descripcion,costos_servicio!left(precio)")
-            .order("id", desc=False)
-            .execute()
-        )
-
-        # Transformar la estructura de costos_servicio (array) a precio directo
-        especialidades_con_precio = []
-        for esp in (res.data or []):
-            precio = None
-            costos = esp.pop("costos_servicio", [])  # Extraer array de costos
-            if costos and len(costos) > 0:
-                precio = costos[0].get("precio")  # Primer precio encontrado
-            
-            especialidades_con_precio.append({
-                "id": esp["id"],
-                "nombre": esp["nombre"],
-                "descripcion": esp.get("descripcion"),
-                "precio": precio
-            })
-
-        return {"especialidades": especialidades_con_precio}
+        async def cargar():
+            # OPTIMIZACIÓN: LEFT JOIN con costos_servicio para obtener precios en una sola query
+            res = (
+                await supabase_async
+                .table("especialidad")
+                .select("id,nombre,descripcion,costos_servicio!left(precio)")
+                .order("id", desc=False)
+                .execute()
+            )
+
+            # Transformar la estructura de costos_servicio (array) a precio directo
+            especialidades_con_precio = []
+            for esp in (res.data or []):
+                precio = None
+                costos = esp.pop("costos_servicio", [])  # Extraer array de costos
+                if costos and len(costos) > 0:
+                    precio = costos[0].get("precio")  # Primer precio encontrado
+
+                especialidades_con_precio.append({
+                    "id": esp["id"],
+                    "nombre": esp["nombre"],
+                    "descripcion": esp.get("descripcion"),
+                    "precio": precio
+                })
+            return especialidades_con_precio
+
+        return {"especialidades": await cache_catalogos.obtener("especialidad", "con_precio", cargar)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -304,7 +312,7 @@ async def listar_doctores():
     """
     try:
         res = (
-            supabase_client
+            await supabase_async
             .table("doctores")
             .select("""
                 id,
@@ -343,7 +351,7 @@ async def listar_subespecialidades():
     """
     try:
         res = (
-            supabase_client
+            await supabase_async
             .table("sub_especialidad")
             .select("id,nombre,descripcion")
             .order("id", desc=False)
@@ -362,7 +370,7 @@ async def listar_subespecialidades_de_especialidad(especialidad_id: int):
     """
     try:
         vinculos = (
-            supabase_client
+            await supabase_async
             .table("especialidad_con_subespecialidad")
             .select("sub_especialidad_id")
             .eq("especialidad_id", especialidad_id)
@@ -373,7 +381,7 @@ async def listar_subespecialidades_de_especialidad(especialidad_id: int):
             return {"subespecialidades": []}
 
         res = (
-            supabase_client
+            await supabase_async
             .table("sub_especialidad")
             .select("id,nombre,descripcion")
             .in_("id", ids)
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
 from src.models.pacientes import Paciente, Prevencion
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
+from src.utils.paginacion import aplicar_cursor, cortar_pagina
+from src.utils.cache_catalogos import cache_catalogos
 import re
 
 patient_router = APIRouter(tags=["Gestión de Pacientes"], prefix="/Pacientes")
@@ -24,7 +27,7 @@ async def crear_paciente(paciente: Paciente):
 
         # Verificar si ya existe el RUT
         existe = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .select("id")
             .eq("rut", rut_limpio)
@@ -38,7 +41,7 @@ async def crear_paciente(paciente: Paciente):
 
         # Insertar nuevo paciente
         nuevo = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .insert({
                 "nombre": paciente.nombre,
@@ -81,7 +84,7 @@ async def modificar_paciente(paciente_id: int, paciente: Paciente):
     try:
         # Verificar existencia
         existe = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .select("id")
             .eq("id", paciente_id)
@@ -95,7 +98,7 @@ async def modificar_paciente(paciente_id: int, paciente: Paciente):
 
         # Verificar duplicado de RUT (en otro paciente)
         duplicado = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .select("id")
             .eq("rut", rut_limpio)
@@ -110,7 +113,7 @@ async def modificar_paciente(paciente_id: int, paciente: Paciente):
 
         # Actualizar datos
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .update({
                 "nombre": paciente.nombre,
@@ -154,7 +157,7 @@ async def eliminar_paciente(paciente_id: int):
     try:
         # Verificar existencia
         existe = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .select("id, nombre, apellido_paterno")
             .eq("id", paciente_id)
@@ -167,7 +170,7 @@ async def eliminar_paciente(paciente_id: int):
 
         # Eliminar paciente
         eliminado = (
-            supabase_client
+            await supabase_async
             .table("paciente")
             .delete()
             .eq("id", paciente_id)
@@ -186,23 +189,37 @@ async def eliminar_paciente(paciente_id: int):
 
 
 @patient_router.get("/listar-pacientes")
-async def listar_pacientes():
+async def listar_pacientes(
+    limite: Optional[int] = Query(None, ge=1, le=500, description="Pacientes por página (sin limite ni cursor se listan todos)"),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la respuesta anterior")
+):
     """
     Devuelve todos los pacientes con su información de prevención.
+    Con limite/cursor pagina por id en la base de datos.
     """
     try:
-        res = (
-            supabase_client
+        query = aplicar_cursor(
+            supabase_async
             .table("paciente")
-            .select("*, prevencion(id, nombre, descripcion)")
-            .order("id", desc=False)
-            .execute()
+            .select("*, prevencion(id, nombre, descripcion)"),
+            cursor
         )
 
-        if not res.data:
+        paginar = limite is not None or cursor is not None
+        if paginar:
+            limite = limite or 50
+            query = query.limit(limite + 1)
+
+        res = await query.execute()
+
+        if not res.data and not cursor:
             raise HTTPException(status_code=404, detail="No hay pacientes registrados.")
 
-        return {"pacientes": res.data}
+        pacientes, siguiente_cursor = res.data or [], None
+        if paginar:
+            pacientes, siguiente_cursor = cortar_pagina(pacientes, limite)
+
+        return {"pacientes": pacientes, "siguiente_cursor": siguiente_cursor}
 
     except HTTPException:
         raise
@@ -216,18 +233,21 @@ async def listar_prevenciones():
     Devuelve todas las prevenciones disponibles (Fonasa, Isapre, etc.).
     """
     try:
-        res = (
-            supabase_client
-            .table("prevencion")
-            .select("*")
-            .order("id", desc=False)
-            .execute()
-        )
+        async def cargar():
+            res = (
+                await supabase_async
+                .table("prevencion")
+                .select("*")
+                .order("id", desc=False)
+                .execute()
+            )
+            return res.data or []
 
-        if not res.data:
+        prevenciones = await cache_catalogos.obtener("prevencion", "todas", cargar)
+        if not prevenciones:
             raise HTTPException(status_code=404, detail="No hay prevenciones registradas.")
 
-        return {"prevenciones": res.data}
+        return {"prevenciones": prevenciones}
 
     except HTTPException:
         raise
@@ -243,7 +263,7 @@ async def crear_prevencion(prevencion: Prevencion):
     try:
         # Verificar si ya existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("prevencion")
             .select("id")
             .eq("nombre", prevencion.nombre)
@@ -257,7 +277,7 @@ async def crear_prevencion(prevencion: Prevencion):
 
         # Insertar nueva prevención
         nueva = (
-            supabase_client
+            await supabase_async
             .table("prevencion")
             .insert({
                 "nombre": prevencion.nombre,
@@ -266,6 +286,7 @@ async def crear_prevencion(prevencion: Prevencion):
             .execute()
         )
 
+        cache_catalogos.invalidar("prevencion")
         if not nueva.data:
             raise HTTPException(status_code=500, detail="No se pudo crear la prevención.")
 
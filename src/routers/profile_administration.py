@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timedelta, timezone
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
 import bcrypt
 
 profile_router = APIRouter(tags=["Perfil de Usuario"], prefix="/Perfil")
@@ -26,7 +26,7 @@ async def obtener_perfil(usuario_id: int):
     try:
         # Obtener datos del usuario
         usuario = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, nombre, apellido_paterno, apellido_materno, rut, email, celular, cel_secundario, direccion, rol_id, rol(nombre)")
             .eq("id", usuario_id)
@@ -70,7 +70,7 @@ async def actualizar_perfil(usuario_id: int, perfil: PerfilUsuario):
     try:
         # Verificar que el usuario existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .eq("id", usuario_id)
@@ -82,7 +82,7 @@ async def actualizar_perfil(usuario_id: int, perfil: PerfilUsuario):
 
         # Verificar que no existe otro usuario con el mismo RUT o email
         duplicado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .or_(f"rut.eq.{perfil.rut},email.eq.{perfil.email}")
@@ -95,7 +95,7 @@ async def actualizar_perfil(usuario_id: int, perfil: PerfilUsuario):
 
         # Actualizar datos del perfil
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .update({
                 "nombre": perfil.nombre,
@@ -135,7 +135,7 @@ async def obtener_perfil_doctor(doctor_id: int):
     try:
         # Obtener datos del doctor
         doctor = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, nombre, apellido_paterno, apellido_materno, rut, email, celular, cel_secundario, direccion, rol_id, rol(nombre)")
             .eq("id", doctor_id)
@@ -149,7 +149,7 @@ async def obtener_perfil_doctor(doctor_id: int):
 
         # Obtener especialidades del doctor
         especialidades_response = (
-            supabase_client
+            await supabase_async
             .table("especialidades_doctor")
             .select("especialidad_id, especialidad(id, nombre, descripcion)")
             .eq("usuario_sistema_id", doctor_id)
@@ -199,7 +199,7 @@ async def obtener_estadisticas_doctor(doctor_id: int):
     try:
         # Verificar que el doctor existe
         doctor = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .eq("id", doctor_id)
@@ -211,7 +211,7 @@ async def obtener_estadisticas_doctor(doctor_id: int):
 
         # Obtener todas las citas del doctor
         citas_response = (
-            supabase_client
+            await supabase_async
             .table("cita_medica")
             .select("id, fecha_atencion, paciente_id")
             .eq("doctor_id", doctor_id)
@@ -230,7 +230,7 @@ async def obtener_estadisticas_doctor(doctor_id: int):
             for cita in citas_response.data:
                 # Verificar estado de la cita
                 estado_response = (
-                    supabase_client
+                    await supabase_async
                     .table("estado")
                     .select("estado")
                     .eq("cita_medica_id", cita["id"])
@@ -277,7 +277,7 @@ async def cambiar_password_doctor(doctor_id: int, passwords: CambiarPasswordDoct
     try:
         # Obtener contraseña actual del doctor
         password_response = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .select("id, contraseña")
             .eq("id_profesional_salud", doctor_id)
@@ -299,7 +299,7 @@ async def cambiar_password_doctor(doctor_id: int, passwords: CambiarPasswordDoct
 
         # Actualizar contraseña
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .update({
                 "contraseña": nueva_password_hash,
@@ -338,7 +338,7 @@ async def actualizar_perfil_doctor(doctor_id: int, perfil: ActualizarPerfilDocto
     try:
         # Verificar que el doctor existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, rut")
             .eq("id", doctor_id)
@@ -350,7 +350,7 @@ async def actualizar_perfil_doctor(doctor_id: int, perfil: ActualizarPerfilDocto
 
         # Verificar que no existe otro usuario con el mismo email
         duplicado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .eq("email", perfil.email)
@@ -363,7 +363,7 @@ async def actualizar_perfil_doctor(doctor_id: int, perfil: ActualizarPerfilDocto
 
         # Actualizar datos del perfil
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .update({
                 "nombre": perfil.nombre,
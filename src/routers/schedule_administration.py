@@ -1,12 +1,55 @@
-from fastapi import APIRouter, HTTPException
-from src.utils.supabase import supabase_client
-from src.models.horarios import HorarioBloque, CrearHorarioSemanal, ActualizarHorario
+from fastapi import APIRouter, HTTPException, Query
+from src.utils.supabase_async import supabase_async
+from src.models.horarios import HorarioBloque, CrearHorarioSemanal, CrearPlantillaHorarios, ActualizarHorario
+from src.utils.intervalos import filtrar_solapamientos
+from src.utils.disponibilidad import proximos_disponibles
+from src.utils.indice_disponibilidad import indice_disponibilidad
+from src.utils.plantilla_horarios import expandir_plantilla, a_registros, validar_turnos
+import asyncio
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-from typing import Optional
+from typing import List, Optional
 
 schedule_router = APIRouter(tags=["Gestión de Horarios"], prefix="/Horarios")
 
+# Filas por página al leer bloques (límite de filas por respuesta de PostgREST)
+TAMANO_PAGINA_BLOQUES = 1000
+
+# Supabase permite insertar hasta 1000 registros por batch
+TAMANO_LOTE_INSERCION = 1000
+
+
+async def _cargar_bloques_doctor(usuario_id: int, desde: str, hasta: str, excluir_id: Optional[int] = None) -> list:
+    """
+    Bloques del doctor que se solapan con [desde, hasta), en una consulta por rango
+    (paginada si supera TAMANO_PAGINA_BLOQUES filas).
+    """
+    bloques = []
+    offset = 0
+    while True:
+        query = (
+            supabase_async
+            .table("horarios_personal")
+            .select("id, inicio_bloque, finalizacion_bloque")
+            .eq("usuario_sistema_id", usuario_id)
+            .lt("inicio_bloque", hasta)
+            .gt("finalizacion_bloque", desde)
+        )
+        if excluir_id is not None:
+            query = query.neq("id", excluir_id)
+
+        pagina = await (
+            query
+            .order("inicio_bloque")
+            .order("id")
+            .range(offset, offset + TAMANO_PAGINA_BLOQUES - 1)
+            .execute()
+        )
+        bloques.extend(pagina.data or [])
+        if len(pagina.data or []) < TAMANO_PAGINA_BLOQUES:
+            return bloques
+        offset += TAMANO_PAGINA_BLOQUES
+
 @schedule_router.post("/crear-bloque")
 async def crear_bloque_horario(horario: HorarioBloque):
     """
@@ -14,23 +57,28 @@ async def crear_bloque_horario(horario: HorarioBloque):
     """
     try:
         # Validar que el usuario existe y es doctor
-        usuario = supabase_client.table("usuario_sistema").select("id, rol_id").eq("id", horario.usuario_sistema_id).execute()
+        usuario = await supabase_async.table("usuario_sistema").select("id, rol_id").eq("id", horario.usuario_sistema_id).execute()
         if not usuario.data:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         if usuario.data[0]["rol_id"] != 2:
             raise HTTPException(status_code=400, detail="El usuario no es un doctor")
         
-        # Validar que no haya solapamiento de horarios
-        solapamiento = supabase_client.table("horarios_personal").select("id").eq("usuario_sistema_id", horario.usuario_sistema_id).or_(
-            f"and(inicio_bloque.lte.{horario.finalizacion_bloque.isoformat()},finalizacion_bloque.gte.{horario.inicio_bloque.isoformat()})"
-        ).execute()
-        
-        if solapamiento.data:
+        if horario.finalizacion_bloque <= horario.inicio_bloque:
+            raise HTTPException(status_code=400, detail="El bloque debe terminar después de comenzar")
+
+        # Validar que no haya solapamiento de horarios (bloques contiguos sí se permiten)
+        solapados = await _cargar_bloques_doctor(
+            horario.usuario_sistema_id,
+            horario.inicio_bloque.isoformat(),
+            horario.finalizacion_bloque.isoformat()
+        )
+
+        if solapados:
             raise HTTPException(status_code=409, detail="Ya existe un horario en ese rango de tiempo")
         
         # Crear el bloque
-        nuevo = supabase_client.table("horarios_personal").insert({
+        nuevo = await supabase_async.table("horarios_personal").insert({
             "inicio_bloque": horario.inicio_bloque.isoformat(),
             "finalizacion_bloque": horario.finalizacion_bloque.isoformat(),
             "usuario_sistema_id": horario.usuario_sistema_id
@@ -38,6 +86,8 @@ async def crear_bloque_horario(horario: HorarioBloque):
         
         if not nuevo.data:
             raise HTTPException(status_code=500, detail="No se pudo crear el bloque de horario")
+
+        indice_disponibilidad.invalidar(horario.usuario_sistema_id, horario.inicio_bloque)
         
         return {"mensaje": "Bloque de horario creado correctamente", "horario": nuevo.data[0]}
     
@@ -66,7 +116,7 @@ async def crear_horario_semanal(horario: CrearHorarioSemanal):
         print(f"   fecha_fin: {horario.fecha_fin}")
         
         # Validar que el usuario existe y es doctor (UNA SOLA VEZ)
-        usuario = supabase_client.table("usuario_sistema").select("id, rol_id").eq("id", horario.usuario_sistema_id).execute()
+        usuario = await supabase_async.table("usuario_sistema").select("id, rol_id").eq("id", horario.usuario_sistema_id).execute()
         if not usuario.data:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
@@ -80,114 +130,72 @@ async def crear_horario_semanal(horario: CrearHorarioSemanal):
         else:
             fecha_fin = fecha_inicio + timedelta(days=90)  # 3 meses por defecto
         
-        # Timezone de Chile para conversión correcta
-        chile_tz = ZoneInfo("America/Santiago")
-        
-        # FASE 1: Generar TODOS los bloques en memoria (rápido)
-        bloques_a_crear = []
-        fecha_actual = fecha_inicio
-        
-        while fecha_actual <= fecha_fin:
-            # Verificar si es el día de la semana correcto (0=Lunes, 6=Domingo)
-            if fecha_actual.weekday() == horario.dia_semana:
-                # Crear bloques en hora Chile y convertir a UTC para guardar
-                hora_bloque_chile = datetime.combine(
-                    fecha_actual,
-                    datetime.strptime(horario.hora_inicio, "%H:%M").time(),
-                    tzinfo=chile_tz
-                )
-                hora_fin_dia_chile = datetime.combine(
-                    fecha_actual,
-                    datetime.strptime(horario.hora_fin, "%H:%M").time(),
-                    tzinfo=chile_tz
-                )
-                
-                # Generar bloques del día
-                while hora_bloque_chile < hora_fin_dia_chile:
-                    fin_bloque_chile = hora_bloque_chile + timedelta(minutes=horario.duracion_bloque_minutos)
-                    
-                    if fin_bloque_chile > hora_fin_dia_chile:
-                        break
-                    
-                    # Convertir a UTC para guardar en PostgreSQL
-                    inicio_utc = hora_bloque_chile.astimezone(timezone.utc)
-                    fin_utc = fin_bloque_chile.astimezone(timezone.utc)
-                    
-                    bloques_a_crear.append({
-                        "inicio_bloque": inicio_utc.isoformat(),
-                        "finalizacion_bloque": fin_utc.isoformat(),
-                        "usuario_sistema_id": horario.usuario_sistema_id
-                    })
-                    
-                    hora_bloque_chile = fin_bloque_chile
-            
-            fecha_actual += timedelta(days=1)
+        # FASE 1: Generar TODOS los bloques en memoria (vectorizado, hora Chile -> UTC)
+        turno = {
+            "usuario_sistema_id": horario.usuario_sistema_id,
+            "dias_semana": [horario.dia_semana],
+            "hora_inicio": horario.hora_inicio,
+            "hora_fin": horario.hora_fin,
+            "duracion_bloque_minutos": horario.duracion_bloque_minutos
+        }
+        errores = validar_turnos([turno])
+        if errores:
+            raise HTTPException(status_code=400, detail=errores[0])
+
+        bloques, bloques_omitidos = expandir_plantilla([turno], fecha_inicio, fecha_fin)
+        bloques_a_crear = a_registros(bloques)
         
         # Si no hay bloques para crear, retornar
         if not bloques_a_crear:
             return {
                 "mensaje": "No se generaron bloques para el rango especificado",
-                "bloques_creados": 0
+                "bloques_creados": 0,
+                "bloques_omitidos_cambio_horario": bloques_omitidos
             }
         
-        # FASE 2: Consultar solapamientos existentes (UNA SOLA QUERY)
-        # Obtener rango completo de fechas
+        # FASE 2: Bloques existentes que tocan el rango completo (UNA consulta por rango)
         primer_bloque = bloques_a_crear[0]
         ultimo_bloque = bloques_a_crear[-1]
-        
-        horarios_existentes = supabase_client.table("horarios_personal").select(
-            "inicio_bloque, finalizacion_bloque"
-        ).eq(
-            "usuario_sistema_id", horario.usuario_sistema_id
-        ).gte(
-            "inicio_bloque", primer_bloque["inicio_bloque"]
-        ).lte(
-            "finalizacion_bloque", ultimo_bloque["finalizacion_bloque"]
-        ).execute()
-        
-        # FASE 3: Filtrar bloques que NO se solapan (en memoria, rápido)
-        bloques_validos = []
-        
-        if horarios_existentes.data:
-            # Convertir a sets para comparación rápida
-            rangos_existentes = set()
-            for h in horarios_existentes.data:
-                rangos_existentes.add((h["inicio_bloque"], h["finalizacion_bloque"]))
-            
-            # Filtrar bloques que no existen
-            for bloque in bloques_a_crear:
-                if (bloque["inicio_bloque"], bloque["finalizacion_bloque"]) not in rangos_existentes:
-                    bloques_validos.append(bloque)
-        else:
-            # No hay solapamientos, todos son válidos
-            bloques_validos = bloques_a_crear
+
+        horarios_existentes = await _cargar_bloques_doctor(
+            horario.usuario_sistema_id,
+            primer_bloque["inicio_bloque"],
+            ultimo_bloque["finalizacion_bloque"]
+        )
+
+        # FASE 3: Descartar los que se solapan, total o parcialmente (índice de intervalos)
+        bloques_validos, bloques_rechazados = filtrar_solapamientos(bloques_a_crear, horarios_existentes)
         
         # FASE 4: Bulk insert (UNA SOLA TRANSACCIÓN)
         if bloques_validos:
-            # Supabase permite insertar hasta 1000 registros por batch
-            # Si hay más, dividir en chunks
-            BATCH_SIZE = 1000
+            # Si hay más de TAMANO_LOTE_INSERCION, dividir en chunks
             total_insertados = 0
             
-            for i in range(0, len(bloques_validos), BATCH_SIZE):
-                batch = bloques_validos[i:i + BATCH_SIZE]
-                resultado = supabase_client.table("horarios_personal").insert(batch).execute()
+            for i in range(0, len(bloques_validos), TAMANO_LOTE_INSERCION):
+                batch = bloques_validos[i:i + TAMANO_LOTE_INSERCION]
+                resultado = await supabase_async.table("horarios_personal").insert(batch).execute()
                 
                 if resultado.data:
                     total_insertados += len(resultado.data)
+
+            indice_disponibilidad.invalidar(horario.usuario_sistema_id)
             
             return {
                 "mensaje": f"Se crearon {total_insertados} bloques de horario",
                 "bloques_creados": total_insertados,
                 "bloques_generados": len(bloques_a_crear),
-                "bloques_saltados": len(bloques_a_crear) - total_insertados
+                "bloques_saltados": len(bloques_a_crear) - total_insertados,
+                "bloques_rechazados": bloques_rechazados,
+                "bloques_omitidos_cambio_horario": bloques_omitidos
             }
         else:
             return {
-                "mensaje": "Todos los bloques ya existen",
+                "mensaje": "Todos los bloques se solapan con horarios existentes",
                 "bloques_creados": 0,
                 "bloques_generados": len(bloques_a_crear),
-                "bloques_saltados": len(bloques_a_crear)
+                "bloques_saltados": len(bloques_a_crear),
+                "bloques_rechazados": bloques_rechazados,
+                "bloques_omitidos_cambio_horario": bloques_omitidos
             }
     
     except HTTPException:
@@ -196,6 +204,117 @@ async def crear_horario_semanal(horario: CrearHorarioSemanal):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+
+@schedule_router.post("/crear-plantilla")
+async def crear_plantilla_horarios(plantilla: CrearPlantillaHorarios):
+    """
+    Crea los horarios de varios doctores de una vez a partir de una plantilla:
+    cada turno indica doctor, días de la semana, rango de horas y duración del bloque.
+    Los bloques se generan vectorizados, se revisan solapamientos con UNA consulta
+    por doctor y se insertan en lotes de TAMANO_LOTE_INSERCION.
+    """
+    try:
+        if not plantilla.turnos:
+            raise HTTPException(status_code=400, detail="La plantilla no tiene turnos")
+
+        turnos = [turno.model_dump() for turno in plantilla.turnos]
+        errores = validar_turnos(turnos)
+        if errores:
+            raise HTTPException(status_code=400, detail={"mensaje": "Plantilla no válida", "errores": errores})
+
+        fecha_inicio = datetime.strptime(plantilla.fecha_inicio, "%Y-%m-%d").date()
+        if plantilla.fecha_fin:
+            fecha_fin = datetime.strptime(plantilla.fecha_fin, "%Y-%m-%d").date()
+        else:
+            fecha_fin = fecha_inicio + timedelta(days=90)  # 3 meses por defecto
+
+        if fecha_fin < fecha_inicio:
+            raise HTTPException(status_code=400, detail="fecha_fin debe ser igual o posterior a fecha_inicio")
+
+        # Validar todos los doctores en una sola consulta
+        doctor_ids = sorted({turno["usuario_sistema_id"] for turno in turnos})
+        usuarios = await supabase_async.table("usuario_sistema").select("id, rol_id").in_("id", doctor_ids).execute()
+        roles = {usuario["id"]: usuario["rol_id"] for usuario in (usuarios.data or [])}
+
+        no_encontrados = [doctor_id for doctor_id in doctor_ids if doctor_id not in roles]
+        if no_encontrados:
+            raise HTTPException(status_code=404, detail=f"Usuarios no encontrados: {no_encontrados}")
+
+        no_doctores = [doctor_id for doctor_id in doctor_ids if roles[doctor_id] != 2]
+        if no_doctores:
+            raise HTTPException(status_code=400, detail=f"Los siguientes usuarios no son doctores: {no_doctores}")
+
+        # FASE 1: Expandir la plantilla completa
+        bloques, bloques_omitidos = expandir_plantilla(turnos, fecha_inicio, fecha_fin)
+
+        generados_por_doctor = {
+            int(doctor_id): a_registros(bloques_doctor)
+            for doctor_id, bloques_doctor in bloques.groupby("usuario_sistema_id")
+        }
+
+        # FASE 2: Bloques existentes de cada doctor en su rango (una consulta por doctor, en paralelo)
+        doctores_con_bloques = list(generados_por_doctor.keys())
+        existentes_por_doctor = await asyncio.gather(*[
+            _cargar_bloques_doctor(
+                doctor_id,
+                generados_por_doctor[doctor_id][0]["inicio_bloque"],
+                max(bloque["finalizacion_bloque"] for bloque in generados_por_doctor[doctor_id])
+            )
+            for doctor_id in doctores_con_bloques
+        ])
+
+        # FASE 3: Filtrar solapamientos por doctor
+        bloques_validos = []
+        resumen = {}
+        for doctor_id, existentes in zip(doctores_con_bloques, existentes_por_doctor):
+            aceptados, rechazados = filtrar_solapamientos(generados_por_doctor[doctor_id], existentes)
+            bloques_validos.extend(aceptados)
+            resumen[doctor_id] = {
+                "usuario_sistema_id": doctor_id,
+                "bloques_generados": len(generados_por_doctor[doctor_id]),
+                "bloques_creados": 0,
+                "bloques_rechazados": rechazados
+            }
+
+        # FASE 4: Bulk insert en lotes
+        total_insertados = 0
+        for i in range(0, len(bloques_validos), TAMANO_LOTE_INSERCION):
+            batch = bloques_validos[i:i + TAMANO_LOTE_INSERCION]
+            resultado = await supabase_async.table("horarios_personal").insert(batch).execute()
+
+            for fila in (resultado.data or []):
+                resumen[fila["usuario_sistema_id"]]["bloques_creados"] += 1
+            total_insertados += len(resultado.data or [])
+
+        for doctor_id in doctores_con_bloques:
+            indice_disponibilidad.invalidar(doctor_id)
+
+        total_generados = sum(len(registros) for registros in generados_por_doctor.values())
+
+        return {
+            "mensaje": f"Se crearon {total_insertados} bloques de horario para {len(resumen)} doctores",
+            "bloques_creados": total_insertados,
+            "bloques_generados": total_generados,
+            "bloques_saltados": total_generados - total_insertados,
+            "bloques_omitidos_cambio_horario": bloques_omitidos,
+            "por_doctor": [
+                resumen.get(doctor_id, {
+                    "usuario_sistema_id": doctor_id,
+                    "bloques_generados": 0,
+                    "bloques_creados": 0,
+                    "bloques_rechazados": []
+                })
+                for doctor_id in doctor_ids
+            ]
+        }
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Formato de fecha no válido: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @schedule_router.get("/listar-horarios")
 async def listar_horarios(
     usuario_sistema_id: Optional[int] = None,
@@ -209,7 +328,7 @@ async def listar_horarios(
     try:
         chile_tz = ZoneInfo("America/Santiago")
         
-        query = supabase_client.table("horarios_personal").select(
+        query = supabase_async.table("horarios_personal").select(
             "id, inicio_bloque, finalizacion_bloque, usuario_sistema_id, usuario_sistema(nombre, apellido_paterno, apellido_materno)"
         )
         
@@ -230,7 +349,7 @@ async def listar_horarios(
         
         query = query.order("inicio_bloque", desc=False)
         
-        result = query.execute()
+        result = await query.execute()
         
         # Filtrar bloques basándonos en fecha LOCAL Chile
         horarios_filtrados = result.data or []
@@ -274,7 +393,7 @@ async def obtener_horario(horario_id: int):
     Obtiene los detalles de un bloque de horario específico.
     """
     try:
-        horario = supabase_client.table("horarios_personal").select(
+        horario = await supabase_async.table("horarios_personal").select(
             "id, inicio_bloque, finalizacion_bloque, usuario_sistema_id, usuario_sistema(nombre, apellido_paterno, apellido_materno)"
         ).eq("id", horario_id).execute()
         
@@ -296,30 +415,36 @@ async def modificar_horario(horario_id: int, horario: ActualizarHorario):
     """
     try:
         # Verificar que existe
-        existe = supabase_client.table("horarios_personal").select("id, usuario_sistema_id").eq("id", horario_id).execute()
+        existe = await supabase_async.table("horarios_personal").select("id, usuario_sistema_id").eq("id", horario_id).execute()
         if not existe.data:
             raise HTTPException(status_code=404, detail="Horario no encontrado")
         
         usuario_id = existe.data[0]["usuario_sistema_id"]
         
+        if horario.finalizacion_bloque <= horario.inicio_bloque:
+            raise HTTPException(status_code=400, detail="El bloque debe terminar después de comenzar")
+
         # Validar que no haya solapamiento con otros horarios del mismo doctor
-        solapamiento = supabase_client.table("horarios_personal").select("id").eq(
-            "usuario_sistema_id", usuario_id
-        ).neq("id", horario_id).or_(
-            f"and(inicio_bloque.lte.{horario.finalizacion_bloque.isoformat()},finalizacion_bloque.gte.{horario.inicio_bloque.isoformat()})"
-        ).execute()
-        
-        if solapamiento.data:
+        solapados = await _cargar_bloques_doctor(
+            usuario_id,
+            horario.inicio_bloque.isoformat(),
+            horario.finalizacion_bloque.isoformat(),
+            excluir_id=horario_id
+        )
+
+        if solapados:
             raise HTTPException(status_code=409, detail="El nuevo horario se solapa con otro existente")
         
         # Actualizar
-        actualizado = supabase_client.table("horarios_personal").update({
+        actualizado = await supabase_async.table("horarios_personal").update({
             "inicio_bloque": horario.inicio_bloque.isoformat(),
             "finalizacion_bloque": horario.finalizacion_bloque.isoformat()
         }).eq("id", horario_id).execute()
         
         if not actualizado.data:
             raise HTTPException(status_code=500, detail="No se pudo actualizar el horario")
+
+        indice_disponibilidad.invalidar(usuario_id)
         
         return {"mensaje": "Horario actualizado correctamente", "horario": actualizado.data[0]}
     
@@ -336,15 +461,17 @@ async def eliminar_horario(horario_id: int):
     """
     try:
         # Verificar que existe
-        existe = supabase_client.table("horarios_personal").select("id").eq("id", horario_id).execute()
+        existe = await supabase_async.table("horarios_personal").select("id, usuario_sistema_id").eq("id", horario_id).execute()
         if not existe.data:
             raise HTTPException(status_code=404, detail="Horario no encontrado")
         
         # Eliminar
-        eliminado = supabase_client.table("horarios_personal").delete().eq("id", horario_id).execute()
+        eliminado = await supabase_async.table("horarios_personal").delete().eq("id", horario_id).execute()
         
         if not eliminado.data:
             raise HTTPException(status_code=500, detail="No se pudo eliminar el horario")
+
+        indice_disponibilidad.invalidar(existe.data[0]["usuario_sistema_id"])
         
         return {"mensaje": "Horario eliminado correctamente"}
     
@@ -365,7 +492,7 @@ async def eliminar_horarios_doctor(
     Si no se especifican fechas, elimina todos los horarios futuros.
     """
     try:
-        query = supabase_client.table("horarios_personal").delete().eq("usuario_sistema_id", usuario_sistema_id)
+        query = supabase_async.table("horarios_personal").delete().eq("usuario_sistema_id", usuario_sistema_id)
         
         if fecha_inicio:
             query = query.gte("inicio_bloque", fecha_inicio)
@@ -376,7 +503,8 @@ async def eliminar_horarios_doctor(
         if fecha_fin:
             query = query.lte("finalizacion_bloque", fecha_fin)
         
-        result = query.execute()
+        result = await query.execute()
+        indice_disponibilidad.invalidar(usuario_sistema_id)
         
         return {"mensaje": f"Horarios eliminados correctamente", "cantidad": len(result.data or [])}
     
@@ -391,7 +519,7 @@ async def listar_doctores_con_horarios():
     """
     try:
         # Obtener doctores únicos con horarios
-        horarios = supabase_client.table("horarios_personal").select(
+        horarios = await supabase_async.table("horarios_personal").select(
             "usuario_sistema_id"
         ).execute()
         
@@ -402,7 +530,7 @@ async def listar_doctores_con_horarios():
         doctor_ids = list(set([h["usuario_sistema_id"] for h in horarios.data]))
         
         # Obtener información de los doctores
-        doctores = supabase_client.table("usuario_sistema").select(
+        doctores = await supabase_async.table("usuario_sistema").select(
             "id, nombre, apellido_paterno, apellido_materno, email"
         ).in_("id", doctor_ids).execute()
         
@@ -414,94 +542,139 @@ async def listar_doctores_con_horarios():
 
 @schedule_router.get("/horarios-disponibles")
 async def listar_horarios_disponibles(
-    doctor_id: int,
     fecha_inicio: str,
     fecha_fin: str,
+    doctor_id: Optional[int] = None,
+    doctor_ids: Optional[List[int]] = Query(None),
     especialidad_id: Optional[int] = None
 ):
     """
-    Lista los horarios disponibles (sin cita asignada) de un doctor en un rango de fechas.
-    Verifica tanto horarios con horario_id asignado como citas que se solapan por fecha_atencion.
+    Lista los horarios disponibles (sin cita activa) de uno o varios doctores en un rango de fechas.
+    Acepta doctor_id o doctor_ids repetido (?doctor_ids=1&doctor_ids=2).
+    Se responde desde el índice de disponibilidad en memoria (ver indice_disponibilidad).
     """
     try:
+        ids = sorted(set((doctor_ids or []) + ([doctor_id] if doctor_id is not None else [])))
+        if not ids:
+            raise HTTPException(status_code=400, detail="Debe indicar doctor_id o doctor_ids")
+
         # Parsear las fechas del frontend (vienen en ISO con timezone)
-        # y asegurar que estén en UTC para comparar con la BD
         fecha_inicio_dt = datetime.fromisoformat(fecha_inicio.replace('Z', '+00:00'))
         fecha_fin_dt = datetime.fromisoformat(fecha_fin.replace('Z', '+00:00'))
+        chile_tz = ZoneInfo("America/Santiago")
+        if fecha_inicio_dt.tzinfo is None:
+            fecha_inicio_dt = fecha_inicio_dt.replace(tzinfo=chile_tz)
+        if fecha_fin_dt.tzinfo is None:
+            fecha_fin_dt = fecha_fin_dt.replace(tzinfo=chile_tz)
 
-        print(f"DEBUG: Fechas parseadas - Inicio: {fecha_inicio_dt}, Fin: {fecha_fin_dt}")
-
-        # Obtener todos los horarios del doctor que se solapan con el rango
-        # Buscar horarios donde inicio_bloque <= fecha_fin Y finalizacion_bloque >= fecha_inicio
-        query = supabase_client.table("horarios_personal").select(
-            "id, inicio_bloque, finalizacion_bloque, usuario_sistema_id"
-        ).eq("usuario_sistema_id", doctor_id).lte(
-            "inicio_bloque", fecha_fin_dt.isoformat()
-        ).gte("finalizacion_bloque", fecha_inicio_dt.isoformat()).order("inicio_bloque", desc=False)
+        por_doctor = await indice_disponibilidad.libres(ids, fecha_inicio_dt, fecha_fin_dt)
 
-        horarios = query.execute()
+        horarios_disponibles = sorted(
+            (bloque for bloques in por_doctor.values() for bloque in bloques),
+            key=lambda b: (b["inicio_bloque"], b["usuario_sistema_id"])
+        )
 
-        if not horarios.data:
-            print(f"DEBUG: No se encontraron horarios para doctor {doctor_id}")
-            return {"horarios_disponibles": []}
-
-        # Obtener TODAS las citas del doctor en el rango de fechas
-        citas_doctor = supabase_client.table("cita_medica").select(
-            "id, fecha_atencion, doctor_id"
-        ).eq("doctor_id", doctor_id).gte(
-            "fecha_atencion", fecha_inicio_dt.isoformat()
-        ).lte("fecha_atencion", fecha_fin_dt.isoformat()).execute()
-
-        print(f"DEBUG: Doctor ID: {doctor_id}")
-        print(f"DEBUG: Rango de fechas: {fecha_inicio} a {fecha_fin}")
-        print(f"DEBUG: Horarios encontrados: {len(horarios.data)}")
-        if horarios.data:
-            for h in horarios.data:
-                print(f"  - Horario {h['id']}: {h['inicio_bloque']} a {h['finalizacion_bloque']}")
-        print(f"DEBUG: Citas encontradas: {len(citas_doctor.data or [])}")
-
-        # Crear set de horarios ocupados
-        horarios_ocupados = set()
-
-        for cita in (citas_doctor.data or []):
-            # Obtener el estado ACTUAL de la cita (el más reciente)
-            estado_response = supabase_client.table("estado").select(
-                "estado"
-            ).eq("cita_medica_id", cita["id"]).order("id", desc=True).limit(1).execute()
-            
-            estado_actual = None
-            if estado_response.data:
-                estado_actual = estado_response.data[0].get("estado")
-            
-            # Ignorar citas canceladas
-            if estado_actual == "Cancelada":
-                print(f"DEBUG: Ignorando cita cancelada ID {cita['id']}")
-                continue
+        return {
+            "horarios_disponibles": horarios_disponibles,
+            "por_doctor": {str(doctor): bloques for doctor, bloques in por_doctor.items()}
+        }
 
-            fecha_cita = datetime.fromisoformat(cita["fecha_atencion"].replace('Z', '+00:00'))
-            print(f"DEBUG: Procesando cita {cita['id']} con estado '{estado_actual}' y fecha {fecha_cita}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-            # Verificar qué horario ocupa esta cita
-            for horario in horarios.data:
-                inicio = datetime.fromisoformat(horario["inicio_bloque"].replace('Z', '+00:00'))
-                fin = datetime.fromisoformat(horario["finalizacion_bloque"].replace('Z', '+00:00'))
 
-                # Si la cita está dentro del bloque de horario, marcarlo como ocupado
-                if inicio <= fecha_cita < fin:
-                    print(f"DEBUG: Horario {horario['id']} ocupado por cita {cita['id']}")
-                    horarios_ocupados.add(horario["id"])
-                    break
 
-        # Filtrar solo horarios disponibles
-        horarios_disponibles = [
-            h for h in horarios.data
-            if h["id"] not in horarios_ocupados
-        ]
+@schedule_router.get("/resumen-disponibilidad")
+async def resumen_disponibilidad(
+    doctor_ids: List[int] = Query(...),
+    fecha_inicio: str = Query(..., description="YYYY-MM-DD (fecha Chile)"),
+    fecha_fin: Optional[str] = Query(None, description="YYYY-MM-DD, por defecto 7 días desde fecha_inicio")
+):
+    """
+    Cantidad de bloques libres por doctor y por día (ej: libres esta semana),
+    calculada sobre el índice de disponibilidad en memoria.
+    """
+    try:
+        desde = datetime.strptime(fecha_inicio, "%Y-%m-%d").date()
+        hasta = datetime.strptime(fecha_fin, "%Y-%m-%d").date() if fecha_fin else desde + timedelta(days=6)
+        if hasta < desde:
+            raise HTTPException(status_code=400, detail="fecha_fin debe ser igual o posterior a fecha_inicio")
+        if (hasta - desde).days > 180:
+            raise HTTPException(status_code=400, detail="El rango máximo es de 180 días")
+
+        por_dia = await indice_disponibilidad.contar_libres(sorted(set(doctor_ids)), desde, hasta)
+
+        return {
+            "doctores": [
+                {"usuario_sistema_id": doctor_id, "bloques_libres": sum(dias.values()), "por_dia": dias}
+                for doctor_id, dias in por_dia.items()
+            ]
+        }
 
-        print(f"DEBUG: Horarios ocupados: {horarios_ocupados}")
-        print(f"DEBUG: Horarios disponibles finales: {len(horarios_disponibles)}")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Formato de fecha no válido: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {"horarios_disponibles": horarios_disponibles}
+@schedule_router.get("/proximos-disponibles")
+async def listar_proximos_disponibles(
+    especialidad_id: int,
+    desde: Optional[str] = None,
+    cantidad: int = Query(5, ge=1, le=50),
+    dias_maximos: int = Query(60, ge=1, le=180)
+):
+    """
+    Retorna los próximos bloques libres entre TODOS los doctores de una especialidad,
+    ordenados por hora de inicio. Busca desde `desde` (o ahora) hasta dias_maximos días.
+    Cada doctor se lee por páginas y la búsqueda se detiene al juntar `cantidad` bloques.
+    """
+    try:
+        if desde:
+            desde_dt = datetime.fromisoformat(desde.replace('Z', '+00:00'))
+            if desde_dt.tzinfo is None:
+                desde_dt = desde_dt.replace(tzinfo=ZoneInfo("America/Santiago"))
+        else:
+            desde_dt = datetime.now(timezone.utc)
+        hasta_dt = desde_dt + timedelta(days=dias_maximos)
+
+        doctores_especialidad = (
+            await supabase_async
+            .table("especialidades_doctor")
+            .select("usuario_sistema_id")
+            .eq("especialidad_id", especialidad_id)
+            .execute()
+        )
+        doctor_ids = sorted({item["usuario_sistema_id"] for item in (doctores_especialidad.data or [])})
+        if not doctor_ids:
+            return {"horarios_disponibles": [], "doctores_consultados": 0}
+
+        bloques = await proximos_disponibles(doctor_ids, desde_dt.isoformat(), hasta_dt.isoformat(), cantidad)
+
+        # Datos del doctor solo para los que aparecen en el resultado
+        if bloques:
+            doctores = (
+                await supabase_async
+                .table("usuario_sistema")
+                .select("id, nombre, apellido_paterno, apellido_materno")
+                .in_("id", list({bloque["usuario_sistema_id"] for bloque in bloques}))
+                .execute()
+            )
+            doctores_dict = {doctor["id"]: doctor for doctor in (doctores.data or [])}
+            for bloque in bloques:
+                bloque["doctor"] = doctores_dict.get(bloque["usuario_sistema_id"])
+
+        return {
+            "horarios_disponibles": bloques,
+            "doctores_consultados": len(doctor_ids)
+        }
 
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Formato de fecha no válido: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
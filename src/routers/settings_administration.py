@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
+from src.utils.rpc_gateway import rpc_gateway
+from src.utils.configuracion import configuracion_sistema, validar_valor
 
 settings_router = APIRouter(tags=["Configuración del Sistema"], prefix="/Configuracion")
 
@@ -19,43 +21,50 @@ class ActualizarConfiguracion(BaseModel):
 async def listar_configuraciones(categoria: Optional[str] = None):
     """
     Lista todas las configuraciones del sistema, opcionalmente filtradas por categoría.
+    Se lee desde el snapshot en memoria (ya ordenado por categoría y clave).
     """
     try:
-        query = supabase_client.table("configuracion_sistema").select("*")
-        
-        if categoria:
-            query = query.eq("categoria", categoria)
-        
-        resultado = query.order("categoria").order("clave").execute()
-        
+        snapshot = await configuracion_sistema.vigente()
+
+        configuraciones = [
+            fila for fila in snapshot.filas.values()
+            if not categoria or fila.get("categoria") == categoria
+        ]
+
         return {
-            "total": len(resultado.data) if resultado.data else 0,
-            "configuraciones": resultado.data or []
+            "total": len(configuraciones),
+            "configuraciones": configuraciones
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@settings_router.get("/version")
+async def obtener_version_configuracion():
+    """
+    Versión del snapshot de configuración de este worker.
+    """
+    try:
+        snapshot = await configuracion_sistema.vigente()
+        return {"version": snapshot.version, "cargado_en": snapshot.cargado_en}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @settings_router.get("/obtener/{clave}")
 async def obtener_configuracion(clave: str):
     """
-    Obtiene una configuración específica por su clave.
+    Obtiene una configuración específica por su clave (desde el snapshot en memoria).
     """
     try:
-        resultado = (
-            supabase_client
-            .table("configuracion_sistema")
-            .select("*")
-            .eq("clave", clave)
-            .execute()
-        )
-        
-        if not resultado.data:
+        snapshot = await configuracion_sistema.vigente()
+        fila = snapshot.filas.get(clave)
+
+        if not fila:
             raise HTTPException(
                 status_code=404,
                 detail=f"No existe la configuración con clave '{clave}'."
             )
-        
-        return resultado.data[0]
+
+        return fila
     except HTTPException:
         raise
     except Exception as e:
@@ -69,7 +78,7 @@ async def actualizar_configuracion(clave: str, datos: ActualizarConfiguracion):
     try:
         # Verificar que existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("configuracion_sistema")
             .select("id, clave")
             .eq("clave", clave)
@@ -84,7 +93,7 @@ async def actualizar_configuracion(clave: str, datos: ActualizarConfiguracion):
         
         # Actualizar valor
         resultado = (
-            supabase_client
+            await supabase_async
             .table("configuracion_sistema")
             .update({"valor": datos.valor})
             .eq("clave", clave)
@@ -93,7 +102,9 @@ async def actualizar_configuracion(clave: str, datos: ActualizarConfiguracion):
         
         if not resultado.data:
             raise HTTPException(status_code=500, detail="No se pudo actualizar la configuración.")
-        
+
+        await configuracion_sistema.recargar()
+
         return {
             "mensaje": "Configuración actualizada correctamente.",
             "configuracion": resultado.data[0]
@@ -111,7 +122,7 @@ async def crear_configuracion(config: ConfiguracionBase):
     try:
         # Verificar que no existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("configuracion_sistema")
             .select("id")
             .eq("clave", config.clave)
@@ -134,7 +145,7 @@ async def crear_configuracion(config: ConfiguracionBase):
         }
         
         resultado = (
-            supabase_client
+            await supabase_async
             .table("configuracion_sistema")
             .insert(nuevo)
             .execute()
@@ -142,7 +153,9 @@ async def crear_configuracion(config: ConfiguracionBase):
         
         if not resultado.data:
             raise HTTPException(status_code=500, detail="No se pudo crear la configuración.")
-        
+
+        await configuracion_sistema.recargar()
+
         return {
             "mensaje": "Configuración creada correctamente.",
             "configuracion": resultado.data[0]
@@ -157,41 +170,89 @@ async def actualizar_multiple_configuraciones(configuraciones: List[dict]):
     """
     Actualiza múltiples configuraciones de una vez.
     Espera una lista de objetos con { clave, valor }
+    Todo o nada: los cambios se aplican con la función SQL actualizar_configuraciones
+    (solo UPDATE de id y valor, en una transacción); si alguna clave tiene error no
+    se aplica ninguno y se responde 400 con el error de cada clave.
     """
     try:
-        actualizados = []
         errores = []
-        
+        cambios = {}
+
         for config in configuraciones:
-            try:
-                clave = config.get("clave")
-                valor = config.get("valor")
-                
-                if not clave:
-                    errores.append({"clave": "unknown", "error": "Clave no proporcionada"})
-                    continue
-                
-                # Actualizar
-                resultado = (
-                    supabase_client
-                    .table("configuracion_sistema")
-                    .update({"valor": valor})
-                    .eq("clave", clave)
-                    .execute()
+            clave = config.get("clave")
+            if not clave:
+                errores.append({"clave": "unknown", "error": "Clave no proporcionada"})
+                continue
+            if clave in cambios:
+                errores.append({"clave": clave, "error": "Clave repetida en la solicitud"})
+                continue
+            cambios[clave] = config.get("valor")
+
+        # Filas actuales de todas las claves en una sola consulta
+        existentes = {}
+        if cambios:
+            resultado = (
+                await supabase_async
+                .table("configuracion_sistema")
+                .select("id, clave, tipo")
+                .in_("clave", list(cambios.keys()))
+                .execute()
+            )
+            existentes = {fila["clave"]: fila for fila in (resultado.data or [])}
+
+        filas = []
+        for clave, valor in cambios.items():
+            fila = existentes.get(clave)
+            if not fila:
+                errores.append({"clave": clave, "error": "No existe la configuración"})
+                continue
+
+            error_tipo = validar_valor(valor, fila.get("tipo"))
+            if error_tipo:
+                errores.append({"clave": clave, "error": error_tipo})
+                continue
+
+            filas.append({"id": fila["id"], "valor": valor})
+
+        if errores:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "mensaje": "No se aplicó ningún cambio: hay configuraciones con errores.",
+                    "errores": errores
+                }
+            )
+
+        actualizados = []
+        if filas:
+            # Una transacción: se aplican todas las claves o ninguna, sin reinsertar filas
+            resultado = await rpc_gateway.llamar(
+                "actualizar_configuraciones", {"p_cambios": filas}, escritura=True
+            )
+
+            if resultado is None:
+                # Sin la función no hay forma de aplicar todas las claves o ninguna
+                raise HTTPException(
+                    status_code=503,
+                    detail="La actualización múltiple no está disponible; no se aplicó ningún cambio."
                 )
-                
-                if resultado.data:
-                    actualizados.append(resultado.data[0])
-                else:
-                    errores.append({"clave": clave, "error": "No se pudo actualizar"})
-                    
-            except Exception as e:
-                errores.append({"clave": config.get("clave", "unknown"), "error": str(e)})
-        
+
+            datos = resultado.data or {}
+            if datos.get("error"):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Una o más configuraciones fueron eliminadas; no se aplicó ningún cambio."
+                )
+            actualizados = datos.get("actualizados") or []
+
+            await configuracion_sistema.recargar()
+
         return {
             "mensaje": f"Se actualizaron {len(actualizados)} configuraciones correctamente.",
             "actualizados": actualizados,
-            "errores": errores if errores else None
+            "errores": None
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
 from src.models.users import Rol, Usuario
-from src.utils.supabase import supabase_client
+from src.utils.supabase_async import supabase_async
+from src.utils.paginacion import aplicar_cursor, cortar_pagina
+from src.utils.cache_catalogos import cache_catalogos
 
 user_router = APIRouter(tags=["Gestión de Usuarios y Roles"], prefix="/Usuarios")
 
@@ -13,7 +16,7 @@ async def crear_rol(rol: Rol):
     try:
         # 1) Verificar si ya existe
         existe = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .select("id, nombre")
             .eq("nombre", rol.nombre)
@@ -27,7 +30,7 @@ async def crear_rol(rol: Rol):
 
         # 2) Insertar nuevo rol
         nuevo = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .insert({
                 "nombre": rol.nombre,
@@ -35,12 +38,13 @@ async def crear_rol(rol: Rol):
             })
             .execute()
         )
+        cache_catalogos.invalidar("rol")
         if not nuevo.data:
             raise HTTPException(status_code=500, detail="No se pudo insertar el rol.")
 
         # 3) Obtener lista de roles actualizada
         roles_actuales = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .select("id, nombre, descripcion")
             .order("id", desc=False)
@@ -67,7 +71,7 @@ async def modificar_rol(rol_id: int, rol: Rol):
     try:
         # Verificar existencia
         existente = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .select("id, nombre")
             .eq("id", rol_id)
@@ -79,7 +83,7 @@ async def modificar_rol(rol_id: int, rol: Rol):
 
         # Verificar duplicado de nombre (otro rol con mismo nombre)
         duplicado = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .select("id")
             .eq("nombre", rol.nombre)
@@ -91,7 +95,7 @@ async def modificar_rol(rol_id: int, rol: Rol):
 
         # Actualizar datos
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .update({
                 "nombre": rol.nombre,
@@ -101,6 +105,7 @@ async def modificar_rol(rol_id: int, rol: Rol):
             .execute()
         )
 
+        cache_catalogos.invalidar("rol")
         if not actualizado.data:
             raise HTTPException(status_code=500, detail="No se pudo actualizar el rol.")
 
@@ -125,7 +130,7 @@ async def eliminar_rol(rol_id: int):
     try:
         # Verificar existencia
         existe = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .select("id, nombre")
             .eq("id", rol_id)
@@ -138,13 +143,14 @@ async def eliminar_rol(rol_id: int):
 
         # Eliminar el rol
         eliminado = (
-            supabase_client
+            await supabase_async
             .table("rol")
             .delete()
             .eq("id", rol_id)
             .execute()
         )
 
+        cache_catalogos.invalidar("rol")
         if not eliminado.data:
             raise HTTPException(status_code=500, detail="No se pudo eliminar el rol.")
 
@@ -165,7 +171,7 @@ async def crear_usuario(usuario: Usuario):
     try:
         # Verificar si ya existe rut o email
         existe = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .or_(f"rut.eq.{usuario.rut},email.eq.{usuario.email}")
@@ -175,7 +181,7 @@ async def crear_usuario(usuario: Usuario):
             raise HTTPException(status_code=409, detail="Ya existe un usuario con ese rut o email.")
 
         nuevo = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .insert({
                 "nombre": usuario.nombre,
@@ -205,17 +211,17 @@ async def crear_usuario(usuario: Usuario):
                 }
                 for esp_id in usuario.especialidades_ids
             ]
-            supabase_client.table("especialidades_doctor").insert(especialidades_data).execute()
+            await supabase_async.table("especialidades_doctor").insert(especialidades_data).execute()
         elif usuario.especialidad_id and usuario.especialidad_id != "":
             # Compatibilidad con especialidad única
-            supabase_client.table("especialidades_doctor").insert({
+            await supabase_async.table("especialidades_doctor").insert({
                 "usuario_sistema_id": usuario_id,
                 "especialidad_id": int(usuario.especialidad_id)
             }).execute()
 
         # Si tiene contraseña temporal, crear registro en tabla contraseñas
         if usuario.contraseña_temporal and usuario.contraseña_temporal != "":
-            supabase_client.table("contraseñas").insert({
+            await supabase_async.table("contraseñas").insert({
                 "id_profesional_salud": usuario_id,
                 "contraseña_temporal": usuario.contraseña_temporal,
                 "contraseña": None  # La contraseña permanente se establecerá al primer login
@@ -235,7 +241,7 @@ async def modificar_usuario(usuario_id: int, usuario: Usuario):
     """
     try:
         existe = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .eq("id", usuario_id)
@@ -246,7 +252,7 @@ async def modificar_usuario(usuario_id: int, usuario: Usuario):
 
         # Verificar duplicado de rut o email (en otro usuario)
         duplicado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .or_(f"rut.eq.{usuario.rut},email.eq.{usuario.email}")
@@ -257,7 +263,7 @@ async def modificar_usuario(usuario_id: int, usuario: Usuario):
             raise HTTPException(status_code=409, detail="Ya existe otro usuario con ese rut o email.")
 
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .update({
                 "nombre": usuario.nombre,
@@ -279,7 +285,7 @@ async def modificar_usuario(usuario_id: int, usuario: Usuario):
         # Actualizar especialidades (en especialidades_doctor)
         if usuario.especialidades_ids is not None:
             # Primero eliminar todas las especialidades existentes
-            supabase_client.table("especialidades_doctor").delete().eq("usuario_sistema_id", usuario_id).execute()
+            await supabase_async.table("especialidades_doctor").delete().eq("usuario_sistema_id", usuario_id).execute()
             
             # Luego insertar las nuevas especialidades
             if len(usuario.especialidades_ids) > 0:
@@ -290,12 +296,12 @@ async def modificar_usuario(usuario_id: int, usuario: Usuario):
                     }
                     for esp_id in usuario.especialidades_ids
                 ]
-                supabase_client.table("especialidades_doctor").insert(especialidades_data).execute()
+                await supabase_async.table("especialidades_doctor").insert(especialidades_data).execute()
         elif usuario.especialidad_id and usuario.especialidad_id != "":
             # Compatibilidad con especialidad única
             # Eliminar todas y agregar solo una
-            supabase_client.table("especialidades_doctor").delete().eq("usuario_sistema_id", usuario_id).execute()
-            supabase_client.table("especialidades_doctor").insert({
+            await supabase_async.table("especialidades_doctor").delete().eq("usuario_sistema_id", usuario_id).execute()
+            await supabase_async.table("especialidades_doctor").insert({
                 "usuario_sistema_id": usuario_id,
                 "especialidad_id": int(usuario.especialidad_id)
             }).execute()
@@ -315,7 +321,7 @@ async def eliminar_usuario(usuario_id: int):
     """
     try:
         existe = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, nombre, apellido_paterno, activo")
             .eq("id", usuario_id)
@@ -330,7 +336,7 @@ async def eliminar_usuario(usuario_id: int):
 
         # Soft delete: marcar como inactivo en lugar de eliminar
         actualizado = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .update({"activo": False})
             .eq("id", usuario_id)
@@ -347,25 +353,32 @@ async def eliminar_usuario(usuario_id: int):
         raise HTTPException(status_code=500, detail=str(e))
     
 @user_router.get("/listar-usuarios")
-async def listar_usuarios():
+async def listar_usuarios(
+    limite: Optional[int] = Query(None, ge=1, le=500, description="Usuarios por página (sin limite ni cursor se listan todos)"),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la respuesta anterior")
+):
     """
     Devuelve todos los usuarios existentes en la tabla 'usuario_sistema'.
     Para doctores (rol_id=2), incluye su especialidad desde la tabla especialidades_doctor.
     OPTIMIZADO: Bulk query en lugar de N+1.
+    Con limite/cursor pagina por id en la base de datos.
     """
     try:
-        # Obtener todos los usuarios
-        res = (
-            supabase_client
-            .table("usuario_sistema")
-            .select("*")
-            .order("id", desc=False)
-            .execute()
-        )
-        if not res.data:
+        # Obtener los usuarios (página por id si se pidió)
+        query = aplicar_cursor(supabase_async.table("usuario_sistema").select("*"), cursor)
+
+        paginar = limite is not None or cursor is not None
+        if paginar:
+            limite = limite or 50
+            query = query.limit(limite + 1)
+
+        res = await query.execute()
+        if not res.data and not cursor:
             raise HTTPException(status_code=404, detail="No hay usuarios registrados.")
-        
-        usuarios = res.data
+
+        usuarios, siguiente_cursor = res.data or [], None
+        if paginar:
+            usuarios, siguiente_cursor = cortar_pagina(usuarios, limite)
         
         # OPTIMIZACIÓN: Obtener IDs de todos los doctores
         doctor_ids = [u["id"] for u in usuarios if u.get("rol_id") == 2]
@@ -374,7 +387,7 @@ async def listar_usuarios():
         especialidades_dict = {}
         if doctor_ids:
             especialidades_response = (
-                supabase_client
+                await supabase_async
                 .table("especialidades_doctor")
                 .select("usuario_sistema_id, especialidad_id, sub_especialidad_id")
                 .in_("usuario_sistema_id", doctor_ids)
@@ -408,7 +421,7 @@ async def listar_usuarios():
                 usuario["especialidad_id"] = None
                 usuario["sub_especialidad_id"] = None
         
-        return {"usuarios": usuarios}
+        return {"usuarios": usuarios, "siguiente_cursor": siguiente_cursor}
     except HTTPException:
         raise
     except Exception as e:
@@ -431,7 +444,7 @@ async def listar_doctores_paginado(
         
         # QUERY 1: Obtener doctores con contraseña temporal en un solo JOIN
         query = (
-            supabase_client
+            supabase_async
             .table("usuario_sistema")
             .select("""
                 *,
@@ -451,7 +464,7 @@ async def listar_doctores_paginado(
         
         # Aplicar paginación y ordenar
         res = (
-            query
+            await query
             .order("id", desc=False)
             .range(offset, offset + page_size - 1)
             .execute()
@@ -478,7 +491,7 @@ async def listar_doctores_paginado(
         doctor_ids = [doctor["id"] for doctor in doctores]
         
         especialidades_response = (
-            supabase_client
+            await supabase_async
             .table("especialidades_doctor")
             .select("usuario_sistema_id, especialidad_id, sub_especialidad_id, especialidad(id, nombre)")
             .in_("usuario_sistema_id", doctor_ids)
@@ -542,7 +555,7 @@ async def obtener_usuario(usuario_id: int):
     try:
         # Obtener el usuario
         res = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("*")
             .eq("id", usuario_id)
@@ -557,7 +570,7 @@ async def obtener_usuario(usuario_id: int):
         # Si es doctor (rol_id=2), obtener sus especialidades
         if usuario.get("rol_id") == 2:
             especialidades_doctor = (
-                supabase_client
+                await supabase_async
                 .table("especialidades_doctor")
                 .select("especialidad_id, sub_especialidad_id")
                 .eq("usuario_sistema_id", usuario_id)
@@ -569,7 +582,7 @@ async def obtener_usuario(usuario_id: int):
                 especialidades_detalle = []
                 for esp in especialidades_doctor.data:
                     especialidad = (
-                        supabase_client
+                        await supabase_async
                         .table("especialidad")
                         .select("id, nombre, descripcion")
                         .eq("id", esp["especialidad_id"])
@@ -598,18 +611,21 @@ async def listar_roles():
     Devuelve todos los roles existentes en la tabla 'rol'.
     """
     try:
-        res = (
-            supabase_client
-            .table("rol")
-            .select("*")
-            .order("id", desc=False)
-            .execute()
-        )
+        async def cargar():
+            res = (
+                await supabase_async
+                .table("rol")
+                .select("*")
+                .order("id", desc=False)
+                .execute()
+            )
+            return res.data or []
 
-        if not res.data:
+        roles = await cache_catalogos.obtener("rol", "todos", cargar)
+        if not roles:
             raise HTTPException(status_code=404, detail="No hay roles registrados.")
 
-        return {"roles": res.data}
+        return {"roles": roles}
 
     except HTTPException:
         raise
@@ -625,7 +641,7 @@ async def obtener_clave_temporal(usuario_id: int):
     try:
         # Verificar que el usuario existe
         usuario = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, rol_id")
             .eq("id", usuario_id)
@@ -637,7 +653,7 @@ async def obtener_clave_temporal(usuario_id: int):
 
         # Buscar registro de contraseña
         registro_password = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .select("contraseña_temporal")
             .eq("id_profesional_salud", usuario_id)
@@ -669,7 +685,7 @@ async def generar_clave_temporal(usuario_id: int, contraseña_temporal: str = Qu
     try:
         # Verificar que el usuario existe
         usuario = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, rol_id")
             .eq("id", usuario_id)
@@ -681,7 +697,7 @@ async def generar_clave_temporal(usuario_id: int, contraseña_temporal: str = Qu
 
         # Verificar si ya tiene un registro en la tabla contraseñas
         registro_password = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .select("id")
             .eq("id_profesional_salud", usuario_id)
@@ -690,12 +706,12 @@ async def generar_clave_temporal(usuario_id: int, contraseña_temporal: str = Qu
 
         if registro_password.data:
             # Actualizar la contraseña temporal existente
-            supabase_client.table("contraseñas").update({
+            await supabase_async.table("contraseñas").update({
                 "contraseña_temporal": contraseña_temporal
             }).eq("id_profesional_salud", usuario_id).execute()
         else:
             # Crear nuevo registro con contraseña temporal
-            supabase_client.table("contraseñas").insert({
+            await supabase_async.table("contraseñas").insert({
                 "id_profesional_salud": usuario_id,
                 "contraseña_temporal": contraseña_temporal,
                 "contraseña": None
@@ -719,7 +735,7 @@ async def obtener_datos_usuario(usuario_id: int):
     """
     try:
         usuario = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id, nombre, apellido_paterno, apellido_materno, rut, email, celular, cel_secundario, direccion")
             .eq("id", usuario_id)
@@ -758,7 +774,7 @@ async def actualizar_usuario(usuario_id: int, datos: dict):
 
         # Verificar que el usuario existe
         usuario = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .eq("id", usuario_id)
@@ -772,7 +788,7 @@ async def actualizar_usuario(usuario_id: int, datos: dict):
         # Si se está actualizando el email, verificar que no esté en uso
         if "email" in datos_actualizar and datos_actualizar["email"]:
             email_existe = (
-                supabase_client
+                await supabase_async
                 .table("usuario_sistema")
                 .select("id")
                 .eq("email", datos_actualizar["email"])
@@ -783,7 +799,7 @@ async def actualizar_usuario(usuario_id: int, datos: dict):
                 raise HTTPException(status_code=409, detail="El email ya está en uso")
 
         # Actualizar el usuario
-        supabase_client.table("usuario_sistema").update(
+        await supabase_async.table("usuario_sistema").update(
             datos_actualizar
         ).eq("id", usuario_id).execute()
 
@@ -813,7 +829,7 @@ async def cambiar_password(usuario_id: int, datos: dict):
 
         # Verificar que el usuario existe
         usuario = (
-            supabase_client
+            await supabase_async
             .table("usuario_sistema")
             .select("id")
             .eq("id", usuario_id)
@@ -826,7 +842,7 @@ async def cambiar_password(usuario_id: int, datos: dict):
 
         # Obtener el registro de contraseñas
         registro_password = (
-            supabase_client
+            await supabase_async
             .table("contraseñas")
             .select("id, contraseña")
             .eq("id_profesional_salud", usuario_id)
@@ -845,7 +861,7 @@ async def cambiar_password(usuario_id: int, datos: dict):
             raise HTTPException(status_code=401, detail="Contraseña actual incorrecta")
 
         # Actualizar la contraseña
-        supabase_client.table("contraseñas").update({
+        await supabase_async.table("contraseñas").update({
             "contraseña": password_nueva,
             "contraseña_temporal": None  # Limpiar contraseña temporal si existe
         }).eq("id_profesional_salud", usuario_id).execute()
@@ -0,0 +1,120 @@
+"""
+Cache en memoria para catálogos que casi no cambian (especialidad, diagnosticos,
+prevencion, rol, costos_servicio).
+
+Cada entrada vence a los CACHE_CATALOGOS_TTL_SEGUNDOS y el cache no guarda más
+de CACHE_CATALOGOS_MAX_ENTRADAS (se descarta la usada hace más tiempo). Los
+endpoints que escriben en un catálogo llaman a invalidar() para que el cambio
+se vea de inmediato en este worker; en los demás workers se ve al vencer el TTL.
+"""
+import asyncio
+import copy
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from src.utils.supabase_async import supabase_async
+
+TTL_SEGUNDOS = float(os.getenv("CACHE_CATALOGOS_TTL_SEGUNDOS", "300"))
+MAX_ENTRADAS = int(os.getenv("CACHE_CATALOGOS_MAX_ENTRADAS", "256"))
+
+
+class CacheCatalogos:
+    """Cache LRU con TTL, agrupado por catálogo para poder invalidarlo completo."""
+
+    def __init__(self, ttl: float = TTL_SEGUNDOS, max_entradas: int = MAX_ENTRADAS):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._cargando: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        # Se incrementa al invalidar: una carga iniciada antes no se guarda
+        self._versiones: Dict[str, int] = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    async def obtener(self, catalogo: str, clave: Hashable, cargar: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Retorna una copia del valor cacheado, o lo carga con cargar().
+        Requests simultáneos por la misma clave comparten una sola carga.
+        """
+        llave = (catalogo, clave)
+        entrada = self._entradas.get(llave)
+        if entrada and entrada[0] > time.monotonic():
+            self._entradas.move_to_end(llave)
+            self.aciertos += 1
+            return copy.deepcopy(entrada[1])
+
+        self.fallos += 1
+        if llave in self._cargando:
+            return copy.deepcopy(await asyncio.shield(self._cargando[llave]))
+
+        version = self._versiones.get(catalogo, 0)
+        futuro = asyncio.get_running_loop().create_future()
+        self._cargando[llave] = futuro
+        try:
+            valor = await cargar()
+        except Exception as e:
+            futuro.set_exception(e)
+            # Evita el warning de excepción no recuperada si nadie más esperaba
+            futuro.exception()
+            raise
+        finally:
+            self._cargando.pop(llave, None)
+
+        if self._versiones.get(catalogo, 0) == version:
+            self._guardar(llave, valor)
+        futuro.set_result(valor)
+        return copy.deepcopy(valor)
+
+    def _guardar(self, llave: Tuple[str, Hashable], valor: Any) -> None:
+        self._entradas[llave] = (time.monotonic() + self.ttl, valor)
+        self._entradas.move_to_end(llave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, *catalogos: str) -> None:
+        """Descarta todas las entradas de los catálogos indicados."""
+        for catalogo in catalogos:
+            self._versiones[catalogo] = self._versiones.get(catalogo, 0) + 1
+        for llave in [llave for llave in self._entradas if llave[0] in catalogos]:
+            del self._entradas[llave]
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+        }
+
+
+cache_catalogos = CacheCatalogos()
+
+
+async def obtener_costos_servicio() -> Dict[int, Dict[str, Any]]:
+    """
+    Retorna {especialidad_id: costo_servicio} (primer costo de cada especialidad),
+    cacheado. Reemplaza las consultas a costos_servicio por especialidad.
+    """
+    async def cargar():
+        res = await (
+            supabase_async
+            .table("costos_servicio")
+            .select("id, servicio, precio, especialidad_id")
+            .order("id", desc=False)
+            .execute()
+        )
+        costos: Dict[int, Dict[str, Any]] = {}
+        for costo in (res.data or []):
+            if costo.get("especialidad_id") is not None and costo["especialidad_id"] not in costos:
+                costos[costo["especialidad_id"]] = costo
+        return costos
+
+    return await cache_catalogos.obtener("costos_servicio", "por_especialidad", cargar)
+
+
+async def obtener_costo_especialidad(especialidad_id: int) -> Optional[Dict[str, Any]]:
+    """Costo de servicio de una especialidad (None si no tiene), desde el cache."""
+    costos = await obtener_costos_servicio()
+    return costos.get(especialidad_id)
@@ -0,0 +1,168 @@
+"""
+Snapshot en memoria de configuracion_sistema.
+
+La configuración se carga completa al iniciar la aplicación y se reemplaza de
+una sola vez (asignación atómica del snapshot) cuando se escribe desde este
+worker. Para detectar cambios hechos por otros workers se compara la versión
+del snapshot con configuracion_sistema_version (una fila), como máximo cada
+CONFIG_VERIFICAR_SEGUNDOS; solo si cambió se recarga la tabla.
+
+Los valores se convierten según su columna tipo una sola vez al cargar, así
+los accesores tipados (entero, decimal, booleano, ...) no parsean en cada lectura.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, time as dtime
+from typing import Any, Dict, List, Optional
+from src.utils.supabase_async import supabase_async
+
+VERIFICAR_SEGUNDOS = float(os.getenv("CONFIG_VERIFICAR_SEGUNDOS", "5"))
+
+
+def _convertir_estricto(valor: str, tipo: str) -> Any:
+    """Convierte según tipo; lanza ValueError si el valor no corresponde."""
+    if tipo in ("numero", "entero", "integer", "int"):
+        return int(valor)
+    if tipo in ("decimal", "float"):
+        return float(valor)
+    if tipo in ("booleano", "boolean", "bool"):
+        normalizado = str(valor).strip().lower()
+        if normalizado not in ("true", "false", "1", "0", "si", "sí", "no", "on", "off"):
+            raise ValueError("se esperaba un booleano")
+        return normalizado in ("true", "1", "si", "sí", "on")
+    if tipo == "json":
+        return json.loads(valor)
+    if tipo == "hora":
+        return dtime.fromisoformat(valor)
+    return valor
+
+
+def validar_valor(valor: Any, tipo: Optional[str]) -> Optional[str]:
+    """Retorna un mensaje de error si el valor no es válido para el tipo, o None."""
+    if valor is None:
+        return None
+    tipo = (tipo or "texto").lower()
+    try:
+        _convertir_estricto(str(valor), tipo)
+        return None
+    except (TypeError, ValueError):
+        return f"Valor '{valor}' no válido para el tipo '{tipo}'"
+
+
+def convertir_valor(valor: Optional[str], tipo: Optional[str]) -> Any:
+    """Convierte el valor (texto en la BD) al tipo declarado. Si no calza, queda como texto."""
+    if valor is None:
+        return None
+    tipo = (tipo or "texto").lower()
+    try:
+        return _convertir_estricto(valor, tipo)
+    except (TypeError, ValueError):
+        print(f"⚠️ Configuración con valor '{valor}' no válido para tipo '{tipo}', se usa como texto")
+    return valor
+
+
+class SnapshotConfiguracion:
+    """Configuración completa en un momento dado. No se modifica después de creada."""
+
+    def __init__(self, filas: List[Dict[str, Any]], version: Optional[int]):
+        self.version = version
+        self.cargado_en = datetime.now().isoformat()
+        self.filas: Dict[str, Dict[str, Any]] = {fila["clave"]: fila for fila in filas}
+        self.valores: Dict[str, Any] = {
+            fila["clave"]: convertir_valor(fila.get("valor"), fila.get("tipo"))
+            for fila in filas
+        }
+
+
+class ConfiguracionSistema:
+    """Acceso a la configuración vigente."""
+
+    def __init__(self):
+        self._snapshot = SnapshotConfiguracion([], None)
+        self._ultima_verificacion = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def snapshot(self) -> SnapshotConfiguracion:
+        return self._snapshot
+
+    async def _version_remota(self) -> Optional[int]:
+        try:
+            res = await (
+                supabase_async
+                .table("configuracion_sistema_version")
+                .select("version")
+                .eq("id", 1)
+                .execute()
+            )
+            return res.data[0]["version"] if res.data else None
+        except Exception as e:
+            # Sin la migración 0005 no hay contador: se recarga en cada verificación
+            print(f"⚠️ No se pudo leer la versión de configuración: {str(e)}")
+            return None
+
+    async def recargar(self) -> SnapshotConfiguracion:
+        """Lee la tabla completa y reemplaza el snapshot."""
+        async with self._lock:
+            # La versión se lee antes que las filas: si alguien escribe entre
+            # ambas lecturas, el snapshot queda con la versión anterior y la
+            # próxima verificación lo vuelve a cargar (nunca al revés).
+            version = await self._version_remota()
+            filas = await (
+                supabase_async
+                .table("configuracion_sistema")
+                .select("*")
+                .order("categoria")
+                .order("clave")
+                .execute()
+            )
+            self._snapshot = SnapshotConfiguracion(filas.data or [], version)
+            self._ultima_verificacion = time.monotonic()
+            return self._snapshot
+
+    async def vigente(self) -> SnapshotConfiguracion:
+        """
+        Retorna el snapshot, recargándolo si otro worker cambió la configuración.
+        La versión remota se consulta como máximo cada VERIFICAR_SEGUNDOS.
+        """
+        if time.monotonic() - self._ultima_verificacion < VERIFICAR_SEGUNDOS:
+            return self._snapshot
+
+        self._ultima_verificacion = time.monotonic()
+        version = await self._version_remota()
+        if version is None or version != self._snapshot.version:
+            return await self.recargar()
+        return self._snapshot
+
+    # Accesores tipados: leen el snapshot actual sin ir a la base de datos
+
+    def obtener(self, clave: str, defecto: Any = None) -> Any:
+        valor = self._snapshot.valores.get(clave)
+        return defecto if valor is None else valor
+
+    def texto(self, clave: str, defecto: Optional[str] = None) -> Optional[str]:
+        valor = self.obtener(clave)
+        return defecto if valor is None else str(valor)
+
+    def entero(self, clave: str, defecto: Optional[int] = None) -> Optional[int]:
+        valor = self.obtener(clave)
+        return valor if isinstance(valor, int) and not isinstance(valor, bool) else defecto
+
+    def decimal(self, clave: str, defecto: Optional[float] = None) -> Optional[float]:
+        valor = self.obtener(clave)
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            return float(valor)
+        return defecto
+
+    def booleano(self, clave: str, defecto: Optional[bool] = None) -> Optional[bool]:
+        valor = self.obtener(clave)
+        return valor if isinstance(valor, bool) else defecto
+
+    def hora(self, clave: str, defecto: Optional[dtime] = None) -> Optional[dtime]:
+        valor = self.obtener(clave)
+        return valor if isinstance(valor, dtime) else defecto
+
+
+configuracion_sistema = ConfiguracionSistema()
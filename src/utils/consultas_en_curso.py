@@ -0,0 +1,109 @@
+"""
+Cita "En Consulta" de cada doctor, en memoria.
+
+El panel del doctor consulta su cita en curso cada pocos segundos. En vez de
+revisar el historial completo del doctor, se mantiene un mapa
+doctor_id -> cita_id que responde en O(1):
+- se construye con una sola consulta filtrada por estado_actual al iniciar la
+  API (y al vencer CONSULTAS_EN_CURSO_TTL_SEGUNDOS, para ver los cambios hechos
+  desde otros workers);
+- los endpoints que cambian estados lo actualizan en el momento (registrar_estado).
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from src.utils.supabase_async import supabase_async
+
+TTL_SEGUNDOS = float(os.getenv("CONSULTAS_EN_CURSO_TTL_SEGUNDOS", "30"))
+
+ESTADO_EN_CONSULTA = "En Consulta"
+
+
+class ConsultasEnCurso:
+    """Mapa doctor_id -> cita_id de la cita en consulta."""
+
+    def __init__(self, ttl: float = TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._por_doctor: Dict[int, int] = {}
+        self._doctor_de_cita: Dict[int, int] = {}
+        self._vence = 0.0
+        self._lock = asyncio.Lock()
+        # Cambios registrados mientras corre una recarga: se aplican sobre el resultado
+        self._cambios_durante_carga: Optional[List[Tuple[int, Optional[int], str]]] = None
+        self.recargas = 0
+
+    async def recargar(self) -> None:
+        """Reconstruye el mapa con las citas cuyo estado actual es En Consulta."""
+        self._cambios_durante_carga = []
+        try:
+            citas = (
+                await supabase_async
+                .table("cita_medica")
+                .select("id, doctor_id")
+                .eq("estado_actual", ESTADO_EN_CONSULTA)
+                .order("estado_actualizado_en")
+                .execute()
+            )
+
+            por_doctor: Dict[int, int] = {}
+            doctor_de_cita: Dict[int, int] = {}
+            # Si un doctor quedó con dos citas en consulta, gana la última en cambiar de estado
+            for cita in citas.data or []:
+                if cita.get("doctor_id") is None:
+                    continue
+                anterior = por_doctor.get(cita["doctor_id"])
+                if anterior is not None:
+                    doctor_de_cita.pop(anterior, None)
+                por_doctor[cita["doctor_id"]] = cita["id"]
+                doctor_de_cita[cita["id"]] = cita["doctor_id"]
+
+            self._por_doctor, self._doctor_de_cita = por_doctor, doctor_de_cita
+            self._vence = time.monotonic() + self.ttl
+            self.recargas += 1
+        finally:
+            cambios, self._cambios_durante_carga = self._cambios_durante_carga, None
+
+        for cita_id, doctor_id, estado in cambios or []:
+            self.registrar_estado(cita_id, doctor_id, estado)
+
+    async def cita_de(self, doctor_id: int) -> Optional[int]:
+        """Id de la cita en consulta del doctor, o None."""
+        if self._vence <= time.monotonic():
+            async with self._lock:
+                # Otro request pudo recargar mientras se esperaba el lock
+                if self._vence <= time.monotonic():
+                    await self.recargar()
+        return self._por_doctor.get(doctor_id)
+
+    def registrar_estado(self, cita_id: int, doctor_id: Optional[int], estado: str) -> None:
+        """Actualiza el mapa tras un cambio de estado (o de doctor) de una cita."""
+        if self._cambios_durante_carga is not None:
+            self._cambios_durante_carga.append((cita_id, doctor_id, estado))
+
+        doctor_anterior = self._doctor_de_cita.pop(cita_id, None)
+        if doctor_anterior is not None and self._por_doctor.get(doctor_anterior) == cita_id:
+            del self._por_doctor[doctor_anterior]
+
+        if estado == ESTADO_EN_CONSULTA and doctor_id is not None:
+            reemplazada = self._por_doctor.get(doctor_id)
+            if reemplazada is not None:
+                self._doctor_de_cita.pop(reemplazada, None)
+            self._por_doctor[doctor_id] = cita_id
+            self._doctor_de_cita[cita_id] = doctor_id
+
+    def cambiar_doctor(self, cita_id: int, doctor_id: int) -> None:
+        """Mueve la cita en consulta a otro doctor (modificar_cita)."""
+        if cita_id in self._doctor_de_cita:
+            self.registrar_estado(cita_id, doctor_id, ESTADO_EN_CONSULTA)
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "doctores_en_consulta": len(self._por_doctor),
+            "ttl_segundos": self.ttl,
+            "segundos_para_recarga": max(0.0, round(self._vence - time.monotonic(), 1)),
+            "recargas": self.recargas,
+        }
+
+
+consultas_en_curso = ConsultasEnCurso()
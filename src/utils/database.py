@@ -0,0 +1,14 @@
+import os
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+# Conexión directa a Postgres (no PostgREST); la usan Alembic y los scripts de mantenimiento
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+
+def crear_engine() -> Engine:
+    if not DATABASE_URL:
+        raise RuntimeError("La variable de entorno DATABASE_URL no está configurada.")
+    return create_engine(DATABASE_URL, pool_pre_ping=True)
@@ -0,0 +1,189 @@
+"""
+Disponibilidad de bloques de horario (bloques sin cita activa).
+
+Los bloques y las citas no canceladas de todos los doctores pedidos se traen en
+bloque (una consulta por tabla, paginada; la usa el índice de disponibilidad) y
+se cruzan por doctor con un merge de dos punteros sobre listas ordenadas:
+O(bloques + citas) en vez de revisar cada bloque para cada cita.
+
+El estado se lee de cita_medica.estado_actual (ver migración 0001), así que no
+hace falta consultar estado_cita por cada cita.
+
+Para buscar los próximos bloques libres entre varios doctores, cada doctor es un
+flujo ordenado que se lee por páginas y los flujos se combinan con un heap.
+"""
+import asyncio
+import heapq
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from src.utils.intervalos import a_datetime
+from src.utils.paginacion import aplicar_cursor, codificar_cursor
+from src.utils.supabase_async import supabase_async
+
+# Filas por página (límite de filas por respuesta de PostgREST)
+TAMANO_PAGINA = 1000
+
+
+async def _leer_paginado(construir_query) -> List[Dict[str, Any]]:
+    """Ejecuta la query página por página hasta traer todas las filas."""
+    filas = []
+    offset = 0
+    while True:
+        pagina = await construir_query().range(offset, offset + TAMANO_PAGINA - 1).execute()
+        filas.extend(pagina.data or [])
+        if len(pagina.data or []) < TAMANO_PAGINA:
+            return filas
+        offset += TAMANO_PAGINA
+
+
+async def cargar_bloques(doctor_ids: List[int], desde: str, hasta: str) -> List[Dict[str, Any]]:
+    """Bloques de los doctores que tocan [desde, hasta], ordenados por doctor e inicio."""
+    return await _leer_paginado(lambda: (
+        supabase_async
+        .table("horarios_personal")
+        .select("id, inicio_bloque, finalizacion_bloque, usuario_sistema_id")
+        .in_("usuario_sistema_id", doctor_ids)
+        .lte("inicio_bloque", hasta)
+        .gte("finalizacion_bloque", desde)
+        .order("usuario_sistema_id")
+        .order("inicio_bloque")
+        .order("id")
+    ))
+
+
+async def cargar_citas_activas(doctor_ids: List[int], desde: str, hasta: str) -> List[Dict[str, Any]]:
+    """Citas no canceladas de los doctores con fecha_atencion en [desde, hasta)."""
+    return await _leer_paginado(lambda: (
+        supabase_async
+        .table("cita_medica")
+        .select("id, fecha_atencion, doctor_id")
+        .in_("doctor_id", doctor_ids)
+        .gte("fecha_atencion", desde)
+        .lt("fecha_atencion", hasta)
+        # Citas sin estado (antes del backfill) cuentan como activas
+        .or_("estado_actual.is.null,estado_actual.neq.Cancelada")
+        .order("doctor_id")
+        .order("fecha_atencion")
+        .order("id")
+    ))
+
+
+async def cargar_bloques_con_citas(doctor_ids: List[int], desde: str, hasta: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Bloques de los doctores que tocan [desde, hasta] y sus citas activas. Dos
+    consultas: un bloque puede empezar antes de "desde", así que las citas se
+    buscan en todo el rango que cubren los bloques.
+    """
+    bloques = await cargar_bloques(doctor_ids, desde, hasta)
+    if not bloques:
+        return [], []
+    citas = await cargar_citas_activas(
+        doctor_ids,
+        min(bloques, key=lambda b: a_datetime(b["inicio_bloque"]))["inicio_bloque"],
+        max(bloques, key=lambda b: a_datetime(b["finalizacion_bloque"]))["finalizacion_bloque"]
+    )
+    return bloques, citas
+
+
+def bloques_ocupados(bloques: List[Dict[str, Any]], citas: Iterable[Dict[str, Any]]) -> Set[int]:
+    """
+    Ids de los bloques de UN doctor que contienen alguna cita (inicio <= cita < fin).
+
+    Ambas listas se recorren ordenadas por tiempo con dos punteros. Los bloques de
+    un doctor no se solapan, así que al ordenar por inicio también quedan
+    ordenados por fin y ninguna cita necesita volver atrás.
+    """
+    bloques = sorted(bloques, key=lambda b: a_datetime(b["inicio_bloque"]))
+    inicios = [a_datetime(b["inicio_bloque"]) for b in bloques]
+    fines = [a_datetime(b["finalizacion_bloque"]) for b in bloques]
+    fechas = sorted(a_datetime(cita["fecha_atencion"]) for cita in citas)
+
+    ocupados: Set[int] = set()
+    i = 0
+    for fecha in fechas:
+        while i < len(bloques) and fines[i] <= fecha:
+            i += 1
+        if i == len(bloques):
+            break
+        if inicios[i] <= fecha:
+            ocupados.add(bloques[i]["id"])
+    return ocupados
+
+
+class FlujoDisponibilidad:
+    """
+    Bloques libres de UN doctor en orden cronológico, leídos por páginas a medida
+    que se consumen: si el consumidor se detiene, no se leen más páginas.
+    """
+
+    def __init__(self, doctor_id: int, desde: str, hasta: str, tamano_pagina: int):
+        self.doctor_id = doctor_id
+        self.desde = desde
+        self.hasta = hasta
+        self.tamano_pagina = min(tamano_pagina, TAMANO_PAGINA)
+        # Cursor (inicio_bloque, id) de la última fila leída; None antes de la primera página
+        self._cursor: Optional[str] = None
+        self._agotado = False
+        self._buffer: deque = deque()
+
+    async def _cargar_pagina(self) -> None:
+        query = (
+            supabase_async
+            .table("horarios_personal")
+            .select("id, inicio_bloque, finalizacion_bloque, usuario_sistema_id")
+            .eq("usuario_sistema_id", self.doctor_id)
+            .lt("inicio_bloque", self.hasta)
+        )
+        if self._cursor is None:
+            query = query.gte("inicio_bloque", self.desde)
+        # Keyset por (inicio_bloque, id): dos bloques con el mismo inicio no se saltan entre páginas
+        pagina = await aplicar_cursor(query, self._cursor, "inicio_bloque").limit(self.tamano_pagina).execute()
+        bloques = pagina.data or []
+        if len(bloques) < self.tamano_pagina:
+            self._agotado = True
+        if not bloques:
+            return
+
+        self._cursor = codificar_cursor(bloques[-1], "inicio_bloque")
+        citas = await cargar_citas_activas(
+            [self.doctor_id],
+            bloques[0]["inicio_bloque"],
+            max(bloques, key=lambda b: a_datetime(b["finalizacion_bloque"]))["finalizacion_bloque"]
+        )
+        ocupados = bloques_ocupados(bloques, citas)
+        self._buffer.extend(b for b in bloques if b["id"] not in ocupados)
+
+    async def siguiente(self) -> Optional[Dict[str, Any]]:
+        """Próximo bloque libre, o None si no quedan en el rango."""
+        while not self._buffer and not self._agotado:
+            await self._cargar_pagina()
+        return self._buffer.popleft() if self._buffer else None
+
+
+async def proximos_disponibles(doctor_ids: List[int], desde: str, hasta: str, cantidad: int) -> List[Dict[str, Any]]:
+    """
+    Los `cantidad` bloques libres más tempranos entre todos los doctores.
+
+    Merge de k flujos con un heap por inicio de bloque: solo se avanza el flujo del
+    doctor cuyo bloque salió del heap, y la búsqueda se corta al llegar a `cantidad`.
+    La primera página de cada doctor se lee en paralelo.
+    """
+    flujos = [FlujoDisponibilidad(doctor_id, desde, hasta, cantidad * 2) for doctor_id in doctor_ids]
+    primeros = await asyncio.gather(*[flujo.siguiente() for flujo in flujos])
+
+    heap = []
+    for posicion, (flujo, bloque) in enumerate(zip(flujos, primeros)):
+        if bloque:
+            heapq.heappush(heap, (a_datetime(bloque["inicio_bloque"]), flujo.doctor_id, posicion, bloque))
+
+    resultado: List[Dict[str, Any]] = []
+    while heap and len(resultado) < cantidad:
+        _, _, posicion, bloque = heapq.heappop(heap)
+        resultado.append(bloque)
+        if len(resultado) == cantidad:
+            break
+        siguiente = await flujos[posicion].siguiente()
+        if siguiente:
+            heapq.heappush(heap, (a_datetime(siguiente["inicio_bloque"]), flujos[posicion].doctor_id, posicion, siguiente))
+
+    return resultado
@@ -0,0 +1,104 @@
+"""
+Carga por lotes del estado actual de las citas (patrón DataLoader).
+
+Cada request obtiene su propio EstadoCitaLoader vía Depends(obtener_estado_loader).
+Todos los load() pedidos en el mismo tick del event loop se resuelven con una
+sola consulta in_() sobre cita_medica.estado_actual (el último estado, que
+mantiene el trigger de la tabla estado), en vez de una consulta por cita.
+Se lee una fila por cita: con TAMANO_LOTE ids la respuesta nunca llega al
+max_rows de PostgREST, que truncaría el historial de estados sin avisar.
+"""
+import asyncio
+from typing import Dict, Iterable, List, Optional
+from src.utils.supabase_async import supabase_async
+
+# Máximo de ids por consulta in_() para no exceder el largo de URL de PostgREST
+TAMANO_LOTE = 300
+
+
+async def obtener_estados_actuales(citas_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Retorna {cita_id: estado_mas_reciente} para las citas indicadas.
+    Las citas sin registros en estado no aparecen en el diccionario.
+    """
+    ids = list(dict.fromkeys(citas_ids))
+    if not ids:
+        return {}
+
+    lotes = [ids[i:i + TAMANO_LOTE] for i in range(0, len(ids), TAMANO_LOTE)]
+    respuestas = await asyncio.gather(*(
+        supabase_async
+        .table("cita_medica")
+        .select("id, estado_actual")
+        .in_("id", lote)
+        .not_.is_("estado_actual", "null")
+        .execute()
+        for lote in lotes
+    ))
+
+    estados_dict: Dict[int, str] = {}
+    for respuesta in respuestas:
+        for cita in (respuesta.data or []):
+            estados_dict[cita["id"]] = cita["estado_actual"]
+    return estados_dict
+
+
+class EstadoCitaLoader:
+    """
+    Acumula los cita_id pedidos durante un request y los resuelve en lote.
+    Los resultados quedan cacheados por el resto del request.
+    """
+
+    def __init__(self):
+        self._futuros: Dict[int, asyncio.Future] = {}
+        self._pendientes: List[int] = []
+
+    def load(self, cita_id: int) -> "asyncio.Future[Optional[str]]":
+        """Retorna un awaitable con el estado actual de la cita (None si no tiene)."""
+        if cita_id in self._futuros:
+            return self._futuros[cita_id]
+
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._futuros[cita_id] = futuro
+
+        # El primer load() del tick agenda el despacho; los siguientes se suman al lote
+        if not self._pendientes:
+            loop.call_soon(lambda: asyncio.ensure_future(self._despachar()))
+        self._pendientes.append(cita_id)
+        return futuro
+
+    async def load_many(self, citas_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """Retorna {cita_id: estado} para todas las citas, con una sola consulta."""
+        ids = list(dict.fromkeys(citas_ids))
+        estados = await asyncio.gather(*(self.load(cita_id) for cita_id in ids))
+        return dict(zip(ids, estados))
+
+    def prime(self, cita_id: int, estado: str) -> None:
+        """Registra un estado recién escrito para no volver a consultarlo."""
+        futuro = self._futuros.get(cita_id)
+        if futuro is None or futuro.done():
+            futuro = asyncio.get_running_loop().create_future()
+            self._futuros[cita_id] = futuro
+        futuro.set_result(estado)
+
+    async def _despachar(self) -> None:
+        lote, self._pendientes = self._pendientes, []
+        try:
+            estados = await obtener_estados_actuales(lote)
+        except Exception as e:
+            for cita_id in lote:
+                futuro = self._futuros.pop(cita_id)
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        for cita_id in lote:
+            futuro = self._futuros[cita_id]
+            if not futuro.done():
+                futuro.set_result(estados.get(cita_id))
+
+
+def obtener_estado_loader() -> EstadoCitaLoader:
+    """Dependencia de FastAPI: un loader nuevo por request."""
+    return EstadoCitaLoader()
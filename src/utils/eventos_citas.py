@@ -0,0 +1,173 @@
+"""
+Eventos de citas para los clientes suscritos por Server-Sent Events.
+
+Los endpoints que escriben citas publican un evento (cita creada, cambio de
+estado, cita modificada, pago registrado) y cada suscriptor lo recibe en su
+cola si coincide con su filtro (doctor y/o día de Chile). Así recepción y el
+panel del doctor dejan de hacer polling.
+
+Cada evento tiene un id "<época>-<correlativo>" (la época identifica al proceso)
+y los últimos EVENTOS_CITAS_BUFFER quedan en memoria: un cliente que se
+reconecta con Last-Event-ID recibe lo que se perdió. Si el buffer no cubre ese
+id (ya salió del buffer, es de otro worker o de antes de un reinicio) o un
+suscriptor lento llena su cola, se envía un evento "resincronizar" para que el
+cliente recargue con los endpoints normales.
+
+Los eventos son por worker: con varios workers cada cliente solo ve las
+escrituras hechas en el worker al que está conectado, y "resincronizar" más
+una recarga periódica cubren la diferencia.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import date
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set
+from src.utils.indice_disponibilidad import fecha_local
+
+TAMANO_BUFFER = int(os.getenv("EVENTOS_CITAS_BUFFER", "500"))
+TAMANO_COLA = int(os.getenv("EVENTOS_CITAS_COLA", "100"))
+KEEPALIVE_SEGUNDOS = float(os.getenv("EVENTOS_CITAS_KEEPALIVE_SEGUNDOS", "15"))
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado, con su filtro."""
+
+    __slots__ = ("cola", "doctor_id", "fecha", "desbordada")
+
+    def __init__(self, doctor_id: Optional[int], fecha: Optional[date]):
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=TAMANO_COLA)
+        self.doctor_id = doctor_id
+        self.fecha = fecha
+        self.desbordada = False
+
+    def acepta(self, evento: Dict[str, Any]) -> bool:
+        # Una cita movida de doctor o de día también interesa a quien miraba su ubicación anterior
+        return self._coincide(evento.get("doctor_id"), evento.get("fecha")) or (
+            "doctor_anterior" in evento
+            and self._coincide(evento["doctor_anterior"], evento.get("fecha_anterior"))
+        )
+
+    def _coincide(self, doctor_id: Optional[int], fecha: Optional[str]) -> bool:
+        if self.doctor_id is not None and doctor_id != self.doctor_id:
+            return False
+        if self.fecha is not None and fecha != self.fecha.isoformat():
+            return False
+        return True
+
+
+class BusEventosCitas:
+    """Publica eventos de citas a las suscripciones de este worker."""
+
+    def __init__(self, tamano_buffer: int = TAMANO_BUFFER):
+        self._suscripciones: Set[Suscripcion] = set()
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=tamano_buffer)
+        self._ultimo_id = 0
+        self.publicados = 0
+        # Distingue los ids de este proceso de los de otros workers o de antes de un reinicio
+        self.epoca = format(time.time_ns() // 1000, "x")
+
+    def publicar(self, tipo: str, cita_id: int, doctor_id: Optional[int], fecha_atencion: Any, **datos: Any) -> None:
+        """
+        Registra un evento y lo entrega a las suscripciones que coinciden.
+        Si en datos viene fecha_atencion_anterior se agrega su día (fecha_anterior).
+        """
+        self._ultimo_id += 1
+        self.publicados += 1
+        evento = {
+            "id": f"{self.epoca}-{self._ultimo_id}",
+            "secuencia": self._ultimo_id,
+            "tipo": tipo,
+            "cita_id": cita_id,
+            "doctor_id": doctor_id,
+            "fecha_atencion": str(fecha_atencion) if fecha_atencion is not None else None,
+            "fecha": fecha_local(fecha_atencion).isoformat() if fecha_atencion is not None else None,
+            "emitido_en": time.time(),
+            **datos
+        }
+        if datos.get("fecha_atencion_anterior") is not None:
+            evento["fecha_anterior"] = fecha_local(datos["fecha_atencion_anterior"]).isoformat()
+        self._buffer.append(evento)
+
+        for suscripcion in self._suscripciones:
+            if suscripcion.desbordada or not suscripcion.acepta(evento):
+                continue
+            try:
+                suscripcion.cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Cliente demasiado lento: se le pide recargar en vez de perder eventos en silencio
+                suscripcion.desbordada = True
+
+    async def escuchar(
+        self,
+        doctor_id: Optional[int] = None,
+        fecha: Optional[date] = None,
+        ultimo_id: Optional[str] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Genera los eventos de la suscripción (None cada KEEPALIVE_SEGUNDOS sin
+        eventos, para mantener viva la conexión). ultimo_id es el Last-Event-ID
+        del cliente al reconectarse.
+        """
+        suscripcion = Suscripcion(doctor_id, fecha)
+        self._suscripciones.add(suscripcion)
+        try:
+            if ultimo_id is not None:
+                secuencia = self._secuencia_reanudable(ultimo_id)
+                if secuencia is None:
+                    yield self._resincronizar()
+                else:
+                    for evento in list(self._buffer):
+                        if evento["secuencia"] > secuencia and suscripcion.acepta(evento):
+                            yield evento
+
+            while True:
+                if suscripcion.desbordada:
+                    suscripcion.desbordada = False
+                    suscripcion.cola = asyncio.Queue(maxsize=TAMANO_COLA)
+                    yield self._resincronizar()
+                    continue
+                try:
+                    yield await asyncio.wait_for(suscripcion.cola.get(), timeout=KEEPALIVE_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._suscripciones.discard(suscripcion)
+
+    def _secuencia_reanudable(self, ultimo_id: str) -> Optional[int]:
+        """
+        Correlativo desde el que se puede reanudar, o None si el buffer no cubre
+        todo lo posterior a ultimo_id.
+        """
+        epoca, _, secuencia = ultimo_id.partition("-")
+        if epoca != self.epoca or not secuencia.isdigit():
+            return None
+        secuencia = int(secuencia)
+        if secuencia > self._ultimo_id:
+            return None
+        if secuencia < self._ultimo_id and (not self._buffer or self._buffer[0]["secuencia"] > secuencia + 1):
+            return None
+        return secuencia
+
+    def _resincronizar(self) -> Dict[str, Any]:
+        return {"id": f"{self.epoca}-{self._ultimo_id}", "tipo": "resincronizar"}
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "suscripciones": len(self._suscripciones),
+            "eventos_en_buffer": len(self._buffer),
+            "epoca": self.epoca,
+            "ultimo_id": self._ultimo_id,
+            "publicados": self.publicados,
+        }
+
+
+def formato_sse(evento: Optional[Dict[str, Any]]) -> str:
+    """Serializa un evento en formato text/event-stream (None = keepalive)."""
+    if evento is None:
+        return ": keepalive\n\n"
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+
+
+eventos_citas = BusEventosCitas()
@@ -0,0 +1,182 @@
+"""
+Protección contra reservas dobles (dos citas activas en el mismo bloque).
+
+Tres niveles, del más barato al definitivo:
+1. Índice en memoria: por doctor, las horas de inicio de sus citas activas
+   ordenadas. Revisar si un bloque [inicio, fin) ya tiene cita es una búsqueda
+   binaria O(log n) sin ir a la base de datos. Solo se usa para aceptar rápido:
+   puede estar desactualizado respecto de otros workers (vence a los
+   GUARDIA_CITAS_TTL_SEGUNDOS), así que un conflicto encontrado en memoria no
+   rechaza la reserva por sí solo.
+2. Una consulta de exclusión a la base de datos (cita activa del doctor dentro
+   del bloque), que confirma los conflictos del índice antes de responder 409.
+3. El índice único parcial ux_cita_medica_horario_activa (migración 0006): si
+   dos requests pasan los pasos anteriores al mismo tiempo, la base de datos
+   rechaza el segundo INSERT (código 23505) y el endpoint responde 409.
+"""
+import os
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from postgrest.exceptions import APIError
+from src.utils.intervalos import a_datetime
+from src.utils.supabase_async import supabase_async
+
+TTL_SEGUNDOS = float(os.getenv("GUARDIA_CITAS_TTL_SEGUNDOS", "60"))
+
+# Citas pasadas que se cargan en el índice (las reservas son desde hoy en adelante)
+DIAS_HACIA_ATRAS = 1
+
+# Violación de unicidad en PostgreSQL
+CODIGO_DUPLICADO = "23505"
+
+
+def _epoch(valor: Any) -> int:
+    fecha = a_datetime(valor)
+    # Sin zona horaria se asume UTC, igual que al guardar en la base de datos
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return int(fecha.timestamp())
+
+
+def es_reserva_duplicada(error: Exception) -> bool:
+    """Indica si el error es el rechazo del índice único de citas por bloque."""
+    return isinstance(error, APIError) and str(error.code) == CODIGO_DUPLICADO
+
+
+class IndiceCitasDoctor:
+    """Inicios (segundos epoch) de las citas activas de un doctor, ordenados."""
+
+    __slots__ = ("desde", "inicios", "vence")
+
+    def __init__(self, citas: List[Dict[str, Any]], desde: int, vence: float):
+        self.desde = desde
+        self.inicios: List[Tuple[int, int]] = sorted((_epoch(c["fecha_atencion"]), c["id"]) for c in citas)
+        self.vence = vence
+
+    def primera_en(self, inicio: int, fin: int, excluir_id: Optional[int] = None) -> Optional[int]:
+        """Id de una cita con inicio <= fecha < fin, o None."""
+        i = bisect_left(self.inicios, (inicio, -1))
+        while i < len(self.inicios) and self.inicios[i][0] < fin:
+            if self.inicios[i][1] != excluir_id:
+                return self.inicios[i][1]
+            i += 1
+        return None
+
+
+class GuardiaCitas:
+    """Revisa conflictos de reserva y mantiene el índice por doctor."""
+
+    def __init__(self, ttl: float = TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._doctores: Dict[int, IndiceCitasDoctor] = {}
+        self.rechazos_memoria = 0
+        self.consultas_bd = 0
+        self.conflictos_descartados = 0
+
+    async def _cargar(self, doctor_id: int) -> IndiceCitasDoctor:
+        desde = datetime.now(timezone.utc) - timedelta(days=DIAS_HACIA_ATRAS)
+        citas = []
+        offset = 0
+        while True:
+            pagina = await (
+                supabase_async
+                .table("cita_medica")
+                .select("id, fecha_atencion")
+                .eq("doctor_id", doctor_id)
+                .gte("fecha_atencion", desde.isoformat())
+                .or_("estado_actual.is.null,estado_actual.neq.Cancelada")
+                .order("fecha_atencion")
+                .order("id")
+                .range(offset, offset + 999)
+                .execute()
+            )
+            citas.extend(pagina.data or [])
+            if len(pagina.data or []) < 1000:
+                break
+            offset += 1000
+
+        indice = IndiceCitasDoctor(citas, int(desde.timestamp()), time.monotonic() + self.ttl)
+        self._doctores[doctor_id] = indice
+        return indice
+
+    async def conflicto(
+        self,
+        doctor_id: int,
+        inicio: Any,
+        fin: Any,
+        excluir_id: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Id de una cita activa del doctor dentro de [inicio, fin), o None si el
+        bloque está libre. excluir_id permite ignorar la propia cita al moverla.
+        """
+        inicio_s, fin_s = _epoch(inicio), _epoch(fin)
+
+        indice = self._doctores.get(doctor_id)
+        recien_cargado = False
+        if indice is None or indice.vence <= time.monotonic():
+            indice = await self._cargar(doctor_id)
+            recien_cargado = True
+
+        if inicio_s >= indice.desde:
+            cita_id = indice.primera_en(inicio_s, fin_s, excluir_id)
+            if cita_id is None:
+                # Libre en memoria; una reserva de otro worker la detiene el índice único
+                return None
+            if recien_cargado:
+                # El índice se acaba de leer de la base de datos: ya es la consulta de exclusión
+                self.rechazos_memoria += 1
+                return cita_id
+
+        # Una sola consulta de exclusión en la base de datos (confirma el conflicto del índice)
+        self.consultas_bd += 1
+        query = (
+            supabase_async
+            .table("cita_medica")
+            .select("id, fecha_atencion")
+            .eq("doctor_id", doctor_id)
+            .gte("fecha_atencion", a_datetime(inicio).isoformat())
+            .lt("fecha_atencion", a_datetime(fin).isoformat())
+            .or_("estado_actual.is.null,estado_actual.neq.Cancelada")
+        )
+        if excluir_id is not None:
+            query = query.neq("id", excluir_id)
+        existente = await query.limit(1).execute()
+
+        if existente.data:
+            self.registrar(doctor_id, existente.data[0]["id"], existente.data[0]["fecha_atencion"])
+            return existente.data[0]["id"]
+        if inicio_s >= indice.desde:
+            # La cita del índice fue cancelada o movida en otro worker
+            self.conflictos_descartados += 1
+            self.invalidar(doctor_id)
+        return None
+
+    def registrar(self, doctor_id: int, cita_id: int, fecha_atencion: Any) -> None:
+        """Agrega una cita activa al índice del doctor (si está cargado)."""
+        indice = self._doctores.get(doctor_id)
+        if indice is None:
+            return
+        entrada = (_epoch(fecha_atencion), cita_id)
+        i = bisect_left(indice.inicios, entrada)
+        if i == len(indice.inicios) or indice.inicios[i] != entrada:
+            insort(indice.inicios, entrada)
+
+    def invalidar(self, doctor_id: int) -> None:
+        """Descarta el índice del doctor (cancelaciones, cambios de estado o de fecha)."""
+        self._doctores.pop(doctor_id, None)
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "doctores_cargados": len(self._doctores),
+            "citas_en_memoria": sum(len(indice.inicios) for indice in self._doctores.values()),
+            "ttl_segundos": self.ttl,
+            "rechazos_memoria": self.rechazos_memoria,
+            "consultas_bd": self.consultas_bd,
+            "conflictos_descartados": self.conflictos_descartados,
+        }
+
+
+guardia_citas = GuardiaCitas()
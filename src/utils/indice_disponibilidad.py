@@ -0,0 +1,229 @@
+"""
+Índice de disponibilidad en memoria por doctor y día (fecha local de Chile).
+
+Cada día de un doctor guarda sus bloques ordenados en arrays compactos
+(array('q') con id, inicio y fin en segundos epoch) y un bitmap de bloques
+libres (un int de Python usado como bitset: el bit i es el bloque i). Consultar
+disponibilidad o contar bloques libres de una semana son operaciones de bits
+sobre datos ya cargados, sin ir a la base de datos.
+
+Los días faltantes o vencidos se cargan en bloque con las mismas consultas que
+src.utils.disponibilidad (bloques + citas activas). Los endpoints que escriben
+actualizan este worker en el momento:
+- crear una cita marca su bloque como ocupado (marcar_ocupado);
+- cancelar, cambiar estado, mover una cita o modificar horarios invalidan el
+  día (o todos los días) del doctor, que se recarga en la próxima consulta.
+Los cambios hechos desde otros workers se ven al vencer
+INDICE_DISPONIBILIDAD_TTL_SEGUNDOS.
+"""
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from src.utils.disponibilidad import cargar_bloques_con_citas
+from src.utils.intervalos import a_datetime
+
+TTL_SEGUNDOS = float(os.getenv("INDICE_DISPONIBILIDAD_TTL_SEGUNDOS", "30"))
+MAX_DIAS = int(os.getenv("INDICE_DISPONIBILIDAD_MAX_DIAS", "50000"))
+
+ZONA_CHILE = ZoneInfo("America/Santiago")
+
+
+def _a_utc(valor: Any) -> datetime:
+    # Sin zona horaria se asume UTC, igual que al guardar en la base de datos
+    fecha = a_datetime(valor)
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+def _epoch(valor: Any) -> int:
+    return int(_a_utc(valor).timestamp())
+
+
+def _iso(segundos: int) -> str:
+    return datetime.fromtimestamp(segundos, timezone.utc).isoformat()
+
+
+def fecha_local(valor: Any) -> date:
+    """Fecha en Chile de un datetime o string ISO."""
+    return _a_utc(valor).astimezone(ZONA_CHILE).date()
+
+
+class DiaDoctor:
+    """Bloques de un doctor en un día, con bitmap de libres."""
+
+    __slots__ = ("doctor_id", "ids", "inicios", "fines", "libres", "vence")
+
+    def __init__(self, doctor_id: int, bloques: List[Dict[str, Any]], vence: float):
+        bloques = sorted(bloques, key=lambda b: _epoch(b["inicio_bloque"]))
+        self.doctor_id = doctor_id
+        self.ids = array("q", (b["id"] for b in bloques))
+        self.inicios = array("q", (_epoch(b["inicio_bloque"]) for b in bloques))
+        self.fines = array("q", (_epoch(b["finalizacion_bloque"]) for b in bloques))
+        # Todos libres hasta marcar las citas
+        self.libres = (1 << len(bloques)) - 1
+        self.vence = vence
+
+    def mascara(self, desde: Optional[int] = None, hasta: Optional[int] = None) -> int:
+        """Bits de los bloques con inicio <= hasta y fin >= desde (segundos epoch)."""
+        # Los bloques no se solapan: inicios y fines quedan ordenados igual
+        i = 0 if desde is None else bisect_left(self.fines, desde)
+        j = len(self.ids) if hasta is None else bisect_right(self.inicios, hasta)
+        if j <= i:
+            return 0
+        return ((1 << j) - 1) ^ ((1 << i) - 1)
+
+    def contar_libres(self, desde: Optional[int] = None, hasta: Optional[int] = None) -> int:
+        return bin(self.libres & self.mascara(desde, hasta)).count("1")
+
+    def bloques_libres(self, desde: Optional[int] = None, hasta: Optional[int] = None) -> List[Dict[str, Any]]:
+        bits = self.libres & self.mascara(desde, hasta)
+        bloques = []
+        while bits:
+            i = (bits & -bits).bit_length() - 1
+            bits &= bits - 1
+            bloques.append({
+                "id": self.ids[i],
+                "inicio_bloque": _iso(self.inicios[i]),
+                "finalizacion_bloque": _iso(self.fines[i]),
+                "usuario_sistema_id": self.doctor_id
+            })
+        return bloques
+
+    def marcar_ocupado(self, instante: int) -> bool:
+        """Marca como ocupado el bloque que contiene el instante. Retorna si encontró bloque."""
+        i = bisect_right(self.inicios, instante) - 1
+        if i >= 0 and instante < self.fines[i]:
+            self.libres &= ~(1 << i)
+            return True
+        return False
+
+    def bytes_aproximados(self) -> int:
+        return sum(a.buffer_info()[1] * a.itemsize for a in (self.ids, self.inicios, self.fines)) + (self.libres.bit_length() + 7) // 8
+
+
+class IndiceDisponibilidad:
+    """Días de doctor cargados, con TTL y máximo de entradas (LRU)."""
+
+    def __init__(self, ttl: float = TTL_SEGUNDOS, max_dias: int = MAX_DIAS):
+        self.ttl = ttl
+        self.max_dias = max_dias
+        self._dias: "OrderedDict[Tuple[int, date], DiaDoctor]" = OrderedDict()
+        # Se incrementa en cada escritura: una carga iniciada antes no se guarda
+        self._version = 0
+        self.aciertos = 0
+        self.cargas = 0
+
+    def _vigente(self, llave: Tuple[int, date]) -> Optional[DiaDoctor]:
+        dia = self._dias.get(llave)
+        if dia and dia.vence > time.monotonic():
+            self._dias.move_to_end(llave)
+            return dia
+        return None
+
+    async def _asegurar(self, doctor_ids: List[int], fecha_desde: date, fecha_hasta: date) -> Dict[Tuple[int, date], DiaDoctor]:
+        """Retorna los días pedidos, cargando en bloque los que faltan o vencieron."""
+        fechas = [fecha_desde + timedelta(days=n) for n in range((fecha_hasta - fecha_desde).days + 1)]
+        dias: Dict[Tuple[int, date], DiaDoctor] = {}
+        faltantes = []
+        for doctor_id in doctor_ids:
+            for fecha in fechas:
+                dia = self._vigente((doctor_id, fecha))
+                if dia:
+                    dias[(doctor_id, fecha)] = dia
+                else:
+                    faltantes.append((doctor_id, fecha))
+
+        self.aciertos += len(dias)
+        if not faltantes:
+            return dias
+
+        self.cargas += 1
+        version = self._version
+        doctores = sorted({doctor_id for doctor_id, _ in faltantes})
+        primera = min(fecha for _, fecha in faltantes)
+        ultima = max(fecha for _, fecha in faltantes)
+        desde = datetime.combine(primera, dtime.min, tzinfo=ZONA_CHILE).isoformat()
+        hasta = datetime.combine(ultima + timedelta(days=1), dtime.min, tzinfo=ZONA_CHILE).isoformat()
+
+        bloques, citas = await cargar_bloques_con_citas(doctores, desde, hasta)
+
+        # Cada bloque pertenece al día local en que empieza
+        bloques_por_dia: Dict[Tuple[int, date], List[Dict[str, Any]]] = defaultdict(list)
+        for bloque in bloques:
+            bloques_por_dia[(bloque["usuario_sistema_id"], fecha_local(bloque["inicio_bloque"]))].append(bloque)
+        # Una cita cae en un bloque de su mismo día o en uno que empezó el día anterior
+        citas_por_dia: Dict[Tuple[int, date], List[int]] = defaultdict(list)
+        for cita in citas:
+            dia_cita = fecha_local(cita["fecha_atencion"])
+            for fecha in (dia_cita, dia_cita - timedelta(days=1)):
+                citas_por_dia[(cita["doctor_id"], fecha)].append(_epoch(cita["fecha_atencion"]))
+
+        vence = time.monotonic() + self.ttl
+        guardar = self._version == version
+        for llave in faltantes:
+            dia = DiaDoctor(llave[0], bloques_por_dia.get(llave, []), vence)
+            for instante in citas_por_dia.get(llave, []):
+                dia.marcar_ocupado(instante)
+            dias[llave] = dia
+            if guardar:
+                self._dias[llave] = dia
+                self._dias.move_to_end(llave)
+
+        while len(self._dias) > self.max_dias:
+            self._dias.popitem(last=False)
+        return dias
+
+    async def libres(self, doctor_ids: List[int], desde: datetime, hasta: datetime) -> Dict[int, List[Dict[str, Any]]]:
+        """Bloques libres por doctor que tocan [desde, hasta], en orden cronológico."""
+        # Un día antes por bloques que empiezan el día anterior y terminan dentro del rango
+        dias = await self._asegurar(doctor_ids, fecha_local(desde) - timedelta(days=1), fecha_local(hasta))
+        desde_s, hasta_s = int(desde.timestamp()), int(hasta.timestamp())
+
+        resultado: Dict[int, List[Dict[str, Any]]] = {doctor_id: [] for doctor_id in doctor_ids}
+        for (doctor_id, _), dia in sorted(dias.items(), key=lambda item: item[0]):
+            resultado[doctor_id].extend(dia.bloques_libres(desde_s, hasta_s))
+        return resultado
+
+    async def contar_libres(self, doctor_ids: List[int], fecha_desde: date, fecha_hasta: date) -> Dict[int, Dict[str, int]]:
+        """Cantidad de bloques libres por doctor y día local."""
+        dias = await self._asegurar(doctor_ids, fecha_desde, fecha_hasta)
+        resultado: Dict[int, Dict[str, int]] = {doctor_id: {} for doctor_id in doctor_ids}
+        for (doctor_id, fecha), dia in sorted(dias.items(), key=lambda item: item[0]):
+            resultado[doctor_id][fecha.isoformat()] = dia.contar_libres()
+        return resultado
+
+    def marcar_ocupado(self, doctor_id: int, fecha_atencion: Any) -> None:
+        """Una cita nueva ocupa su bloque (si el día está cargado en este worker)."""
+        self._version += 1
+        dia = self._dias.get((doctor_id, fecha_local(fecha_atencion)))
+        if dia and not dia.marcar_ocupado(_epoch(fecha_atencion)):
+            # La cita puede caer en un bloque que empezó el día anterior
+            self.invalidar(doctor_id)
+
+    def invalidar(self, doctor_id: int, fecha: Any = None) -> None:
+        """Descarta un día del doctor (fecha datetime/ISO) o todos sus días."""
+        self._version += 1
+        if fecha is not None:
+            dia_local = fecha_local(fecha)
+            for llave in ((doctor_id, dia_local), (doctor_id, dia_local - timedelta(days=1))):
+                self._dias.pop(llave, None)
+            return
+        for llave in [llave for llave in self._dias if llave[0] == doctor_id]:
+            del self._dias[llave]
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "dias_cargados": len(self._dias),
+            "max_dias": self.max_dias,
+            "ttl_segundos": self.ttl,
+            "bytes_aproximados": sum(dia.bytes_aproximados() for dia in self._dias.values()),
+            "aciertos": self.aciertos,
+            "cargas": self.cargas,
+        }
+
+
+indice_disponibilidad = IndiceDisponibilidad()
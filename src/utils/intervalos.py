@@ -0,0 +1,120 @@
+"""
+Índice de intervalos para detectar solapamientos de bloques de horario.
+
+Los intervalos son semiabiertos [inicio, fin): un bloque 10:00-10:30 y otro
+10:30-11:00 no se solapan. Se ordenan por inicio y se guarda el máximo fin
+acumulado, así cada consulta de solapamiento es una búsqueda binaria:
+construir el índice con n bloques cuesta O(n log n) y revisar m candidatos
+O(m log n).
+"""
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def a_datetime(valor: Any) -> datetime:
+    """Acepta datetime o string ISO (como los retorna Supabase)."""
+    if isinstance(valor, datetime):
+        return valor
+    return datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+
+
+class IndiceIntervalos:
+    """Intervalos [inicio, fin) con consulta de solapamiento en O(log n)."""
+
+    def __init__(self, intervalos: Iterable[Tuple[datetime, datetime, Any]] = ()):
+        ordenados = sorted(
+            ((a_datetime(inicio), a_datetime(fin), dato) for inicio, fin, dato in intervalos),
+            key=lambda intervalo: intervalo[0]
+        )
+        self._inicios = [intervalo[0] for intervalo in ordenados]
+        self._intervalos = ordenados
+
+        # _max_fin[i] = posición del intervalo con mayor fin entre 0..i
+        self._max_fin: List[int] = []
+        for i, (_, fin, _) in enumerate(ordenados):
+            if i == 0 or fin > ordenados[self._max_fin[-1]][1]:
+                self._max_fin.append(i)
+            else:
+                self._max_fin.append(self._max_fin[-1])
+
+    def __len__(self) -> int:
+        return len(self._intervalos)
+
+    def primer_solapado(self, inicio: datetime, fin: datetime) -> Optional[Tuple[datetime, datetime, Any]]:
+        """
+        Retorna un intervalo que se solapa con [inicio, fin), o None.
+        Solo pueden solaparse los que empiezan antes de fin; entre ellos basta
+        mirar el de mayor fin.
+        """
+        hasta = bisect_left(self._inicios, fin)
+        if hasta == 0:
+            return None
+        candidato = self._intervalos[self._max_fin[hasta - 1]]
+        return candidato if candidato[1] > inicio else None
+
+    def solapados(self, inicio: datetime, fin: datetime) -> List[Tuple[datetime, datetime, Any]]:
+        """Todos los intervalos que se solapan con [inicio, fin)."""
+        hasta = bisect_left(self._inicios, fin)
+        return [intervalo for intervalo in self._intervalos[:hasta] if intervalo[1] > inicio]
+
+
+def filtrar_solapamientos(
+    candidatos: List[Dict[str, Any]],
+    existentes: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Separa los bloques candidatos en (aceptados, rechazados).
+
+    Un candidato se rechaza si se solapa con un bloque existente o con otro
+    candidato ya aceptado. Cada rechazo indica el motivo y el bloque con el
+    que choca. Los bloques usan las llaves inicio_bloque / finalizacion_bloque.
+    """
+    indice = IndiceIntervalos(
+        (bloque["inicio_bloque"], bloque["finalizacion_bloque"], bloque) for bloque in existentes
+    )
+
+    aceptados: List[Dict[str, Any]] = []
+    rechazados: List[Dict[str, Any]] = []
+    ultimo_fin: Optional[datetime] = None
+    ultimo_aceptado: Optional[Dict[str, Any]] = None
+
+    # Ordenados por inicio, un candidato solo puede chocar con el aceptado de mayor fin
+    for bloque in sorted(candidatos, key=lambda b: a_datetime(b["inicio_bloque"])):
+        inicio = a_datetime(bloque["inicio_bloque"])
+        fin = a_datetime(bloque["finalizacion_bloque"])
+
+        if fin <= inicio:
+            rechazados.append({**bloque, "motivo": "El bloque termina antes de comenzar"})
+            continue
+
+        choque = indice.primer_solapado(inicio, fin)
+        if choque:
+            rechazados.append({
+                **bloque,
+                "motivo": "Se solapa con un horario existente",
+                "conflicto_con": {
+                    "id": choque[2].get("id"),
+                    "inicio_bloque": choque[2]["inicio_bloque"],
+                    "finalizacion_bloque": choque[2]["finalizacion_bloque"]
+                }
+            })
+            continue
+
+        if ultimo_fin is not None and inicio < ultimo_fin:
+            rechazados.append({
+                **bloque,
+                "motivo": "Se solapa con otro bloque de la misma solicitud",
+                "conflicto_con": {
+                    "inicio_bloque": ultimo_aceptado["inicio_bloque"],
+                    "finalizacion_bloque": ultimo_aceptado["finalizacion_bloque"]
+                }
+            })
+            continue
+
+        aceptados.append(bloque)
+        if ultimo_fin is None or fin > ultimo_fin:
+            ultimo_fin = fin
+            ultimo_aceptado = bloque
+
+    return aceptados, rechazados
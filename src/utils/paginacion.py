@@ -0,0 +1,73 @@
+"""
+Paginación por cursor (keyset) para los listados grandes.
+
+En vez de offset, cada página continúa después de la última fila de la anterior
+usando el orden (columna, id). La base de datos salta directo a esa posición
+por índice, así que una página profunda cuesta lo mismo que la primera, y las
+filas insertadas mientras se pagina no desplazan ni duplican resultados.
+
+El cursor es opaco para el cliente: base64 de los valores de la última fila.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+
+
+def codificar_cursor(fila: Dict[str, Any], columna: str) -> str:
+    """Genera el cursor que apunta a la fila indicada."""
+    valores = {"id": fila["id"]}
+    if columna != "id":
+        valores[columna] = fila[columna]
+    contenido = json.dumps(valores, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(contenido).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, columna: str) -> Dict[str, Any]:
+    """Lee un cursor generado por codificar_cursor. Lanza 400 si no es válido."""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if "id" not in valores or columna not in valores:
+            raise ValueError("faltan columnas")
+        return valores
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.")
+
+
+def aplicar_cursor(query, cursor: Optional[str], columna: str = "id", desc: bool = False):
+    """
+    Ordena la query por (columna, id) y, si hay cursor, la filtra para
+    continuar después de la fila que representa.
+    """
+    if cursor:
+        valores = decodificar_cursor(cursor, columna)
+        operador = "lt" if desc else "gt"
+
+        if columna == "id":
+            query = query.filter("id", operador, valores["id"])
+        else:
+            # (columna, id) > (valor, id_cursor), escrito con or/and de PostgREST.
+            # El filtro gte/lte redundante es el que Postgres usa como
+            # condición del índice para empezar en la posición del cursor.
+            valor = f'"{valores[columna]}"'
+            query = query.filter(columna, f"{operador}e", valores[columna]).or_(
+                f"{columna}.{operador}.{valor},"
+                f"and({columna}.eq.{valor},id.{operador}.{valores['id']})"
+            )
+
+    query = query.order(columna, desc=desc)
+    if columna != "id":
+        query = query.order("id", desc=desc)
+    return query
+
+
+def cortar_pagina(filas: List[Dict[str, Any]], limite: int, columna: str = "id") -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Recibe limite + 1 filas y retorna (página, siguiente_cursor).
+    siguiente_cursor es None cuando no hay más filas.
+    """
+    if len(filas) <= limite:
+        return filas, None
+    pagina = filas[:limite]
+    return pagina, codificar_cursor(pagina[-1], columna)
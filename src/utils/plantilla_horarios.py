@@ -0,0 +1,147 @@
+"""
+Expansión de plantillas de horario a bloques concretos.
+
+Un turno de la plantilla es (doctor, días de la semana, hora inicio, hora fin,
+duración del bloque). En vez de recorrer día por día y bloque por bloque, los
+bloques se generan con aritmética vectorizada de pandas: turnos × fechas del
+rango que calzan con el día de la semana × posición del bloque en el día, en
+hora local de Chile, y se convierten a UTC de una vez.
+
+Cambio de horario (America/Santiago):
+- Inicio en una hora inexistente (cuando se adelanta el reloj): el bloque se
+  omite y se informa en los omitidos.
+- Inicio en una hora repetida (cuando se atrasa el reloj): se usa la primera
+  ocurrencia.
+El fin de cada bloque es el inicio más la duración, así todos los bloques duran
+exactamente lo indicado aunque crucen el cambio de hora.
+"""
+from datetime import date
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+ZONA_CHILE = "America/Santiago"
+
+COLUMNAS_BLOQUE = ["usuario_sistema_id", "inicio_bloque", "finalizacion_bloque"]
+
+
+def _minutos(hora: str) -> int:
+    """'HH:MM' -> minutos desde medianoche. Lanza ValueError si el formato no es válido."""
+    partes = str(hora).split(":")
+    if len(partes) != 2 or not all(parte.isdigit() for parte in partes):
+        raise ValueError(f"Hora '{hora}' no válida, se espera HH:MM")
+    horas, minutos = int(partes[0]), int(partes[1])
+    if horas > 24 or minutos > 59 or (horas == 24 and minutos):
+        raise ValueError(f"Hora '{hora}' no válida, se espera HH:MM")
+    return horas * 60 + minutos
+
+
+def validar_turnos(turnos: List[Dict[str, Any]]) -> List[str]:
+    """Retorna la lista de errores de la plantilla (vacía si es válida)."""
+    errores = []
+    for i, turno in enumerate(turnos):
+        prefijo = f"Turno {i + 1} (usuario {turno.get('usuario_sistema_id')})"
+        dias = turno.get("dias_semana") or []
+        if not dias:
+            errores.append(f"{prefijo}: debe indicar al menos un día de la semana")
+        if any(not isinstance(dia, int) or dia < 0 or dia > 6 for dia in dias):
+            errores.append(f"{prefijo}: los días de la semana van de 0 (lunes) a 6 (domingo)")
+        if (turno.get("duracion_bloque_minutos") or 0) <= 0:
+            errores.append(f"{prefijo}: la duración del bloque debe ser mayor a 0")
+        try:
+            if _minutos(turno["hora_fin"]) <= _minutos(turno["hora_inicio"]):
+                errores.append(f"{prefijo}: la hora de fin debe ser posterior a la de inicio")
+        except ValueError as e:
+            errores.append(f"{prefijo}: {str(e)}")
+    return errores
+
+
+def expandir_plantilla(
+    turnos: List[Dict[str, Any]],
+    fecha_inicio: date,
+    fecha_fin: date,
+) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Genera los bloques de todos los turnos entre fecha_inicio y fecha_fin (inclusive).
+
+    Retorna (bloques, omitidos): bloques es un DataFrame con COLUMNAS_BLOQUE en UTC,
+    ordenado por doctor e inicio; omitidos son los bloques que caen en una hora
+    inexistente por el cambio de horario.
+    """
+    vacio = pd.DataFrame(columns=COLUMNAS_BLOQUE)
+    if not turnos or fecha_fin < fecha_inicio:
+        return vacio, []
+
+    df_turnos = pd.DataFrame(turnos)
+    df_turnos["minuto_inicio"] = df_turnos["hora_inicio"].map(_minutos)
+    df_turnos["minuto_fin"] = df_turnos["hora_fin"].map(_minutos)
+    # Solo bloques completos dentro del turno
+    df_turnos["cantidad"] = (
+        (df_turnos["minuto_fin"] - df_turnos["minuto_inicio"]) // df_turnos["duracion_bloque_minutos"]
+    )
+    df_turnos = df_turnos[df_turnos["cantidad"] > 0]
+    df_turnos = df_turnos.explode("dias_semana").rename(columns={"dias_semana": "dia_semana"})
+    df_turnos["dia_semana"] = df_turnos["dia_semana"].astype("int64")
+
+    fechas = pd.DataFrame({"fecha": pd.date_range(fecha_inicio, fecha_fin, freq="D")})
+    fechas["dia_semana"] = fechas["fecha"].dt.weekday.astype("int64")
+
+    # Una fila por (turno, fecha) y luego una por bloque del día
+    dias = df_turnos.merge(fechas, on="dia_semana").reset_index(drop=True)
+    if dias.empty:
+        return vacio, []
+
+    cantidades = dias["cantidad"].to_numpy()
+    filas = dias.loc[dias.index.repeat(cantidades)].reset_index(drop=True)
+    posicion = np.arange(len(filas)) - np.repeat(np.cumsum(cantidades) - cantidades, cantidades)
+
+    duracion = pd.to_timedelta(filas["duracion_bloque_minutos"].to_numpy(), unit="min")
+    inicio_local = filas["fecha"] + pd.to_timedelta(
+        filas["minuto_inicio"].to_numpy() + posicion * filas["duracion_bloque_minutos"].to_numpy(),
+        unit="min"
+    )
+
+    inicio_utc = (
+        pd.DatetimeIndex(inicio_local)
+        .tz_localize(ZONA_CHILE, ambiguous=np.ones(len(filas), dtype=bool), nonexistent="NaT")
+        .tz_convert("UTC")
+    )
+
+    inexistente = inicio_utc.isna()
+    omitidos = [
+        {
+            "usuario_sistema_id": int(usuario_id),
+            "inicio_local": local.strftime("%Y-%m-%dT%H:%M"),
+            "motivo": "Hora inexistente por cambio de horario"
+        }
+        for usuario_id, local in zip(
+            filas.loc[inexistente, "usuario_sistema_id"], inicio_local[inexistente]
+        )
+    ]
+
+    bloques = pd.DataFrame({
+        "usuario_sistema_id": filas["usuario_sistema_id"].astype("int64"),
+        "inicio_bloque": inicio_utc,
+        "finalizacion_bloque": inicio_utc + duracion,
+    })[~inexistente]
+
+    bloques = bloques.sort_values(["usuario_sistema_id", "inicio_bloque"]).reset_index(drop=True)
+    return bloques, omitidos
+
+
+def a_registros(bloques: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Convierte los bloques a filas para insertar en horarios_personal (fechas ISO en UTC)."""
+    if bloques.empty:
+        return []
+
+    def _iso_utc(columna: str) -> np.ndarray:
+        # datetime_as_string es vectorizado; strftime de pandas formatea fila por fila
+        valores = bloques[columna].dt.tz_convert(None).to_numpy().astype("datetime64[s]")
+        return np.char.add(np.datetime_as_string(valores, unit="s"), "+00:00")
+
+    return [
+        {"inicio_bloque": str(inicio), "finalizacion_bloque": str(fin), "usuario_sistema_id": int(usuario_id)}
+        for inicio, fin, usuario_id in zip(
+            _iso_utc("inicio_bloque"), _iso_utc("finalizacion_bloque"), bloques["usuario_sistema_id"].to_numpy()
+        )
+    ]
@@ -0,0 +1,40 @@
+"""
+Diferencia entre las recetas guardadas de una consulta y las que envía el doctor.
+
+Las recetas no tienen identidad propia en el formulario (se reenvía la lista
+completa), así que se comparan por contenido: las filas iguales se conservan y
+solo se borran/insertan las que cambiaron. Las repeticiones cuentan (dos recetas
+idénticas siguen siendo dos filas).
+"""
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+CAMPOS_RECETA = ("nombre", "presentacion", "dosis", "duracion", "cantidad")
+
+
+def _llave(receta: Dict[str, Any]) -> Tuple:
+    return tuple(receta.get(campo) for campo in CAMPOS_RECETA)
+
+
+def diferencia_recetas(
+    actuales: List[Dict[str, Any]],
+    pedidas: List[Dict[str, Any]]
+) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """Retorna (ids de recetas a eliminar, recetas a insertar)."""
+    pendientes = Counter(_llave(receta) for receta in pedidas)
+
+    eliminar = []
+    for receta in sorted(actuales, key=lambda r: r["id"]):
+        llave = _llave(receta)
+        if pendientes[llave] > 0:
+            pendientes[llave] -= 1
+        else:
+            eliminar.append(receta["id"])
+
+    insertar = []
+    for receta in pedidas:
+        llave = _llave(receta)
+        if pendientes[llave] > 0:
+            pendientes[llave] -= 1
+            insertar.append({campo: receta.get(campo) for campo in CAMPOS_RECETA})
+    return eliminar, insertar
@@ -0,0 +1,67 @@
+"""
+Asignación de bloques de horario para reservas en lote.
+
+Todas las fechas pedidas se cruzan de una vez con los bloques del doctor y sus
+citas activas (ya cargados): cada fecha busca su bloque con búsqueda binaria y
+se rechaza si no hay bloque, si el bloque ya tiene cita o si otra fecha de la
+misma solicitud lo tomó antes.
+"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+from src.utils.disponibilidad import bloques_ocupados
+from src.utils.intervalos import a_datetime
+
+# Código de rechazo -> mensaje para el cliente
+MOTIVOS_RECHAZO = {
+    "sin_horario": "El doctor no tiene horarios asignados para la fecha/hora seleccionada.",
+    "reserva_duplicada": "Ya existe una cita para este doctor en la fecha/hora seleccionada.",
+    "repetida_en_lote": "Otra fecha de la misma solicitud ocupa este bloque.",
+}
+
+
+def _epoch(valor: Any) -> int:
+    fecha = a_datetime(valor)
+    # Sin zona horaria se asume UTC, igual que al guardar en la base de datos
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return int(fecha.timestamp())
+
+
+def rango_fechas(fechas: List[datetime]) -> Tuple[str, str]:
+    """Primera y última fecha (ISO) de la solicitud."""
+    ordenadas = sorted(fechas, key=_epoch)
+    return ordenadas[0].isoformat(), ordenadas[-1].isoformat()
+
+
+def asignar_bloques(
+    fechas: List[datetime],
+    bloques: List[Dict[str, Any]],
+    citas: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Un resultado por fecha, en el orden recibido: horario_id del bloque asignado
+    o el código de error. Los bloques son de UN doctor (no se solapan).
+    """
+    bloques = sorted(bloques, key=lambda b: _epoch(b["inicio_bloque"]))
+    inicios = [_epoch(b["inicio_bloque"]) for b in bloques]
+    fines = [_epoch(b["finalizacion_bloque"]) for b in bloques]
+    ocupados = bloques_ocupados(bloques, citas)
+    tomados = set()
+
+    resultados = []
+    for indice, fecha in enumerate(fechas):
+        resultado = {"indice": indice, "fecha_atencion": fecha.isoformat(), "horario_id": None, "error": None}
+        instante = _epoch(fecha)
+        i = bisect_right(inicios, instante) - 1
+        if i < 0 or instante >= fines[i]:
+            resultado["error"] = "sin_horario"
+        elif bloques[i]["id"] in ocupados:
+            resultado["error"] = "reserva_duplicada"
+        elif bloques[i]["id"] in tomados:
+            resultado["error"] = "repetida_en_lote"
+        else:
+            tomados.add(bloques[i]["id"])
+            resultado["horario_id"] = bloques[i]["id"]
+        resultados.append(resultado)
+    return resultados
@@ -0,0 +1,183 @@
+"""
+Gateway para las funciones RPC de Supabase con circuit breaker por función.
+
+Varios endpoints intentan primero una función SQL optimizada y, si falla, usan
+un fallback con consultas normales. Cuando la función no existe en un ambiente,
+sin este registro cada request pagaría un round trip fallido antes del fallback.
+
+Estados del circuito (por función):
+- cerrado: la RPC se llama normalmente.
+- abierto: se va directo al fallback hasta que pase el enfriamiento.
+- semiabierto: pasado el enfriamiento, un solo request vuelve a probar la RPC;
+  si responde se cierra el circuito, si falla se abre otra vez.
+
+Una función inexistente (PGRST202 / 404) abre el circuito al primer fallo; las
+fallas del servidor (timeouts, conexión, errores 5xx) lo abren tras
+RPC_UMBRAL_FALLOS fallos seguidos. Los errores causados por los datos del request
+(22P02, 23505, ...) no cuentan como fallo: se propagan al endpoint.
+
+Las RPC de escritura (escritura=True) solo usan el fallback si la función no
+existe. Ante una falla ambigua (timeout, 5xx) la función pudo haber hecho commit,
+y repetir la escritura por pasos duplicaría datos: se responde 503.
+"""
+import os
+import time
+from typing import Any, Dict, Optional
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+from src.utils.supabase_async import supabase_async
+
+ENFRIAMIENTO_SEGUNDOS = float(os.getenv("RPC_ENFRIAMIENTO_SEGUNDOS", "300"))
+UMBRAL_FALLOS = int(os.getenv("RPC_UMBRAL_FALLOS", "3"))
+
+# Códigos de PostgREST que indican que la función no existe
+CODIGOS_FUNCION_INEXISTENTE = {"PGRST202", "42883", "404"}
+
+# Para escrituras solo cuentan los códigos que garantizan que la función no corrió
+CODIGOS_FUNCION_INEXISTENTE_ESCRITURA = {"PGRST202", "42883"}
+
+# Clases SQLSTATE de fallas del servidor (conexión, recursos, timeouts, internas)
+CLASES_FALLA_SERVIDOR = ("08", "53", "54", "57", "58", "XX")
+
+
+class CircuitoRPC:
+    """Disponibilidad registrada de una función RPC."""
+
+    def __init__(self, funcion: str):
+        self.funcion = funcion
+        self.estado = "cerrado"
+        self.fallos_consecutivos = 0
+        self.abierto_hasta = 0.0
+        self.ultimo_error: Optional[str] = None
+        self.ultimo_fallo: Optional[float] = None
+        self.ultimo_exito: Optional[float] = None
+        self.llamadas = 0
+        self.omitidas = 0
+
+    def permite_llamada(self) -> bool:
+        """Indica si este request debe intentar la RPC."""
+        if self.estado == "cerrado":
+            return True
+        if self.estado == "abierto" and time.monotonic() >= self.abierto_hasta:
+            # Solo el primer request después del enfriamiento re-prueba la función
+            self.estado = "semiabierto"
+            return True
+        if self.estado == "semiabierto" and time.monotonic() >= self.abierto_hasta + ENFRIAMIENTO_SEGUNDOS:
+            # La prueba anterior nunca terminó (request cancelado): se permite otra
+            self.abierto_hasta = time.monotonic()
+            return True
+        return False
+
+    def registrar_exito(self) -> None:
+        self.estado = "cerrado"
+        self.fallos_consecutivos = 0
+        self.ultimo_exito = time.time()
+
+    def registrar_fallo(self, error: Exception, inexistente: bool) -> None:
+        self.fallos_consecutivos += 1
+        self.ultimo_error = str(error)
+        self.ultimo_fallo = time.time()
+
+        if inexistente or self.estado == "semiabierto" or self.fallos_consecutivos >= UMBRAL_FALLOS:
+            self.estado = "abierto"
+            self.abierto_hasta = time.monotonic() + ENFRIAMIENTO_SEGUNDOS
+
+    def resumen(self) -> Dict[str, Any]:
+        reintento = None
+        if self.estado == "abierto":
+            reintento = max(0.0, round(self.abierto_hasta - time.monotonic(), 1))
+        return {
+            "funcion": self.funcion,
+            "estado": self.estado,
+            "fallos_consecutivos": self.fallos_consecutivos,
+            "segundos_para_reintento": reintento,
+            "ultimo_error": self.ultimo_error,
+            "ultimo_fallo": self.ultimo_fallo,
+            "ultimo_exito": self.ultimo_exito,
+            "llamadas": self.llamadas,
+            "omitidas": self.omitidas,
+        }
+
+
+def _es_funcion_inexistente(error: Exception, escritura: bool = False) -> bool:
+    if isinstance(error, APIError):
+        codigos = CODIGOS_FUNCION_INEXISTENTE_ESCRITURA if escritura else CODIGOS_FUNCION_INEXISTENTE
+        return str(error.code) in codigos
+    return False
+
+
+def _es_falla_servidor(error: Exception) -> bool:
+    """Timeouts, errores de conexión y 5xx (no los errores de los datos del request)."""
+    if not isinstance(error, APIError):
+        return True
+    if isinstance(error.code, int):
+        # Respuesta sin JSON de PostgREST: el código es el status HTTP
+        return error.code >= 500
+    codigo = str(error.code)
+    return codigo.startswith("PGRST0") or codigo.startswith(CLASES_FALLA_SERVIDOR)
+
+
+class RPCGateway:
+    """Punto único para llamar RPCs con fallback."""
+
+    def __init__(self):
+        self._circuitos: Dict[str, CircuitoRPC] = {}
+
+    def _circuito(self, funcion: str) -> CircuitoRPC:
+        if funcion not in self._circuitos:
+            self._circuitos[funcion] = CircuitoRPC(funcion)
+        return self._circuitos[funcion]
+
+    async def llamar(self, funcion: str, params: Dict[str, Any], escritura: bool = False):
+        """
+        Ejecuta la RPC y retorna su respuesta, o None si hay que usar el fallback
+        (circuito abierto, función inexistente o, en lecturas, falla del servidor).
+        Los errores de los datos se propagan (clase 22 como 400).
+        """
+        circuito = self._circuito(funcion)
+        if not circuito.permite_llamada():
+            circuito.omitidas += 1
+            return None
+
+        circuito.llamadas += 1
+        try:
+            resultado = await supabase_async.rpc(funcion, params).execute()
+        except Exception as e:
+            inexistente = _es_funcion_inexistente(e, escritura)
+            if not inexistente and not _es_falla_servidor(e):
+                # La función respondió: el error es de los datos del request
+                circuito.registrar_exito()
+                if isinstance(e, APIError) and str(e.code).startswith("22"):
+                    raise HTTPException(status_code=400, detail=e.message or str(e))
+                raise
+
+            circuito.registrar_fallo(e, inexistente)
+            if escritura and not inexistente:
+                print(f"❌ RPC {funcion} falló sin confirmar la escritura ({circuito.estado}): {str(e)}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="No se pudo confirmar si la operación se guardó. Revise antes de reintentar."
+                )
+            print(f"⚠️ RPC {funcion} no disponible ({circuito.estado}), usando fallback: {str(e)}")
+            return None
+
+        circuito.registrar_exito()
+        return resultado
+
+    def estado(self) -> Dict[str, Any]:
+        """Estado de todos los circuitos, para monitoreo."""
+        return {
+            "enfriamiento_segundos": ENFRIAMIENTO_SEGUNDOS,
+            "umbral_fallos": UMBRAL_FALLOS,
+            "funciones": [c.resumen() for c in self._circuitos.values()],
+        }
+
+    def reiniciar(self, funcion: Optional[str] = None) -> None:
+        """Cierra el circuito de una función (o de todas) para forzar un reintento."""
+        if funcion is None:
+            self._circuitos.clear()
+        else:
+            self._circuitos.pop(funcion, None)
+
+
+rpc_gateway = RPCGateway()
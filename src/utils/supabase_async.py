@@ -0,0 +1,45 @@
+import os
+import httpx
+from dotenv import load_dotenv
+from postgrest import AsyncPostgrestClient
+
+load_dotenv()
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+# Pool de conexiones keep-alive compartido por todos los routers del worker.
+# Cada request reutiliza una conexión abierta hacia PostgREST en vez de
+# negociar TCP/TLS de nuevo, y nunca bloquea el event loop de uvicorn.
+POOL_MAX_CONEXIONES = int(os.getenv("SUPABASE_POOL_MAX_CONEXIONES", "50"))
+POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_SEGUNDOS = float(os.getenv("SUPABASE_POOL_KEEPALIVE_SEGUNDOS", "30"))
+TIMEOUT_SEGUNDOS = float(os.getenv("SUPABASE_TIMEOUT_SEGUNDOS", "30"))
+
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=POOL_MAX_CONEXIONES,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_SEGUNDOS,
+    ),
+    timeout=httpx.Timeout(TIMEOUT_SEGUNDOS, connect=5.0),
+    follow_redirects=True,
+    http2=True,
+)
+
+# Mismo builder que supabase_client: .table().select().eq().execute(),
+# pero execute() es una corrutina y se usa con await.
+supabase_async: AsyncPostgrestClient = AsyncPostgrestClient(
+    f"{SUPABASE_URL}/rest/v1",
+    headers={
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "apikey": SUPABASE_KEY or "",
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+    },
+    http_client=_http_client,
+)
+
+
+async def cerrar_supabase_async() -> None:
+    """Cierra las conexiones del pool al apagar la aplicación."""
+    await supabase_async.aclose()